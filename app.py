@@ -1,38 +1,121 @@
 import json
-import joblib
+import math
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
 # import folium # Mantido para mapa inicial, embora o mapa JS seja o principal
-import src.recommender_engine as recommender
-
+import numpy as np
 import pandas as pd
+import src.recommender_engine as recommender
+from src import metrics, response_encoding
+from src.cache import RecommendationCache
+from src.data_context import context
+from src.distance import distances_km
+from src.execution import ComputePool
+from src.geolocation import Geolocator, OfflineResolver, RemoteResolver
+from src.ingestion import ingest
+from src.topk_tables import current_tables, resolve_ra
 
-from geopy.geocoders import Nominatim
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify
 
 app = Flask(__name__)
 
-# Carregar recursos essenciais para a aplicação
-try:
-    resources = joblib.load('./data/model/full_resources.pkl') # Dicionário com listas de produtos e produtores formatados
-    df_full_reviews = pd.read_parquet('./data/datasets/df_full_reviews.parquet') # DataFrame com todas as avaliações
-    
-    # Disponibiliza df_full_reviews para o módulo recommender, se ainda não estiver carregado lá
-    if recommender.df_full_reviews is None or recommender.df_full_reviews.empty:
-        recommender.df_full_reviews = df_full_reviews
-    # Disponibiliza resources para o módulo recommender, se ainda não estiver carregado lá
-    if recommender.resources is None:
-        recommender.resources = resources
-except FileNotFoundError:
-    print("Erro ao carregar recursos. Verifique os caminhos dos arquivos: ./data/model/full_resources.pkl ou ./data/datasets/df_full_reviews.parquet")
-    resources = {'products_list': [], 'producers_formatted': []} 
-    df_full_reviews = pd.DataFrame()
-    if recommender.df_full_reviews is None: recommender.df_full_reviews = pd.DataFrame()
-    if recommender.resources is None: recommender.resources = {}
-except Exception as e:
-    print(f"Erro ao carregar recursos: {e}")
-    resources = {'products_list': [], 'producers_formatted': []}
-    df_full_reviews = pd.DataFrame()
-    if recommender.df_full_reviews is None: recommender.df_full_reviews = pd.DataFrame()
-    if recommender.resources is None: recommender.resources = {}
+# Limite de itens por página de recomendações ('top_n' enviado pelo frontend)
+MAX_TOP_N = 500
+
+# Configuração do cache de resultados de '/recommend'
+RECOMMENDATION_CACHE_MAX_ENTRIES = 4096 # Limite de entradas (remoção LRU)
+RECOMMENDATION_CACHE_TTL_SECONDS = 600  # Tempo de vida de cada entrada
+RECOMMENDATION_CACHE_GRID_DEG = 0.01    # Tamanho da célula de arredondamento da localização (~1,1 km)
+
+recommendation_cache = RecommendationCache(
+    max_entries=RECOMMENDATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=RECOMMENDATION_CACHE_TTL_SECONDS,
+    grid_size_deg=RECOMMENDATION_CACHE_GRID_DEG
+)
+# O cache é invalidado sempre que o motor recebe um novo dataset de reviews
+recommender.reload_listeners.append(recommendation_cache.clear)
+
+# Cálculos do motor (consultas fora do cache) executados em um conjunto limitado de threads (src.execution):
+# requisições idênticas simultâneas (mesma chave do cache) compartilham um único cálculo e, com a fila cheia,
+# recebem 429 com Retry-After. A thread da requisição espera o resultado do mesmo modo (run_computation).
+# Com COMPUTE_POOL_ENABLED = False o cálculo roda na thread da requisição
+COMPUTE_POOL_ENABLED = True
+COMPUTE_TIMEOUT_SECONDS = 30 # Espera máxima pelo resultado; ao esgotar, a requisição recebe 503 com Retry-After
+
+compute_pool = ComputePool()
+# Cálculos em andamento com os dados antigos deixam de ser compartilhados com novas requisições
+recommender.reload_listeners.append(compute_pool.forget)
+
+# Instrumentação (src.metrics): latência das rotas e das etapas do motor, exposta em '/metrics'.
+# Perfil opcional das requisições lentas: pilhas amostradas gravadas em SLOW_REQUEST_PROFILE_DIR
+SLOW_REQUEST_PROFILE_MS = None # Duração mínima (ms) de uma requisição para gravar seu perfil; None desativa
+SLOW_REQUEST_PROFILE_DIR = './data/profiles'
+
+slow_request_profiler = None
+# Os contadores do cache de resultados são lidos a cada coleta de '/metrics'
+metrics.register_cache('results', recommendation_cache)
+
+# Geolocalização por IP ('/get_location'): tabela offline de faixas de IP -> RA, respondida da memória.
+# Um serviço HTTP de GeoIP opcional (URL com '{ip}') é consultado apenas em segundo plano (src.geolocation)
+REMOTE_GEOLOCATION_URL = None # Ex.: 'http://ip-api.com/json/{ip}'
+
+geolocator = Geolocator(
+    [OfflineResolver(lambda: context.ip_ranges, lambda: context.locations)],
+    remote=RemoteResolver(REMOTE_GEOLOCATION_URL) if REMOTE_GEOLOCATION_URL else None,
+)
+# As localizações em cache são descartadas quando o contexto de dados é recarregado
+context.reload_listeners.append(geolocator.cache.clear)
+metrics.register_cache('geolocation', geolocator.cache)
+
+# Respostas de '/recommend' e '/recommend/batch' codificadas direto das colunas do resultado (src.response_encoding).
+# O campo 'format' do payload escolhe 'records' (lista de objetos, padrão) ou 'columnar' (um array por coluna);
+# com 'Accept: application/x-ndjson' a resposta é enviada em blocos de NDJSON. Corpos grandes e fluxos são
+# comprimidos com gzip quando o cliente envia 'Accept-Encoding: gzip'
+DEFAULT_RESPONSE_FORMAT = 'records'
+
+# Consultas que se resolvem para uma RA são respondidas pelas tabelas de top-k materializadas
+# (geradas offline com 'python -m src.topk_tables build'), quando existirem e estiverem atualizadas
+TOPK_TABLES_ENABLED = True
+
+# Os recursos (listas de produtos, produtores, dataset de reviews) vêm do contexto de dados compartilhado
+# com o motor de recomendação: cada arquivo é carregado uma única vez e somente quando uma rota precisa dele.
+
+
+# Função para ativar o perfil das requisições lentas (ex.: serve.py --profile-slow-ms)
+def enable_slow_request_profile(threshold_ms, output_dir=SLOW_REQUEST_PROFILE_DIR):
+    global slow_request_profiler
+    slow_request_profiler = metrics.SlowRequestProfiler(threshold_ms, output_dir) if threshold_ms is not None else None
+
+
+# Início de cada requisição: cronômetro e, se ativo, amostragem das pilhas
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if slow_request_profiler is not None:
+        g.profile_started = slow_request_profiler.begin()
+
+
+# Guarda o status da resposta para a métrica da requisição
+@app.after_request
+def keep_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+# Fim de cada requisição (inclusive com exceção não tratada): registra a duração e o perfil, se lenta
+@app.teardown_request
+def record_request_metrics(error=None):
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    # A regra da rota (e não o caminho) mantém o número de séries limitado
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.record_request(route, request.method, g.pop('response_status', 500), time.perf_counter() - started)
+    profile_started = g.pop('profile_started', None)
+    if profile_started is not None and slow_request_profiler is not None:
+        path = slow_request_profiler.end(route, profile_started)
+        if path:
+            print(f"Requisição lenta em {route}: perfil gravado em {path}")
 
 
 # Rota principal da aplicação
@@ -46,19 +129,24 @@ def index():
     # )
 
     producers_ra_data = {} # Dicionário para armazenar dados de produtores por Região Administrativa
+    products_list = []
     try:
-        # Carrega dados JSON que associam produtores às suas Regiões Administrativas
-        with open('./data/json/producers_ra.json', 'r') as f: 
-            producers_ra_data = json.load(f) 
+        # Dados JSON que associam produtores às suas Regiões Administrativas
+        producers_ra_data = context.producers_ra
     except FileNotFoundError:
         print("Arquivo './data/json/producers_ra.json' não encontrado.")
     except json.JSONDecodeError:
         print("Erro ao decodificar o JSON em './data/json/producers_ra.json'.")
+    try:
+        # Lista de produtos do formulário (não exige desserializar o pickle de recursos)
+        products_list = context.products_list
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"Erro ao carregar a lista de produtos: {e}")
 
     # Renderiza o template principal, passando listas de produtos, produtores e o JSON de produtores/RAs
     return render_template('index.html',
                            initial_map="", # Placeholder para o mapa, já que o Leaflet.js cuidará disso
-                           products_list=resources.get('products_list', []), 
+                           products_list=products_list, 
                            producers_list=list(producers_ra_data.keys()), 
                            producers_ra_json=json.dumps(producers_ra_data) 
                            )
@@ -67,102 +155,325 @@ def index():
 # Rota para obter a localização do usuário via IP (fallback caso a geolocalização do navegador falhe)
 @app.route('/get_location')
 def get_location():
-    geolocator = Nominatim(user_agent="geoapi_local_products_v2") # Serviço de geocodificação
+    # Resposta sempre a partir da memória: tabela offline e cache por prefixo; IPs locais, inválidos ou
+    # não encontrados recebem a localização padrão (Brasília)
+    ip_address = request.headers.get('X-Forwarded-For', request.remote_addr) # Obtém o IP do usuário
+    return jsonify(geolocator.locate(ip_address))
+
+
+# Rota com os contadores da geolocalização por IP (cache, consultas remotas e disjuntor)
+@app.route('/get_location/stats')
+def get_location_stats():
+    return jsonify(geolocator.stats())
+
+
+# Função para converter o payload de uma recomendação no formato de consulta do motor
+def parse_recommendation_payload(data):
+    """
+    Lê tipo, filtros, localização e preferência por orgânicos de um payload de '/recommend'.
+    Retorna (consulta, mensagem_de_erro); a consulta segue o formato de recommender.recommend_batch.
+    Payloads que não são objetos ou com valores não numéricos nos campos numéricos recebem uma mensagem de erro.
+    """
+    if not isinstance(data, dict):
+        return None, 'A consulta deve ser um objeto JSON.'
     try:
-        ip_address = request.headers.get('X-Forwarded-For', request.remote_addr) # Obtém o IP do usuário
-        # Se for um IP local ou inválido, retorna a localização padrão (Brasília)
-        if ip_address == '127.0.0.1' or not ip_address: 
-            print("IP Local/Inválido detectado, usando Brasília como fallback para geocodificação por IP.")
-            return jsonify({'latitude': -15.7942, 'longitude': -47.8822, 'message': 'IP Local, fallback para Brasília'})
-
-        location = geolocator.geocode(ip_address) # Tenta obter a localização a partir do IP
-        if location:
-            return jsonify({
-                'latitude': location.latitude,
-                'longitude': location.longitude
-            })
-    except Exception as e:
-        print(f"Erro em get_location: {e}")
-    # Fallback final para Brasília em caso de erro
-    return jsonify({'latitude': -15.7942, 'longitude': -47.8822, 'message': 'Fallback Brasília'})
+        return read_recommendation_payload(data)
+    except (TypeError, ValueError) as e:
+        return None, f'Valor inválido na consulta: {e}'
+
+
+# Função para converter um número do payload, rejeitando NaN e infinito
+def finite_float(value):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f'número não finito: {value!r}')
+    return number
+
+
+# Função para ler os campos de um payload (converte os números; TypeError/ValueError se inválidos)
+def read_recommendation_payload(data):
+    rec_type = data.get('type') # Tipo de recomendação solicitada
+
+    # Obtém dados de geolocalização e preferência por orgânicos do request
+    latitude = finite_float(data.get('latitude', -15.7942)) # Padrão para Brasília
+    longitude = finite_float(data.get('longitude', -47.8822)) # Padrão para Brasília
+    organic_preference = int(data.get('organic', 0)) # 0 para "Não", 1 para "Sim"
+
+    selected_locations = data.get('locations', [])
+    location_filter = selected_locations[0] if selected_locations else None
+
+    # Filtros de cada tipo de recomendação ('products', 'producers', 'producer-products', 'similar-*', 'basket')
+    if rec_type == 'products':
+        filters = {
+            'desired_products': data.get('products', []),
+            'producer': data.get('producer'),
+            'location': location_filter,
+        }
+    elif rec_type == "producers":
+        # Raio máximo opcional (em km) para limitar a busca aos produtores próximos
+        max_distance_km = data.get('max_distance_km')
+        filters = {
+            'product_of_interest': data.get('single_product', ''),
+            'max_distance_km': finite_float(max_distance_km) if max_distance_km not in (None, '') else None,
+        }
+        # A preferência por orgânicos é repassada, embora o motor possa não usá-la diretamente para este tipo
+    elif rec_type == "producer-products":
+        producer_name = data.get('producer')
+        if not producer_name:
+            return None, 'Produtor não especificado para "Melhores Produtos do Produtor".'
+        filters = {
+            'producer_name': producer_name,
+            'local_filter': location_filter,
+            'unwanted_products': data.get('unwanted_products', []),
+        }
+    elif rec_type == "similar-producers":
+        producer_name = data.get('producer')
+        if not producer_name:
+            return None, 'Produtor não especificado para "Produtores Parecidos".'
+        filters = {'producer': producer_name}
+    elif rec_type == "similar-products":
+        product = data.get('single_product') or data.get('product')
+        if not product:
+            return None, 'Produto não especificado para "Produtos Avaliados em Conjunto".'
+        filters = {'product': product}
+    elif rec_type == "basket":
+        products = data.get('products', [])
+        if not products:
+            return None, 'Nenhum produto selecionado para a "Cesta de Compras".'
+        # Limite opcional de paradas (produtores visitados)
+        max_stops = data.get('max_stops')
+        filters = {
+            'desired_products': products,
+            'max_stops': max(1, int(max_stops)) if max_stops not in (None, '') else None,
+        }
+    else:
+        return None, 'Tipo de recomendação inválido'
+
+    # Formato da resposta ('records' ou 'columnar')
+    response_format = data.get('format') or DEFAULT_RESPONSE_FORMAT
+    if response_format not in response_encoding.RESPONSE_FORMATS:
+        return None, f"Formato de resposta inválido: use {' ou '.join(response_encoding.RESPONSE_FORMATS)}."
+
+    # Usuário identificado (opcional): o ranking passa a incluir a afinidade prevista pela filtragem colaborativa
+    user_id = data.get('user_id')
+    if user_id not in (None, '') and rec_type in ('products', 'producers', 'producer-products'):
+        filters['user_id'] = str(user_id)
+
+    # Quantidade opcional de resultados (paginação); o motor usa 5 por padrão.
+    # A cesta retorna todos os produtos cobertos, sem paginação
+    top_n = data.get('top_n')
+    if top_n not in (None, '') and rec_type != 'basket':
+        filters['top_n'] = max(1, min(int(top_n), MAX_TOP_N))
+
+    query = {
+        'type': rec_type,
+        'filters': filters,
+        'latitude': latitude,
+        'longitude': longitude,
+        'organic': organic_preference,
+        'ra': data.get('ra') or None, # RA do usuário, se conhecida (a posição passa a ser o centroide)
+        'format': response_format,
+    }
+    return query, None
+
+
+# Função para obter a chave do cache de uma consulta
+def recommendation_cache_key(query):
+    """
+    Retorna a chave da consulta: tipo, filtros normalizados, localização arredondada para a grade do cache
+    e orgânico. Só a chave é arredondada: a consulta mantém as coordenadas reais, usadas no cálculo.
+    Consultas resolvidas para uma RA já trazem o centroide exato, como nas tabelas materializadas.
+    """
+    latitude, longitude = query['latitude'], query['longitude']
+    if query.get('ra') is None:
+        latitude, longitude = recommendation_cache.quantize(latitude, longitude)
+    return recommendation_cache.make_key(
+        query['type'], recommender.filters_key(query['type'], query['filters']), latitude, longitude, query['organic']
+    )
+
+
+# Função para ajustar um resultado do cache (ou de um cálculo compartilhado) à posição de quem pede
+def localized_result(result, query):
+    """
+    Um resultado da mesma célula da grade pode ter sido calculado a partir de outra posição: a 'distancia_km'
+    das linhas retornadas é recalculada a partir das coordenadas reais da consulta (o ranking é o da célula).
+    Retorna 'result' sem cópia se ele não tiver as colunas de distância e coordenadas.
+    """
+    if result.empty or not {'distancia_km', 'latitude', 'longitude'} <= set(result.columns):
+        return result
+    distances = distances_km(query['latitude'], query['longitude'],
+                             result['latitude'].to_numpy(dtype=float), result['longitude'].to_numpy(dtype=float))
+    result = result.copy()
+    result['distancia_km'] = np.round(distances, 2)
+    return result
+
+
+# Função para responder uma consulta pelas tabelas de top-k materializadas
+def materialized_result(query):
+    """
+    Se a consulta se resolve para uma RA (campo 'ra' ou posição igual ao centroide), passa a usar o centroide
+    como localização e retorna as linhas da tabela materializada; retorna None se não houver RA,
+    tabela atualizada ou chave correspondente (a consulta segue para o cache e o motor).
+    """
+    if not TOPK_TABLES_ENABLED:
+        query['ra'] = None
+        return None
+    resolved = resolve_ra(query['latitude'], query['longitude'], query.get('ra'))
+    if resolved is None:
+        query['ra'] = None
+        return None
+    ra, query['latitude'], query['longitude'] = resolved
+    query['ra'] = ra
+    tables = current_tables()
+    if tables is None:
+        return None
+    result = tables.lookup(query['type'], query['filters'], ra, query['organic'], query['filters'].get('top_n'))
+    metrics.record_lookup('topk_tables', result is not None)
+    return result
+
+
+# Função para normalizar o resultado do motor antes de guardá-lo no cache
+def result_frame(result):
+    """Retorna o DataFrame de resultado (um DataFrame vazio se não houver resultado)."""
+    return pd.DataFrame() if result is None else result
+
+
+# Função para calcular uma recomendação no motor e guardá-la no cache (executada no conjunto de trabalho)
+def compute_recommendation(query, cache_key):
+    # Se o cache for invalidado durante o cálculo (ex.: reviews ingeridas), o resultado antigo não é guardado
+    generation = recommendation_cache.generation
+    result = recommender.recommend(
+        query['type'], query['filters'], query['latitude'], query['longitude'], query['organic']
+    )
+    # Se nenhum resultado for encontrado, a lista vazia é tratada pelo frontend
+    # (o motor já inclui latitude e longitude para plotagem no mapa)
+    result = result_frame(result)
+    recommendation_cache.put(cache_key, result, generation)
+    return result
+
+
+# Função para calcular um lote de recomendações no motor e guardá-las no cache
+def compute_batch(queries, cache_keys):
+    generation = recommendation_cache.generation
+    results = [result_frame(result) for result in recommender.recommend_batch(queries)]
+    for cache_key, result in zip(cache_keys, results):
+        recommendation_cache.put(cache_key, result, generation)
+    return results
+
+
+# Função para montar a resposta de servidor ocupado, com o tempo sugerido para uma nova tentativa
+def busy_response(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(compute_pool.retry_after())
+    return response
+
+
+# Função para executar um cálculo do motor pelo conjunto de trabalho
+def run_computation(key, function, *args):
+    """
+    Retorna (resultado, resposta_de_erro). Pedidos com a mesma chave em andamento compartilham o cálculo
+    (key=None não agrupa). A resposta de erro é 429 com a fila cheia ou 503 se o resultado não ficar pronto
+    em COMPUTE_TIMEOUT_SECONDS, ambas com Retry-After.
+    """
+    if not COMPUTE_POOL_ENABLED:
+        return function(*args), None
+    future = compute_pool.submit(key, function, *args)
+    if future is None:
+        return None, busy_response(429, 'Servidor ocupado: muitas recomendações em cálculo. Tente novamente em instantes.')
+    if slow_request_profiler is not None:
+        # O perfil da requisição passa a amostrar a thread de trabalho que executa o cálculo
+        slow_request_profiler.delegate(future)
+    try:
+        return future.result(timeout=COMPUTE_TIMEOUT_SECONDS), None
+    except FutureTimeout:
+        return None, busy_response(503, 'A recomendação demorou demais para ser calculada. Tente novamente em instantes.')
+
+
+# Função para verificar se o cliente pediu NDJSON explicitamente (o '*/*' dos navegadores não conta)
+def accepts_ndjson():
+    return any(mimetype == response_encoding.NDJSON_MIMETYPE and quality > 0
+               for mimetype, quality in request.accept_mimetypes)
+
+
+# Função para montar a resposta de um corpo JSON já codificado
+def json_response(text, status=200):
+    """Comprime o corpo com gzip se o cliente aceitar e o corpo tiver ao menos GZIP_MIN_BYTES."""
+    body = text.encode()
+    response = Response(body, status=status, mimetype=response_encoding.JSON_MIMETYPE)
+    response.vary.add('Accept-Encoding')
+    if len(body) >= response_encoding.GZIP_MIN_BYTES and request.accept_encodings['gzip']:
+        response.set_data(response_encoding.gzip_body(body))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# Função para montar a resposta NDJSON enviada em blocos à medida que as linhas são codificadas
+def ndjson_response(lines):
+    chunks = response_encoding.ndjson_chunks(lines)
+    headers = {'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip']:
+        chunks = response_encoding.gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(chunks, mimetype=response_encoding.NDJSON_MIMETYPE, headers=headers)
+
+
+# Função para montar a resposta de uma recomendação no formato negociado
+def recommendation_response(result, response_format):
+    """NDJSON (um objeto por linha) se o cliente pedir; senão JSON no formato do campo 'format'."""
+    if accepts_ndjson():
+        return ndjson_response(response_encoding.encode_rows(result))
+    return json_response(response_encoding.encode_frame(result, response_format))
+
+
+# Função para codificar a resposta de uma consulta do lote (DataFrame de resultado ou mensagem de erro)
+def batch_item(response, response_format, index=None):
+    prefix = '' if index is None else f'"index":{index},'
+    if isinstance(response, str):
+        return f'{{{prefix}"error":{response_encoding.encode_value(response)}}}'
+    return f'{{{prefix}"results":{response_encoding.encode_frame(response, response_format)}}}'
+
+
+# Função para garantir que o motor de recomendação tenha acesso aos dados necessários
+def ensure_recommender_data():
+    """Carrega o dataset de reviews no motor na primeira chamada. Retorna False se não houver reviews."""
+    # Verifica se o dataset de reviews está carregado; essencial para as recomendações
+    return recommender.ensure_data()
+
 
 # Rota para processar os pedidos de recomendação
 @app.route('/recommend', methods=['POST'])
 def handle_recommendation():
     data = request.json # Obtém os dados enviados pelo frontend
-    rec_type = data.get('type') # Tipo de recomendação solicitada
-    result = pd.DataFrame()
 
-    # Garante que o motor de recomendação tenha acesso aos dados necessários
-    if (recommender.df_full_reviews is None or recommender.df_full_reviews.empty) and \
-       (not df_full_reviews.empty):
-        recommender.df_full_reviews = df_full_reviews
-    if (recommender.resources is None) and resources:
-        recommender.resources = resources
-
-    # Verifica se o dataset de reviews está carregado; essencial para as recomendações
-    if recommender.df_full_reviews is None or recommender.df_full_reviews.empty:
+    if not ensure_recommender_data():
         return jsonify({'error': 'Dataset de reviews não carregado no servidor.'}), 500
 
     try:
-        # Obtém dados de geolocalização e preferência por orgânicos do request
-        latitude = float(data.get('latitude', -15.7942)) # Padrão para Brasília
-        longitude = float(data.get('longitude', -47.8822)) # Padrão para Brasília
-        organic_preference = int(data.get('organic', 0)) # 0 para "Não", 1 para "Sim"
-
-        # Lógica de recomendação baseada no tipo ('products', 'producers', 'producer-products')
-        if rec_type == 'products':
-            selected_locations = data.get('locations', [])
-            location_filter = selected_locations[0] if selected_locations else None
-
-            # Chama a função do motor de recomendação para melhores produtos
-            result = recommender.recommend_best_products(
-                desired_products=data.get('products', []),
-                producer=data.get('producer'),
-                location=location_filter, 
-                organic_preference=organic_preference,
-                latitude=latitude,
-                longitude=longitude
-            )
-        elif rec_type == "producers":
-            # Chama a função do motor de recomendação para melhores produtores
-            result = recommender.recommend_best_productors(
-                product_of_interest=data.get('single_product', ''),
-                latitude=latitude,
-                longitude=longitude,
-                organic_preference=organic_preference # Passa a preferência, embora o motor possa não usá-la diretamente para este tipo
-            )
-        elif rec_type == "producer-products":
-            selected_locations = data.get('locations', [])
-            local_filter = selected_locations[0] if selected_locations else None
-            producer_name = data.get('producer')
-
-            if not producer_name:
-                 return jsonify({'error': 'Produtor não especificado para "Melhores Produtos do Produtor".'}), 400
-            
-            # Chama a função do motor de recomendação para melhores produtos de um produtor específico
-            result = recommender.recommend_best_product_productors(
-                producer_name=producer_name, 
-                local_filter=local_filter, 
-                organic_preference=organic_preference,
-                latitude=latitude,
-                longitude=longitude,
-                unwanted_products=data.get('unwanted_products', []) 
-            )
-        else:
-            return jsonify({'error': 'Tipo de recomendação inválido'}), 400
-
-        # Se nenhum resultado for encontrado, retorna uma lista vazia para o frontend tratar
-        if result is None or result.empty: 
-            return jsonify([]) 
-        
-        # Garante que as colunas de latitude e longitude estejam nos resultados para plotagem no mapa.
-        # O motor de recomendação já deve incluir essas colunas.
-        if 'latitude' not in result.columns or 'longitude' not in result.columns:
-            pass
-
-        # Retorna os resultados da recomendação em formato JSON
-        return jsonify(result.to_dict(orient='records'))
+        query, error = parse_recommendation_payload(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Consultas de uma RA com filtros do formulário: busca direta na tabela materializada
+        result = materialized_result(query)
+        if result is None:
+            # Consultas repetidas (mesmos filtros, mesma célula da grade) são respondidas pelo cache
+            cache_key = recommendation_cache_key(query)
+            result = recommendation_cache.get(cache_key)
+        if result is None:
+            # Chama a função do motor de recomendação correspondente ao tipo, no conjunto de trabalho
+            # (a etapa 'compute' inclui a espera na fila ou pelo cálculo compartilhado)
+            with metrics.pipeline(query['type']), metrics.stage('compute'):
+                result, busy = run_computation(cache_key, compute_recommendation, query, cache_key)
+            if busy is not None:
+                return busy
+        if query['ra'] is None:
+            # Resultados da célula da grade (cache ou cálculo compartilhado): distâncias a partir desta posição
+            result = localized_result(result, query)
+
+        # Retorna os resultados da recomendação em formato JSON (ou NDJSON)
+        with metrics.pipeline(query['type']), metrics.stage('serialize'):
+            return recommendation_response(result, query['format'])
 
     except Exception as e:
         # Tratamento de exceções durante o processo de recomendação
@@ -172,5 +483,108 @@ def handle_recommendation():
         return jsonify({'error': f'Ocorreu um erro no servidor: {str(e)}'}), 500
 
 
+# Rota para processar várias recomendações em uma única chamada (ex.: pontos de retirada pré-calculados)
+@app.route('/recommend/batch', methods=['POST'])
+def handle_batch_recommendation():
+    data = request.json # Lista de payloads no mesmo formato de '/recommend', ou {'queries': [...]}
+    payloads = data.get('queries', []) if isinstance(data, dict) else data
+
+    if not ensure_recommender_data():
+        return jsonify({'error': 'Dataset de reviews não carregado no servidor.'}), 500
+    if not isinstance(payloads, list):
+        return jsonify({'error': 'Envie uma lista de consultas.'}), 400
+
+    try:
+        # Valida cada consulta; as inválidas recebem uma mensagem de erro própria
+        # e as já presentes no cache são respondidas diretamente
+        # (cada resposta é o DataFrame de resultado ou a mensagem de erro da consulta)
+        responses = [None] * len(payloads)
+        formats = [DEFAULT_RESPONSE_FORMAT] * len(payloads)
+        queries, positions, cache_keys = [], [], []
+        for position, payload in enumerate(payloads):
+            query, error = parse_recommendation_payload(payload)
+            if error:
+                responses[position] = error
+                continue
+            formats[position] = query['format']
+            result = materialized_result(query)
+            if result is not None:
+                responses[position] = result
+                continue
+            cache_key = recommendation_cache_key(query)
+            result = recommendation_cache.get(cache_key)
+            if result is not None:
+                responses[position] = localized_result(result, query) if query['ra'] is None else result
+            else:
+                queries.append(query)
+                positions.append(position)
+                cache_keys.append(cache_key)
+
+        # Consultas com os mesmos filtros compartilham candidatos e a matriz de distâncias;
+        # o lote inteiro é um único cálculo no conjunto de trabalho
+        if queries:
+            results, busy = run_computation(None, compute_batch, queries, cache_keys)
+            if busy is not None:
+                return busy
+            for position, result in zip(positions, results):
+                responses[position] = result
+
+        # Com NDJSON, cada consulta vira uma linha ({"index": i, "results" | "error": ...}) codificada sob demanda
+        if accepts_ndjson():
+            return ndjson_response(batch_item(response, response_format, index)
+                                   for index, (response, response_format) in enumerate(zip(responses, formats)))
+        with metrics.stage('serialize'):
+            return json_response('[' + ','.join(map(batch_item, responses, formats)) + ']')
+
+    except Exception as e:
+        print(f"Erro durante a recomendação em lote: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Ocorreu um erro no servidor: {str(e)}'}), 500
+
+
+# Rota para ingerir novas reviews (somadas às médias sem reconstruir o dataset)
+@app.route('/reviews', methods=['POST'])
+def handle_reviews():
+    data = request.json # Lista de reviews no formato de 'reviews.csv', ou {'reviews': [...]}
+    reviews = data.get('reviews', []) if isinstance(data, dict) else data
+
+    if not ensure_recommender_data():
+        return jsonify({'error': 'Dataset de reviews não carregado no servidor.'}), 500
+    if not isinstance(reviews, list) or not reviews:
+        return jsonify({'error': 'Envie uma lista de reviews.'}), 400
+
+    try:
+        summary = ingest(reviews)
+        if not summary['accepted']:
+            return jsonify({'error': 'Nenhuma review válida: verifique os campos e se a oferta existe no catálogo.', **summary}), 400
+        return jsonify(summary)
+
+    except Exception as e:
+        print(f"Erro durante a ingestão de reviews: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Ocorreu um erro no servidor: {str(e)}'}), 500
+
+
+# Rota com os contadores do cache de recomendações (acertos, falhas, remoções)
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(recommendation_cache.stats())
+
+
+# Rota com a fila e os contadores do conjunto de threads que executa os cálculos do motor
+@app.route('/compute/stats')
+def compute_stats():
+    return jsonify(compute_pool.stats())
+
+
+# Rota com as métricas de latência, candidatos e caches deste processo (formato texto do Prometheus)
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Servidor de desenvolvimento (um processo). Para produção com vários processos, use 'python serve.py'.
 if __name__ == '__main__':
     app.run(debug=True) # Executa a aplicação Flask em modo debug
\ No newline at end of file
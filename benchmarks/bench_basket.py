@@ -0,0 +1,77 @@
+"""
+Benchmark do otimizador de cesta (src.basket): solução gulosa x busca com orçamento de tempo.
+
+Gera instâncias sintéticas com milhares de paradas (produtores em locais espalhados a até 40 km do usuário)
+e listas de 30 a 50 produtos, em que cada parada oferece uma fração dos produtos com qualidades aleatórias, e
+mede, para cada tamanho, o custo da solução gulosa, o custo e o limite inferior da busca, os nós visitados,
+se o ótimo foi provado e o tempo. Também mede a latência do tipo 'basket' no motor com as reviews reais.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_basket
+    python -m benchmarks.bench_basket --stops 1000 5000 --products 30 50 --budget 0.2
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src import basket
+from src import recommender_engine as recommender
+
+# Consulta usada na medição de latência do motor
+QUERY_POSITION = (-15.8, -47.9)
+
+
+# Função para gerar uma instância sintética (custos das ofertas e das paradas)
+def make_instance(n_stops, n_products, offer_density=0.2, seed=0):
+    rng = np.random.default_rng(seed)
+    offer_costs = np.where(rng.random((n_stops, n_products)) < offer_density,
+                           1 - rng.beta(4, 2, (n_stops, n_products)), np.inf)
+    distances = 40 * np.sqrt(rng.random(n_stops))
+    return offer_costs, basket.STOP_COST + basket.DISTANCE_WEIGHT * distances
+
+
+# Função para medir a latência média (ms) de uma cesta no motor
+def query_ms(products, repeats=20):
+    filters = {'desired_products': products}
+    recommender.recommend('basket', filters, *QUERY_POSITION, 0) # Aquecimento
+    start = time.perf_counter()
+    for _ in range(repeats):
+        recommender.recommend('basket', filters, *QUERY_POSITION, 0)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stops', type=int, nargs='+', default=[1_000, 5_000])
+    parser.add_argument('--products', type=int, nargs='+', default=[30, 50])
+    parser.add_argument('--budget', type=float, default=basket.TIME_BUDGET_SECONDS, help='Orçamento da busca (s)')
+    args = parser.parse_args()
+
+    print(f"{'paradas':>8} {'produtos':>9} {'guloso':>8} {'busca':>8} {'limite':>8} {'nós':>7} {'ótimo':>6} "
+          f"{'guloso (ms)':>12} {'busca (ms)':>11}")
+    for n_stops in args.stops:
+        for n_products in args.products:
+            offer_costs, stop_costs = make_instance(n_stops, n_products)
+            start = time.perf_counter()
+            greedy = basket.greedy_basket(offer_costs, stop_costs)
+            greedy_ms = (time.perf_counter() - start) * 1000
+            greedy_cost = basket.solution_cost(greedy, offer_costs, stop_costs, basket.MISSING_PENALTY)[0]
+            start = time.perf_counter()
+            solution = basket.optimize_basket(offer_costs, stop_costs, time_budget=args.budget)
+            search_ms = (time.perf_counter() - start) * 1000
+            print(f"{n_stops:>8} {n_products:>9} {greedy_cost:>8.2f} {solution['cost']:>8.2f} "
+                  f"{solution['lower_bound']:>8.2f} {solution['nodes']:>7} {'sim' if solution['optimal'] else 'não':>6} "
+                  f"{greedy_ms:>12.1f} {search_ms:>11.1f}")
+
+    # Cestas com as reviews reais: alguns produtos e o catálogo inteiro
+    recommender.MEMORY_REPORT_ON_LOAD = False
+    recommender.ensure_data()
+    products = sorted(recommender.offer_store.vocabulary['produto'])
+    print(f"\nReviews reais ({len(products)} produtos no catálogo):")
+    for size in (5, 15, len(products)):
+        print(f"  cesta com {size} produtos: {query_ms(products[:size]):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark de vazão do endpoint '/recommend/batch' contra N chamadas sequenciais a '/recommend'.
+
+Simula o pré-cálculo noturno de "recomendações perto de cada ponto de retirada": N coordenadas
+em torno dos centroides das RAs, combinadas com um pequeno conjunto de filtros repetidos.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_batch
+    python -m benchmarks.bench_batch --queries 100 1000 --filter-sets 5
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app import app, recommendation_cache
+
+# Coordenadas de referência (centroides das Regiões Administrativas)
+with open('./data/json/locations.json', 'r') as f:
+    LOCATIONS = json.load(f)
+with open('./data/json/products_list.json', 'r') as f:
+    PRODUCTS = json.load(f)
+with open('./data/json/producers_ra.json', 'r') as f:
+    PRODUCERS = list(json.load(f).keys())
+
+
+# Gera 'n_filter_sets' filtros distintos (misturando os três tipos) e N payloads que os reutilizam
+def make_payloads(n_queries, n_filter_sets, seed=53):
+    rng = np.random.default_rng(seed)
+    filter_sets = []
+    for i in range(n_filter_sets):
+        kind = i % 3
+        if kind == 0:
+            filter_sets.append({'type': 'products', 'products': list(rng.choice(PRODUCTS, 2, replace=False)),
+                                'locations': [str(rng.choice(list(LOCATIONS)))]})
+        elif kind == 1:
+            filter_sets.append({'type': 'producers', 'single_product': str(rng.choice(PRODUCTS))})
+        else:
+            filter_sets.append({'type': 'producer-products', 'producer': str(rng.choice(PRODUCERS))})
+
+    centroids = np.array(list(LOCATIONS.values()))
+    payloads = []
+    for _ in range(n_queries):
+        latitude, longitude = centroids[rng.integers(len(centroids))] + rng.normal(0, 0.02, 2)
+        payload = dict(filter_sets[rng.integers(n_filter_sets)])
+        payload.update({'latitude': float(latitude), 'longitude': float(longitude), 'organic': int(rng.integers(2))})
+        payloads.append(payload)
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--filter-sets', type=int, default=6)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    # Compara apenas o motor: o cache de resultados é desativado (toda entrada é removida ao ser inserida)
+    recommendation_cache.max_entries = 0
+    print(f"{'consultas':>10} {'sequencial (s)':>15} {'lote (s)':>10} {'seq. q/s':>10} {'lote q/s':>10} {'speedup':>8}")
+    for n_queries in args.queries:
+        payloads = make_payloads(n_queries, args.filter_sets)
+
+        start = time.perf_counter()
+        sequential = [client.post('/recommend', json=payload).get_json() for payload in payloads]
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = client.post('/recommend/batch', json=payloads).get_json()
+        batch_time = time.perf_counter() - start
+
+        assert [r['results'] for r in batch] == sequential, 'O lote deveria retornar os mesmos resultados'
+        print(f"{n_queries:>10} {sequential_time:>15.3f} {batch_time:>10.3f} "
+              f"{n_queries / sequential_time:>10.0f} {n_queries / batch_time:>10.0f} {sequential_time / batch_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
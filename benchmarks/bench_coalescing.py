@@ -0,0 +1,140 @@
+"""
+Teste de carga de '/recommend' com rajadas de requisições idênticas (src.execution).
+
+Sobe a aplicação em um servidor HTTP com uma thread por requisição (nesta mesma máquina) e dispara rajadas
+de requisições simultâneas com o mesmo payload (coordenadas padrão de Brasília e o produto padrão). Antes de
+cada rajada o cache de resultados é esvaziado, para que todas cheguem ao motor. Compara:
+- "thread da requisição": COMPUTE_POOL_ENABLED = False, cada requisição calcula a sua recomendação;
+- "conjunto de trabalho": requisições idênticas em andamento compartilham um único cálculo.
+Para cada modo mostra as latências (p50, p99, máxima), os status das respostas, quantos cálculos o motor
+executou e a latência de uma rota leve ('/get_location') consultada durante as rajadas. Com --distinct,
+cada rajada tem também essa quantidade de consultas distintas (células diferentes da grade), o que exercita
+a fila limitada (respostas 429 com Retry-After).
+Nos dois modos a thread de cada requisição espera o seu resultado; o que muda é a quantidade de cálculos
+(um por consulta distinta) e o limite de cálculos simultâneos.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_coalescing
+    python -m benchmarks.bench_coalescing --clients 200 --bursts 5 --distinct 50 --queue 8
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+import numpy as np
+from werkzeug.serving import make_server
+
+import app as webapp
+from src import metrics
+from src import recommender_engine as recommender
+from src.execution import ComputePool
+
+# Payload repetido na rajada: sem coordenadas (padrão de Brasília) e com o produto padrão do formulário
+DUPLICATE_PAYLOAD = {'type': 'producers', 'single_product': 'Uva'}
+
+
+# Função para enviar uma requisição e retornar (status, latência em ms)
+def timed_request(url, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    return status, (time.perf_counter() - start) * 1000
+
+
+# Função para montar os payloads de uma rajada: cópias do payload padrão e consultas distintas
+def burst_payloads(clients, distinct):
+    payloads = [DUPLICATE_PAYLOAD] * clients
+    # Células da grade do cache a ~2 km umas das outras: cada uma é um cálculo diferente
+    payloads += [{**DUPLICATE_PAYLOAD, 'latitude': -15.7942 + 0.02 * (i + 1), 'longitude': -47.8822} for i in range(distinct)]
+    return payloads
+
+
+# Função para disparar uma rajada simultânea e medir também a rota leve durante a rajada
+def run_burst(base_url, payloads):
+    barrier = threading.Barrier(len(payloads) + 1)
+    results = [None] * len(payloads)
+    probes = []
+    done = threading.Event()
+
+    def client(position):
+        barrier.wait()
+        results[position] = timed_request(base_url + '/recommend', payloads[position])
+
+    def probe():
+        barrier.wait()
+        while not done.is_set():
+            probes.append(timed_request(base_url + '/get_location')[1])
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=client, args=(position,)) for position in range(len(payloads))]
+    prober = threading.Thread(target=probe)
+    for thread in threads + [prober]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    prober.join()
+    return results, probes
+
+
+# Função para contar os cálculos do motor registrados nas métricas (etapa 'total' do pipeline)
+def engine_computations(rec_type):
+    series = metrics.STAGE_SECONDS.series.get((rec_type, 'total'))
+    return sum(series[:-1]) if series else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=100, help='Requisições idênticas por rajada')
+    parser.add_argument('--distinct', type=int, default=0, help='Requisições distintas somadas a cada rajada')
+    parser.add_argument('--bursts', type=int, default=5, help='Rajadas por modo')
+    parser.add_argument('--workers', type=int, default=2, help='Threads do conjunto de trabalho')
+    parser.add_argument('--queue', type=int, default=32, help='Tamanho máximo da fila do conjunto de trabalho')
+    args = parser.parse_args()
+
+    recommender.MEMORY_REPORT_ON_LOAD = False
+    recommender.ensure_data()
+    webapp.TOPK_TABLES_ENABLED = False
+    logging.getLogger('werkzeug').setLevel(logging.ERROR) # Sem uma linha de log por requisição
+    server = make_server('127.0.0.1', 0, webapp.app, threaded=True)
+    server.socket.listen(1024) # A rajada inteira cabe na fila de conexões do socket
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    timed_request(base_url + '/recommend', DUPLICATE_PAYLOAD) # Aquecimento
+
+    print(f"Rajadas de {args.clients} requisições idênticas + {args.distinct} distintas, {args.bursts} por modo "
+          f"({args.workers} threads de trabalho, fila de {args.queue})\n")
+    print(f"{'modo':<22} {'p50 (ms)':>9} {'p99 (ms)':>9} {'máx (ms)':>9} {'cálculos':>9} {'rota leve p99':>14}  status")
+    for name, enabled in (('thread da requisição', False), ('conjunto de trabalho', True)):
+        webapp.COMPUTE_POOL_ENABLED = enabled
+        webapp.compute_pool = ComputePool(workers=args.workers, max_queue=args.queue)
+        metrics.reset()
+        latencies, probes, statuses = [], [], Counter()
+        for _ in range(args.bursts):
+            webapp.recommendation_cache.clear()
+            results, burst_probes = run_burst(base_url, burst_payloads(args.clients, args.distinct))
+            latencies += [latency for _, latency in results]
+            statuses.update(status for status, _ in results)
+            probes += burst_probes
+        p50, p99 = np.percentile(latencies, [50, 99])
+        probe_p99 = np.percentile(probes, 99) if probes else float('nan')
+        status_text = ', '.join(f'{status}: {count}' for status, count in sorted(statuses.items()))
+        print(f"{name:<22} {p50:>9.1f} {p99:>9.1f} {max(latencies):>9.1f} {engine_computations('producers'):>9} "
+              f"{probe_p99:>14.1f}  {status_text}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
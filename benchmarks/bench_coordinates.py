@@ -0,0 +1,75 @@
+"""
+Benchmark da deduplicação de coordenadas em normalize_distance.
+
+O volume de ofertas cresce, mas as coordenadas continuam sendo os poucos centroides das RAs
+('data/json/locations.json'). Compara, para o mesmo número de linhas:
+- por linha: uma distância de Vincenty por linha (caminho anterior);
+- por coordenada: uma distância por coordenada distinta + cópia para as linhas pelo id (gather);
+- memo: a mesma posição de usuário repetida (sem nenhum cálculo de distância).
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_coordinates
+    python -m benchmarks.bench_coordinates --sizes 10000 1000000 --repeats 20
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+import src.recommender_engine as recommender
+from src.distance import distances_km
+from src.spatial_index import SpatialIndex
+
+# Posição padrão do usuário (Brasília), a mesma usada como fallback pelo app
+USER_LATITUDE, USER_LONGITUDE = -15.7942, -47.8822
+
+with open('./data/json/locations.json', 'r') as f:
+    CENTROIDS = np.array(list(json.load(f).values()), dtype=float)
+
+
+def timed(func, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = func()
+    return result, (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{len(CENTROIDS)} coordenadas distintas")
+    print(f"{'linhas':>10} {'por linha (ms)':>15} {'por coordenada (ms)':>20} {'memo (ms)':>10}")
+    rng = np.random.default_rng(53)
+    for n_rows in args.sizes:
+        chosen = CENTROIDS[rng.integers(len(CENTROIDS), size=n_rows)]
+        latitudes, longitudes = chosen[:, 0], chosen[:, 1]
+
+        # Instala um índice apenas com estas linhas (o mesmo que set_reviews faz para a tabela de ofertas)
+        recommender.spatial_index = SpatialIndex(latitudes, longitudes)
+        coord_ids = recommender.spatial_index.coord_ids
+
+        reference, per_row = timed(lambda: distances_km(USER_LATITUDE, USER_LONGITUDE, latitudes, longitudes), args.repeats)
+
+        def per_coordinate():
+            recommender.distance_memo.clear()
+            return recommender.gather_distances(
+                recommender.location_distances([USER_LATITUDE], [USER_LONGITUDE])[0], coord_ids
+            )
+
+        result, deduplicated = timed(per_coordinate, args.repeats)
+        assert np.array_equal(result, reference), 'As distâncias deveriam ser idênticas às calculadas por linha'
+
+        memoized_result, memoized = timed(lambda: recommender.gather_distances(
+            recommender.location_distances([USER_LATITUDE], [USER_LONGITUDE])[0], coord_ids
+        ), args.repeats)
+        assert np.array_equal(memoized_result, reference)
+
+        print(f"{n_rows:>10} {per_row * 1000:>15.2f} {deduplicated * 1000:>20.2f} {memoized * 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark do cálculo de distâncias de normalize_distance.
+
+Compara o caminho antigo (candidates.apply + geopy.geodesic por linha) com o motor vetorizado
+de src.distance nos modos 'haversine' e 'vincenty', e reporta o erro máximo de cada modo em relação ao geodesic.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_distance
+    python -m benchmarks.bench_distance --sizes 10000 100000 --max-apply-rows 100000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from geopy.distance import geodesic
+
+from src.distance import DISTANCE_MODES, distances_km
+
+# Posição padrão do usuário (Brasília), a mesma usada como fallback pelo app
+USER_LATITUDE, USER_LONGITUDE = -15.7942, -47.8822
+
+
+# Gera candidatos sintéticos em torno do DF, com uma fração de coordenadas ausentes
+def make_candidates(n_rows, seed=53, nan_fraction=0.01):
+    rng = np.random.default_rng(seed)
+    latitudes = rng.uniform(-16.1, -15.5, n_rows)
+    longitudes = rng.uniform(-48.3, -47.3, n_rows)
+    missing = rng.random(n_rows) < nan_fraction
+    latitudes[missing] = np.nan
+    return pd.DataFrame({'latitude': latitudes, 'longitude': longitudes})
+
+
+# Caminho original (get_distance): uma chamada de geodesic por linha via DataFrame.apply
+def apply_path(candidates):
+    return candidates.apply(
+        lambda row: geodesic((USER_LATITUDE, USER_LONGITUDE), (row['latitude'], row['longitude'])).kilometers
+        if pd.notnull(row['latitude']) and pd.notnull(row['longitude']) else float('inf'),
+        axis=1
+    ).to_numpy()
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--max-apply-rows', type=int, default=1_000_000,
+                        help='Tamanho máximo em que o caminho apply (lento) é executado.')
+    args = parser.parse_args()
+
+    print(f"{'linhas':>10} {'caminho':>12} {'tempo (s)':>10} {'speedup':>9} {'erro máx (m)':>13}")
+    for n_rows in args.sizes:
+        candidates = make_candidates(n_rows)
+        latitudes = candidates['latitude'].to_numpy()
+        longitudes = candidates['longitude'].to_numpy()
+
+        reference, apply_time = (None, None)
+        if n_rows <= args.max_apply_rows:
+            reference, apply_time = timed(apply_path, candidates)
+            print(f"{n_rows:>10} {'apply':>12} {apply_time:>10.4f} {'1.0x':>9} {'-':>13}")
+
+        for mode in DISTANCE_MODES:
+            result, elapsed = timed(distances_km, USER_LATITUDE, USER_LONGITUDE, latitudes, longitudes, mode=mode)
+            speedup = f"{apply_time / elapsed:.0f}x" if apply_time else '-'
+            error = '-'
+            if reference is not None:
+                finite = np.isfinite(reference)
+                assert np.array_equal(finite, np.isfinite(result)), 'NaN deveria resultar em distância infinita'
+                error = f"{np.abs(result[finite] - reference[finite]).max() * 1000:.4f}"
+            print(f"{n_rows:>10} {mode:>12} {elapsed:>10.4f} {speedup:>9} {error:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark da geolocalização por IP (src.geolocation): latência de '/get_location' sem acesso à rede.
+
+Gera uma tabela sintética de N faixas de IP -> RA (blocos /20 sorteados) e mede:
+- a consulta offline sem cache (bisect na tabela) e a consulta repetida (cache por prefixo);
+- a rota '/get_location' com IPs novos a cada requisição, com e sem um resolvedor remoto lento
+  (StubResolver com atraso): a consulta remota acontece em segundo plano e não entra na latência da rota.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_geolocation
+    python -m benchmarks.bench_geolocation --ranges 10000 1000000 --remote-delay 2
+"""
+import argparse
+import ipaddress
+import time
+
+import numpy as np
+
+import app as flask_app
+from src.data_context import context
+from src.geolocation import Geolocator, IpRangeTable, OfflineResolver, StubResolver
+
+
+# Função para gerar a tabela sintética (blocos /20 distintos, RAs sorteadas)
+def make_table(n_ranges, locations, seed=0):
+    rng = np.random.default_rng(seed)
+    blocks = rng.choice(2 ** 20 - 2 ** 12, n_ranges, replace=False) + 2 ** 12 # Evita 0.0.0.0/8
+    ras = rng.choice(list(locations), n_ranges)
+    rows = ((f'{ipaddress.IPv4Address(int(block) << 12)}/20', ra) for block, ra in zip(blocks, ras))
+    return IpRangeTable(rows), blocks
+
+
+# Função para sortear IPs dentro das faixas da tabela (um por prefixo /24, sem repetição)
+def make_addresses(blocks, count, seed=1):
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(len(blocks), count)
+    subnets = rng.integers(0, 16, count)
+    prefixes = np.unique((blocks[chosen].astype(np.int64) << 4) + subnets)
+    return [str(ipaddress.IPv4Address(int(prefix) << 8 | 1)) for prefix in prefixes]
+
+
+# Função para sortear IPs públicos fora das faixas da tabela (consultados no resolvedor remoto, se houver)
+def make_unknown_addresses(table, count, seed=2):
+    rng = np.random.default_rng(seed)
+    candidates = (ipaddress.IPv4Address(int(value)) for value in rng.integers(2 ** 24, 223 * 2 ** 24, count * 4))
+    unknown = [address for address in candidates if not address.is_private and table.lookup(address) is None]
+    return [str(address) for address in unknown[:count]]
+
+
+# Função para medir o tempo médio (µs) de uma chamada por endereço
+def per_call_us(function, addresses):
+    start = time.perf_counter()
+    for address in addresses:
+        function(address)
+    return (time.perf_counter() - start) / len(addresses) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ranges', type=int, nargs='+', default=[10_000, 200_000])
+    parser.add_argument('--queries', type=int, default=20_000)
+    parser.add_argument('--remote-delay', type=float, default=1.0, help='Atraso do resolvedor remoto simulado (s)')
+    args = parser.parse_args()
+
+    locations = context.locations
+    client = flask_app.app.test_client()
+    print(f"{'faixas':>8} {'carga (ms)':>11} {'offline (µs)':>13} {'cache (µs)':>11} {'rota (µs)':>10} "
+          f"{'rota + remoto lento (µs)':>25}")
+    for n_ranges in args.ranges:
+        start = time.perf_counter()
+        table, blocks = make_table(n_ranges, locations)
+        load_ms = (time.perf_counter() - start) * 1000
+        addresses = make_addresses(blocks, args.queries)
+
+        geolocator = Geolocator([OfflineResolver(lambda: table, lambda: locations)])
+        offline_us = per_call_us(geolocator.locate, addresses)
+        cached_us = per_call_us(geolocator.locate, addresses)
+
+        # Rota com IPs novos (cache vazio), metade fora da tabela, sem e com o resolvedor remoto lento
+        route_addresses = addresses[:1000] + make_unknown_addresses(table, 1000)
+        route_us = []
+        for remote in (None, StubResolver(delay=args.remote_delay)):
+            flask_app.geolocator = Geolocator([OfflineResolver(lambda: table, lambda: locations)], remote=remote)
+            route_us.append(per_call_us(
+                lambda address: client.get('/get_location', headers={'X-Forwarded-For': address}), route_addresses
+            ))
+        print(f"{n_ranges:>8} {load_ms:>11.1f} {offline_us:>13.2f} {cached_us:>11.2f} {route_us[0]:>10.1f} {route_us[1]:>25.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark da instrumentação (src.metrics): custo das medições com a coleta ligada e desligada.
+
+Mede o custo de uma chamada a uma função decorada com metrics.timed (em relação à função sem decorador)
+e a latência média de consultas do motor com metrics.ENABLED = True e False, além do tempo de geração
+do texto de '/metrics' depois das consultas.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_metrics
+    python -m benchmarks.bench_metrics --repeats 500
+"""
+import argparse
+import time
+
+from src import metrics
+from src import recommender_engine as recommender
+
+# Consultas medidas: (tipo, filtros)
+QUERIES = [
+    ('products', {'desired_products': [], 'producer': None, 'location': 'Ceilândia'}),
+    ('producers', {'product_of_interest': 'Uva'}),
+    ('producer-products', {'producer_name': 'Asphor', 'local_filter': None}),
+]
+QUERY_POSITION = (-15.8, -47.9)
+
+
+# Função sem trabalho, medida com e sem o decorador
+def noop():
+    return None
+
+
+# Função para medir o tempo médio (ns) de uma chamada
+def call_ns(function, repeats=1_000_000):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1e9
+
+
+# Função para medir a latência média (ms) de uma consulta do motor
+def query_ms(rec_type, filters, repeats):
+    recommender.recommend(rec_type, filters, *QUERY_POSITION, 0) # Aquecimento
+    start = time.perf_counter()
+    for _ in range(repeats):
+        recommender.recommend(rec_type, filters, *QUERY_POSITION, 0)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=200, help='Consultas por medição')
+    args = parser.parse_args()
+
+    timed_noop = metrics.timed('noop')(noop)
+    base_ns = call_ns(noop)
+    metrics.ENABLED = False
+    disabled_ns = call_ns(timed_noop)
+    metrics.ENABLED = True
+    enabled_ns = call_ns(timed_noop)
+    print(f"Custo de metrics.timed por chamada: desligado +{disabled_ns - base_ns:.0f} ns, "
+          f"ligado +{enabled_ns - base_ns:.0f} ns\n")
+
+    recommender.MEMORY_REPORT_ON_LOAD = False
+    recommender.ensure_data()
+    print(f"{'tipo':<18} {'desligado (ms)':>15} {'ligado (ms)':>12} {'diferença':>10}")
+    for rec_type, filters in QUERIES:
+        metrics.ENABLED = False
+        disabled_ms = query_ms(rec_type, filters, args.repeats)
+        metrics.ENABLED = True
+        enabled_ms = query_ms(rec_type, filters, args.repeats)
+        print(f"{rec_type:<18} {disabled_ms:>15.3f} {enabled_ms:>12.3f} {(enabled_ms / disabled_ms - 1) * 100:>9.1f}%")
+
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"\n'/metrics': {len(text.splitlines())} linhas geradas em {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
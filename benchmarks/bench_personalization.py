@@ -0,0 +1,105 @@
+"""
+Benchmark da filtragem colaborativa (src.personalization): tempo de treino e latência por consulta.
+
+Gera reviews sintéticas para N usuários sobre os itens (produto, produtor) do catálogo real, com
+~3 avaliações por usuário (a média das reviews reais) vindas de fatores latentes, e mede:
+- o tempo de montagem da matriz CSR usuário x item e do treino por ALS;
+- o RMSE em avaliações separadas do treino, comparado ao da previsão só com os vieses;
+- a latência de uma consulta do motor (recommend) sem e com 'user_id', com o modelo treinado instalado.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_personalization
+    python -m benchmarks.bench_personalization --users 100000 1000000 --iterations 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src import recommender_engine as recommender
+from src.data_context import context
+from src.personalization import DEFAULT_FACTORS, UserFactorModel
+
+# Consulta usada na medição de latência (tipo 'products', filtrada por RA)
+QUERY_FILTERS = {'desired_products': [], 'producer': None, 'location': 'Ceilândia'}
+QUERY_POSITION = (-15.8, -47.9)
+
+
+# Função para gerar as reviews sintéticas (e as separadas para avaliação)
+def make_reviews(n_users, items, reviews_per_user=3, factors=8, holdout=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    n_reviews = n_users * reviews_per_user
+    users = rng.integers(0, n_users, n_reviews)
+    item_codes = rng.integers(0, len(items), n_reviews)
+    user_factors = rng.normal(size=(n_users, factors))
+    item_factors = rng.normal(size=(len(items), factors))
+    affinity = np.einsum('ij,ij->i', user_factors[users], item_factors[item_codes]) / np.sqrt(factors)
+    df = pd.DataFrame({
+        'id_usuario': np.char.add('user-', users.astype(str)),
+        'produto': items['produto'].to_numpy()[item_codes],
+        'nome_produtor': items['nome_produtor'].to_numpy()[item_codes],
+        'avaliacao': np.clip(np.round(3 + affinity), 1, 5),
+    })
+    test = rng.random(n_reviews) < holdout
+    return df[~test], df[test]
+
+
+# Função para calcular o RMSE do modelo (e dos vieses) nas reviews separadas
+def holdout_rmse(model, test):
+    positions = (model.user_index(user) for user in test['id_usuario'])
+    users = np.array([-1 if position is None else position for position in positions])
+    items = np.array([model.item_position.get(item, -1) for item in zip(test['produto'], test['nome_produtor'])])
+    known = (users >= 0) & (items >= 0)
+    users, items = users[known], items[known]
+    actual = test['avaliacao'].to_numpy()[known]
+    baseline = model.global_mean + model.user_bias[users] + model.item_bias[items]
+    predicted = baseline + np.einsum('ij,ij->i', model.user_factors[users], model.item_factors[items])
+    return np.sqrt(np.mean((predicted - actual) ** 2)), np.sqrt(np.mean((baseline - actual) ** 2))
+
+
+# Função para medir a latência média (ms) de uma consulta do motor
+def query_ms(filters, repeats=200):
+    recommender.recommend('products', filters, *QUERY_POSITION, 0) # Aquecimento
+    start = time.perf_counter()
+    for _ in range(repeats):
+        recommender.recommend('products', filters, *QUERY_POSITION, 0)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--factors', type=int, default=DEFAULT_FACTORS)
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    recommender.MEMORY_REPORT_ON_LOAD = False
+    recommender.ensure_data()
+    items = recommender.df_aggregates[['produto', 'nome_produtor']].astype(str).drop_duplicates()
+
+    print(f"{'usuários':>10} {'reviews':>9} {'matriz (s)':>11} {'treino (s)':>11} {'RMSE':>6} {'vieses':>7} "
+          f"{'consulta (ms)':>14} {'personalizada (ms)':>19}")
+    for n_users in args.users:
+        train, test = make_reviews(n_users, items)
+        start = time.perf_counter()
+        model = UserFactorModel.train(train, factors=args.factors, iterations=0)
+        matrix_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        model = UserFactorModel.train(train, factors=args.factors, iterations=args.iterations)
+        train_seconds = time.perf_counter() - start - matrix_seconds
+        rmse, baseline_rmse = holdout_rmse(model, test)
+
+        # Instala o modelo sintético no contexto e mede a consulta sem e com o usuário
+        context.discard_artifact('user_factors')
+        context.get_artifact('user_factors', lambda: model)
+        base_ms = query_ms(QUERY_FILTERS)
+        personalized_ms = query_ms(dict(QUERY_FILTERS, user_id=model.users[len(model) // 2]))
+        context.discard_artifact('user_factors')
+
+        print(f"{n_users:>10} {len(train):>9} {matrix_seconds:>11.2f} {train_seconds:>11.2f} {rmse:>6.3f} "
+              f"{baseline_rmse:>7.3f} {base_ms:>14.2f} {personalized_ms:>19.2f}")
+
+
+if __name__ == '__main__':
+    main()
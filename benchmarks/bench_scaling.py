@@ -0,0 +1,327 @@
+"""
+Benchmark de escala do motor com dados sintéticos: etapas dos pipelines e rota '/recommend' por tamanho.
+
+Gera, com semente fixa, um catálogo (esquema de 'producers.csv') e N reviews (esquema de 'reviews.csv',
+já juntadas às coordenadas e com os códigos, como 'df_full_reviews.parquet') que preservam as distribuições
+dos dados reais: notas, reviews por usuário, RAs por produtor, fração dos produtos oferecidos em cada
+produtor x RA e variantes orgânica/convencional. Produtores crescem com a raiz do fator de escala, produtos
+e RAs com a raiz quarta (RAs novas ganham centroides sorteados no DF).
+
+Cada tamanho roda em um processo novo, que mede: geração, carga no motor (set_reviews), a latência de cada
+pipeline ('products', 'producers', 'producer-products') com o tempo médio de cada etapa (src.metrics), a
+latência da rota '/recommend' (sem cache de resultados nem tabelas materializadas) e o pico de RSS.
+Os resultados são gravados em JSON (com o commit atual); '--compare' mostra a variação em relação a um
+arquivo anterior.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_scaling
+    python -m benchmarks.bench_scaling --sizes 10000 1000000 --repeats 20 --output /tmp/scaling.json
+    python -m benchmarks.bench_scaling --compare benchmarks/results/scaling-abc1234.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Tamanho dos dados reais e das suas dimensões (base do fator de escala)
+REAL_REVIEWS = 7_498
+REAL_PRODUCERS = 17
+REAL_PRODUCTS = 35
+REAL_LOCATIONS = 14
+
+# Região em que as RAs sintéticas são sorteadas (aproximadamente o DF)
+LATITUDE_RANGE = (-16.05, -15.50)
+LONGITUDE_RANGE = (-48.28, -47.30)
+
+# Diretório padrão dos resultados
+RESULTS_DIR = './benchmarks/results'
+
+# Posição dos usuários nas consultas
+QUERY_POSITION = (-15.8, -47.9)
+
+
+# Função para extrair dos dados reais as distribuições preservadas pelo gerador
+def real_distributions():
+    reviews = pd.read_csv('./data/datasets/reviews.csv')
+    producers = pd.read_csv('./data/datasets/producers.csv')
+    with open('./data/json/locations.json', 'r') as f:
+        locations = json.load(f)
+    offers_per_item = producers.groupby(['nome_produtor', 'local', 'produto']).size()
+    pairs = producers.groupby(['nome_produtor', 'local']).ngroups
+    single = producers.groupby(['nome_produtor', 'local', 'produto']).filter(lambda group: len(group) == 1)
+    return {
+        'ratings': reviews['avaliacao'].value_counts(normalize=True).sort_index(),
+        'reviews_per_user': reviews.groupby('id_usuario').size().to_numpy(),
+        'locations_per_producer': producers.groupby('nome_produtor')['local'].nunique().to_numpy(),
+        'product_share': len(offers_per_item) / (pairs * producers['produto'].nunique()),
+        'both_variants_share': float((offers_per_item > 1).mean()),
+        'organic_share': float(single['organico'].mean()),
+        'products': sorted(producers['produto'].unique()),
+        'producers': sorted(producers['nome_produtor'].unique()),
+        'locations': locations,
+    }
+
+
+# Função para completar uma lista de nomes reais com nomes sintéticos numerados
+def names(real, count, prefix):
+    return list(real[:count]) + [f'{prefix} {number:04d}' for number in range(len(real) + 1, count + 1)]
+
+
+# Função para gerar o catálogo de ofertas sintético (esquema de 'producers.csv')
+def make_catalogue(n_reviews, distributions, rng):
+    scale = max(1.0, n_reviews / REAL_REVIEWS)
+    products = names(distributions['products'], round(REAL_PRODUCTS * scale ** 0.25), 'Produto')
+    producers = names(distributions['producers'], round(REAL_PRODUCERS * scale ** 0.5), 'Produtor')
+    real_locations = list(distributions['locations'].items())
+    n_locations = round(REAL_LOCATIONS * scale ** 0.25)
+    locations = real_locations[:n_locations] + [
+        (f'RA Sintética {number:03d}', [rng.uniform(*LATITUDE_RANGE), rng.uniform(*LONGITUDE_RANGE)])
+        for number in range(len(real_locations) + 1, n_locations + 1)
+    ]
+
+    # Produtor x RA: cada produtor atua em um número de RAs sorteado da distribuição real
+    counts = np.minimum(rng.choice(distributions['locations_per_producer'], len(producers)), len(locations))
+    pair_producer = np.repeat(np.arange(len(producers)), counts)
+    pair_location = np.concatenate([rng.choice(len(locations), count, replace=False) for count in counts])
+
+    # Produtos oferecidos em cada par; parte deles nas duas variantes (orgânica e convencional)
+    offered = rng.random((len(pair_producer), len(products))) < distributions['product_share']
+    pair, product = np.nonzero(offered)
+    both = rng.random(len(pair)) < distributions['both_variants_share']
+    organic = (rng.random(len(pair)) < distributions['organic_share']).astype(np.int64)
+    pair, product = np.concatenate([pair, pair[both]]), np.concatenate([product, product[both]])
+    organic = np.concatenate([np.where(both, 1, organic), np.zeros(both.sum(), dtype=np.int64)])
+
+    coordinates = np.array([coordinate for _, coordinate in locations])
+    location = pair_location[pair]
+    return pd.DataFrame({
+        'produto': np.array(products, dtype=object)[product],
+        'organico': organic,
+        'nome_produtor': np.array(producers, dtype=object)[pair_producer[pair]],
+        'local': np.array([name for name, _ in locations], dtype=object)[location],
+        'latitude': coordinates[location, 0],
+        'longitude': coordinates[location, 1],
+    })
+
+
+# Função para criar uma coluna categórica com categorias ordenadas (ordem do LabelEncoder) e seus códigos
+def encoded(values, codes):
+    order = np.argsort(np.asarray(values, dtype=object))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    categories = np.asarray(values, dtype=object)[order]
+    sorted_codes = rank[codes]
+    return pd.Categorical.from_codes(sorted_codes, categories=categories), sorted_codes
+
+
+# Função para gerar as reviews sintéticas (esquema de 'df_full_reviews.parquet')
+def make_reviews(n_reviews, catalogue, distributions, rng):
+    # Usuários com o número de reviews sorteado da distribuição real
+    per_user = rng.choice(distributions['reviews_per_user'], -(-n_reviews // 2) + 1)
+    n_users = int(np.searchsorted(np.cumsum(per_user), n_reviews)) + 1
+    users = rng.permutation(np.repeat(np.arange(n_users), per_user[:n_users])[:n_reviews])
+    user_names = [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n_users)]
+
+    offers = rng.integers(0, len(catalogue), n_reviews)
+    ratings = distributions['ratings']
+    encoded_columns = {'id_usuario': encoded(user_names, users)}
+    for column in ('produto', 'nome_produtor', 'local'):
+        codes, values = pd.factorize(catalogue[column])
+        encoded_columns[column] = encoded(values, codes[offers])
+    return pd.DataFrame({
+        'id_usuario': encoded_columns['id_usuario'][0],
+        'produto': encoded_columns['produto'][0],
+        'organico': catalogue['organico'].to_numpy()[offers],
+        'nome_produtor': encoded_columns['nome_produtor'][0],
+        'local': encoded_columns['local'][0],
+        'avaliacao': rng.choice(ratings.index.to_numpy(), n_reviews, p=ratings.to_numpy()),
+        'latitude': catalogue['latitude'].to_numpy()[offers],
+        'longitude': catalogue['longitude'].to_numpy()[offers],
+        'usuario_id': encoded_columns['id_usuario'][1],
+        'produto_id': encoded_columns['produto'][1],
+        'produtor_id': encoded_columns['nome_produtor'][1],
+        'local_id': encoded_columns['local'][1],
+    })
+
+
+# Função para obter o pico de memória residente do processo (MB)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # ru_maxrss em KB no Linux
+
+
+# Função para montar as consultas medidas a partir do catálogo gerado (as mesmas para o motor e a rota)
+def make_queries(catalogue):
+    first = catalogue.iloc[0]
+    return {
+        'products': ({'desired_products': [], 'producer': None, 'location': first['local']},
+                     {'type': 'products', 'products': [], 'locations': [first['local']]}),
+        'producers': ({'product_of_interest': first['produto']},
+                      {'type': 'producers', 'single_product': first['produto']}),
+        'producer-products': ({'producer_name': first['nome_produtor'], 'local_filter': None},
+                              {'type': 'producer-products', 'producer': first['nome_produtor']}),
+    }
+
+
+# Função para medir a latência média (ms) de uma função
+def mean_ms(function, repeats):
+    function() # Aquecimento
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+# Função que mede um tamanho (executada em um processo novo)
+def measure(n_reviews, repeats, seed):
+    import src.recommender_engine as recommender
+    import app as flask_app
+    from src import metrics
+
+    recommender.MEMORY_REPORT_ON_LOAD = False
+    recommender.SEGMENT_POLL_SECONDS = float('inf') # Os segmentos ingeridos nos dados reais não se aplicam aqui
+    flask_app.TOPK_TABLES_ENABLED = False
+    flask_app.recommendation_cache.max_entries = 0
+    baseline_mb = peak_rss_mb()
+
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    distributions = real_distributions()
+    catalogue = make_catalogue(n_reviews, distributions, rng)
+    df_reviews = make_reviews(n_reviews, catalogue, distributions, rng)
+    generate_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    recommender.set_reviews(recommender.prepare_reviews(df_reviews))
+    load_seconds = time.perf_counter() - start
+    del df_reviews
+
+    result = {
+        'reviews': n_reviews,
+        'offers': len(recommender.df_aggregates),
+        'producers': int(catalogue['nome_produtor'].nunique()),
+        'products': int(catalogue['produto'].nunique()),
+        'locations': int(catalogue['local'].nunique()),
+        'generate_s': round(generate_seconds, 3),
+        'load_s': round(load_seconds, 3),
+        'pipelines': {},
+    }
+    client = flask_app.app.test_client()
+    latitude, longitude = QUERY_POSITION
+    for rec_type, (filters, payload) in make_queries(catalogue).items():
+        metrics.reset()
+        engine_ms = mean_ms(lambda: recommender.recommend(rec_type, filters, latitude, longitude, 0), repeats)
+        stages = {
+            stage: round(values[-1] / sum(values[:-1]) * 1000, 3)
+            for (pipeline, stage), values in metrics.STAGE_SECONDS.series.items() if pipeline == rec_type
+        }
+        route_payload = dict(payload, latitude=latitude, longitude=longitude)
+        route_ms = mean_ms(lambda: client.post('/recommend', json=route_payload), repeats)
+        result['pipelines'][rec_type] = {'engine_ms': round(engine_ms, 3), 'route_ms': round(route_ms, 3), 'stages_ms': stages}
+
+    result['baseline_rss_mb'] = round(baseline_mb, 1)
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    return result
+
+
+# Função para identificar o commit atual (com '+' se houver alterações não commitadas)
+def current_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+        return commit + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecido'
+
+
+# Função para listar as métricas comparáveis de um resultado: (tamanho, nome) -> valor
+def flatten(results):
+    values = {}
+    for result in results:
+        size = result['reviews']
+        values[(size, 'load_s')] = result['load_s']
+        values[(size, 'peak_rss_mb')] = result['peak_rss_mb']
+        for rec_type, pipeline in result['pipelines'].items():
+            values[(size, f'{rec_type} engine_ms')] = pipeline['engine_ms']
+            values[(size, f'{rec_type} route_ms')] = pipeline['route_ms']
+            for stage, value in pipeline['stages_ms'].items():
+                values[(size, f'{rec_type} {stage}_ms')] = value
+    return values
+
+
+# Função para imprimir a variação de cada métrica em relação a um resultado anterior
+def compare(previous, current):
+    before, after = flatten(previous['results']), flatten(current['results'])
+    print(f"\nComparação com {previous['commit']} ({previous['timestamp']}):")
+    print(f"{'reviews':>10} {'métrica':<36} {'antes':>10} {'agora':>10} {'variação':>9}")
+    for key in sorted(set(before) & set(after)):
+        size, name = key
+        change = (after[key] / before[key] - 1) * 100 if before[key] else 0.0
+        print(f"{size:>10} {name:<36} {before[key]:>10.3f} {after[key]:>10.3f} {change:>8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument('--repeats', type=int, default=50, help='Consultas por medição')
+    parser.add_argument('--seed', type=int, default=53)
+    parser.add_argument('--output', default=None, help='Arquivo JSON (padrão: benchmarks/results/scaling-<commit>.json)')
+    parser.add_argument('--compare', default=None, help='Resultado anterior (JSON) para comparação')
+    parser.add_argument('--run-size', type=int, default=None, help=argparse.SUPPRESS) # Processo filho
+    args = parser.parse_args()
+
+    if args.run_size is not None:
+        print(json.dumps(measure(args.run_size, args.repeats, args.seed)))
+        return
+
+    results = []
+    print(f"{'reviews':>10} {'ofertas':>8} {'carga (s)':>10} {'pico (MB)':>10} {'pipeline':<18} "
+          f"{'motor (ms)':>11} {'rota (ms)':>10}  etapas (ms)")
+    for n_reviews in args.sizes:
+        child = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_scaling', '--run-size', str(n_reviews),
+             '--repeats', str(args.repeats), '--seed', str(args.seed)],
+            capture_output=True, text=True
+        )
+        if child.returncode != 0:
+            print(f"{n_reviews:>10} falhou (código {child.returncode}): {child.stderr.strip().splitlines()[-1:]}")
+            continue
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append(result)
+        for rec_type, pipeline in result['pipelines'].items():
+            stages = ' '.join(f'{stage}={value:.2f}' for stage, value in sorted(pipeline['stages_ms'].items()) if stage != 'total')
+            print(f"{n_reviews:>10} {result['offers']:>8} {result['load_s']:>10.2f} {result['peak_rss_mb']:>10.1f} "
+                  f"{rec_type:<18} {pipeline['engine_ms']:>11.2f} {pipeline['route_ms']:>10.2f}  {stages}")
+
+    commit = current_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'repeats': args.repeats,
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f'scaling-{commit}.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados gravados em {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
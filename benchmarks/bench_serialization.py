@@ -0,0 +1,88 @@
+"""
+Benchmark da codificação das respostas de '/recommend' (src.response_encoding) x caminho anterior.
+
+Para resultados de vários tamanhos (consultas reais do motor e resultados sintéticos obtidos repetindo as
+linhas de um resultado real), mede o tempo de codificação e os bytes enviados, sem e com gzip, de:
+- to_dict + jsonify: o caminho anterior (um dicionário por linha, escalares do NumPy convertidos um a um);
+- records: a mesma lista de objetos, montada a partir dos arrays das colunas;
+- columnar: um array por coluna (campo 'format': 'columnar');
+- ndjson: um objeto por linha, em blocos (cabeçalho 'Accept: application/x-ndjson').
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_serialization
+    python -m benchmarks.bench_serialization --rows 1000 100000 --repeats 5
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from app import app
+from src import recommender_engine as recommender
+from src import response_encoding
+
+# Consulta real usada como base dos resultados sintéticos: (tipo, filtros)
+BASE_QUERY = ('products', {'desired_products': [], 'producer': None, 'location': 'Ceilândia', 'top_n': 500})
+QUERY_POSITION = (-15.8, -47.9)
+
+
+# Função para codificar pelo caminho anterior (to_dict + jsonify do Flask)
+def encode_jsonify(frame):
+    with app.app_context():
+        return app.json.response(frame.to_dict(orient='records')).get_data()
+
+
+# Função para codificar no formato NDJSON (todos os blocos concatenados)
+def encode_ndjson(frame):
+    return b''.join(response_encoding.ndjson_chunks(response_encoding.encode_rows(frame)))
+
+
+# Codificadores comparados: nome -> função que retorna o corpo em bytes
+ENCODERS = {
+    'to_dict + jsonify': encode_jsonify,
+    'records': lambda frame: response_encoding.encode_records(frame).encode(),
+    'columnar': lambda frame: response_encoding.encode_columnar(frame).encode(),
+    'ndjson': encode_ndjson,
+}
+
+
+# Função para medir o menor tempo (ms) de uma codificação e o corpo produzido
+def measure(encoder, frame, repeats):
+    best, body = float('inf'), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        body = encoder(frame)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[5, 100, 1_000, 10_000, 100_000],
+                        help='Tamanhos dos resultados medidos')
+    parser.add_argument('--repeats', type=int, default=5, help='Repetições por medição (vale a menor)')
+    args = parser.parse_args()
+
+    recommender.MEMORY_REPORT_ON_LOAD = False
+    recommender.ensure_data()
+    rec_type, filters = BASE_QUERY
+    base = recommender.recommend(rec_type, filters, *QUERY_POSITION, 0)
+    print(f"Resultado base: '{rec_type}' com {len(base)} linhas e {base.shape[1]} colunas\n")
+
+    print(f"{'linhas':>8} {'codificação':<18} {'tempo (ms)':>11} {'x anterior':>10} {'bytes':>11} {'gzip':>10} "
+          f"{'gzip (ms)':>10}")
+    for rows in args.rows:
+        frame = pd.concat([base] * (rows // len(base) + 1), ignore_index=True).iloc[:rows]
+        baseline_ms = None
+        for name, encoder in ENCODERS.items():
+            encode_ms, body = measure(encoder, frame, args.repeats)
+            baseline_ms = baseline_ms or encode_ms
+            start = time.perf_counter()
+            compressed = response_encoding.gzip_body(body)
+            gzip_ms = (time.perf_counter() - start) * 1000
+            print(f"{rows:>8} {name:<18} {encode_ms:>11.3f} {baseline_ms / encode_ms:>9.1f}x {len(body):>11} "
+                  f"{len(compressed):>10} {gzip_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark da similaridade item-item (src.similarity): cálculo exato x aproximado (LSH).
+
+Gera catálogos sintéticos com N itens avaliados em 300 "colunas" (avaliações de 1 a 5 vindas de fatores
+latentes, com a densidade da matriz real, ~88% preenchida) e, para cada tamanho, mede o tempo de construção
+do índice exato e do aproximado, o recall@k do aproximado em relação ao exato e o tempo de uma consulta
+(vizinhos de um item, já pré-calculados). Também mede os índices construídos sobre as reviews reais.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_similarity
+    python -m benchmarks.bench_similarity --sizes 10000 30000 --k 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.aggregates import build_aggregate_table
+from src.similarity import SimilarityIndex, build_similarity
+
+
+# Função para gerar a matriz sintética itens x colunas de avaliações
+def make_catalogue(n_items, n_columns=300, density=0.88, factors=16, seed=0):
+    rng = np.random.default_rng(seed)
+    ratings = rng.standard_normal((n_items, factors)) @ rng.standard_normal((factors, n_columns))
+    ratings = np.clip(3 + ratings / 4, 1, 5)
+    return sparse.csr_matrix(np.where(rng.random((n_items, n_columns)) < density, ratings, 0))
+
+
+# Função para medir o tempo de construção de um índice
+def timed_index(labels, matrix, k, approximate):
+    start = time.perf_counter()
+    index = SimilarityIndex(labels, matrix, k, approximate)
+    return index, time.perf_counter() - start
+
+
+# Função para calcular o recall@k do índice aproximado em relação ao exato
+def recall(exact, approximate):
+    found = []
+    for i in range(len(exact)):
+        expected = set(exact.indices[exact.indptr[i]:exact.indptr[i + 1]])
+        if expected:
+            got = set(approximate.indices[approximate.indptr[i]:approximate.indptr[i + 1]])
+            found.append(len(expected & got) / len(expected))
+    return float(np.mean(found)) if found else 1.0
+
+
+# Função para medir o tempo médio de uma consulta (em µs)
+def lookup_us(index, repeats=20_000):
+    labels = [index.labels[i] for i in np.random.default_rng(1).integers(0, len(index), repeats)]
+    start = time.perf_counter()
+    for label in labels:
+        index.neighbors(label, 5)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5_000, 10_000, 30_000])
+    parser.add_argument('--k', type=int, default=10, help='Vizinhos guardados por item')
+    args = parser.parse_args()
+
+    print(f"{'itens':>8} {'exato (s)':>10} {'aprox. (s)':>11} {'recall@k':>9} {'consulta (µs)':>14}")
+    for n_items in args.sizes:
+        matrix = make_catalogue(n_items)
+        labels = [f'item-{i}' for i in range(n_items)]
+        exact, exact_seconds = timed_index(labels, matrix, args.k, approximate=False)
+        approximate, approximate_seconds = timed_index(labels, matrix, args.k, approximate=True)
+        print(f"{n_items:>8} {exact_seconds:>10.2f} {approximate_seconds:>11.2f} "
+              f"{recall(exact, approximate):>9.3f} {lookup_us(exact):>14.1f}")
+
+    # Índices das reviews reais (produtores e produtos), como construídos pelo motor
+    df_aggregates = build_aggregate_table(pd.read_parquet('./data/datasets/df_full_reviews.parquet'))
+    start = time.perf_counter()
+    indexes = build_similarity(df_aggregates)
+    print(f"\nReviews reais: índices construídos em {(time.perf_counter() - start) * 1000:.1f} ms")
+    for kind, index in indexes.items():
+        print(f"  {kind}: {len(index)} itens, consulta em {lookup_us(index):.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark de inicialização a frio (cold start) e memória residente do app.
+
+Cada medição roda em um processo novo: importa o app, atende a primeira requisição de '/'
+e a primeira de '/recommend', e reporta o tempo acumulado e o pico de RSS após cada etapa.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+# Código executado no processo filho
+CHILD = r'''
+import json, resource, sys, time, warnings
+warnings.filterwarnings('ignore')
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss em KB no Linux
+
+start = time.perf_counter()
+stages = {}
+import app
+stages['import'] = (time.perf_counter() - start, rss_mb())
+client = app.app.test_client()
+client.get('/')
+stages['primeiro /'] = (time.perf_counter() - start, rss_mb())
+client.post('/recommend', json={'type': 'products', 'products': ['Uva'], 'locations': ['Gama']})
+stages['primeiro /recommend'] = (time.perf_counter() - start, rss_mb())
+print(json.dumps(stages))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    runs = [json.loads(subprocess.check_output([sys.executable, '-c', CHILD]).decode().strip().splitlines()[-1])
+            for _ in range(args.runs)]
+
+    print(f"{'etapa':>22} {'tempo (s)':>10} {'pico RSS (MB)':>14}")
+    for stage in runs[0]:
+        elapsed = min(run[stage][0] for run in runs)
+        rss = min(run[stage][1] for run in runs)
+        print(f"{stage:>22} {elapsed:>10.3f} {rss:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
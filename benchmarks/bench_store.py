@@ -0,0 +1,91 @@
+"""
+Benchmark do armazenamento de reviews: parquet (decodificado no heap) x Arrow IPC mapeado em memória.
+
+Gera um dataset sintético com N reviews (as reviews reais repetidas, com novos usuários) em um diretório
+temporário e, para cada formato, inicia processos novos que carregam as reviews e constroem a tabela
+agregada do motor. Reporta o tempo de carga, o tempo até o motor ficar pronto e a memória de cada processo:
+RSS total e a parte privada (o que não é compartilhado com outros processos pelo page cache).
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_store
+    python -m benchmarks.bench_store --sizes 100000 1000000 --processes 2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Código executado em cada processo filho: carrega as reviews, constrói a tabela agregada e mede a memória
+CHILD = r'''
+import json, sys, time, warnings
+warnings.filterwarnings('ignore')
+import pandas as pd
+from src.aggregates import build_aggregate_table
+from src.review_store import load_reviews, prepare_reviews
+
+backend, path = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+df = prepare_reviews(pd.read_parquet(path)) if backend == 'parquet' else load_reviews(path)
+loaded = time.perf_counter() - start
+build_aggregate_table(df)
+ready = time.perf_counter() - start
+
+memory = {}
+with open('/proc/self/smaps_rollup') as f:
+    for line in f:
+        key, _, rest = line.partition(':')
+        if key in ('Rss', 'Private_Clean', 'Private_Dirty'):
+            memory[key] = int(rest.split()[0]) / 1024
+print(json.dumps({'load': loaded, 'ready': ready, 'rss': memory.get('Rss', 0),
+                  'private': memory.get('Private_Clean', 0) + memory.get('Private_Dirty', 0)}))
+'''
+
+
+# Função para gerar o parquet sintético com 'n_rows' reviews
+def make_dataset(n_rows, directory):
+    base = pd.read_parquet('./data/datasets/df_full_reviews.parquet')
+    repeats = -(-n_rows // len(base))
+    df = pd.concat([base] * repeats, ignore_index=True).iloc[:n_rows]
+    # Usuários distintos por repetição, como em um dataset maior (a coluna de UUIDs domina a memória)
+    copy_number = np.repeat(np.arange(repeats), len(base))[:n_rows].astype(str)
+    df['id_usuario'] = df['id_usuario'].astype(str) + '-' + copy_number
+    df['usuario_id'] = pd.factorize(df['id_usuario'], sort=True)[0]
+    path = os.path.join(directory, 'df_full_reviews.parquet')
+    df.to_parquet(path)
+    return path
+
+
+# Função para iniciar os processos simultaneamente e coletar as medições
+def run_processes(backend, path, processes):
+    children = [
+        subprocess.Popen([sys.executable, '-c', CHILD, backend, path], stdout=subprocess.PIPE)
+        for _ in range(processes)
+    ]
+    return [json.loads(child.communicate()[0].decode().strip().splitlines()[-1]) for child in children]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--processes', type=int, default=2, help='Processos simultâneos por medição')
+    args = parser.parse_args()
+
+    print(f"{'reviews':>10} {'formato':>8} {'carga (ms)':>11} {'pronto (ms)':>12} {'RSS (MB)':>9} {'privada (MB)':>13}")
+    for n_rows in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = make_dataset(n_rows, directory)
+            run_processes('arrow', path, 1) # Gera o arquivo Arrow (primeira carga) antes das medições
+            for backend in ('parquet', 'arrow'):
+                results = run_processes(backend, path, args.processes)
+                mean = {key: np.mean([result[key] for result in results]) for key in results[0]}
+                print(f"{n_rows:>10} {backend:>8} {mean['load'] * 1000:>11.1f} {mean['ready'] * 1000:>12.1f} "
+                      f"{mean['rss']:>9.1f} {mean['private']:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Teste de carga do servidor pré-fork (serve.py): requisições/s em '/recommend' conforme o número de processos.
+
+Para cada quantidade de processos, inicia 'serve.py' em uma porta livre (com o cache de resultados
+desativado, para medir o motor), dispara os payloads de '/recommend' a partir de vários processos
+clientes durante alguns segundos e mede a vazão e a latência. Em Linux, também informa a memória
+de cada processo de trabalho (PSS e privada, de /proc/<pid>/smaps_rollup): a memória privada baixa
+indica que o dataset continua compartilhado por copy-on-write.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_workers
+    python -m benchmarks.bench_workers --workers 1 2 4 8 --clients 16 --duration 10
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.bench_batch import make_payloads
+
+
+# Função para encontrar uma porta TCP livre
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Função para aguardar o servidor aceitar requisições
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/cache/stats')
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+# Função executada por cada processo cliente: envia payloads até o fim do prazo
+def client_loop(args):
+    port, payloads, deadline = args
+    latencies = []
+    errors = 0
+    i = 0
+    while time.time() < deadline:
+        body = json.dumps(payloads[i % len(payloads)])
+        i += 1
+        start = time.perf_counter()
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            connection.request('POST', '/recommend', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            if response.status != 200:
+                errors += 1
+                continue
+        except OSError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+# Função para ler a memória (PSS e privada, em MB) dos processos filhos do servidor
+def worker_memory(master_pid):
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            pids = [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+    memory = []
+    for pid in pids:
+        values = {}
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    key, _, rest = line.partition(':')
+                    if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                        values[key] = int(rest.split()[0]) / 1024
+        except OSError:
+            continue
+        memory.append((values.get('Rss', 0), values.get('Pss', 0),
+                       values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)))
+    return memory
+
+
+# Função para medir a vazão de uma configuração de processos
+def run_load(workers, clients, duration, payloads):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, 'serve.py', '--port', str(port), '--workers', str(workers), '--cache-entries', '0'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_ready(port):
+            raise RuntimeError('O servidor não ficou pronto a tempo.')
+        # Aquecimento: cada processo de trabalho atende algumas requisições antes da medição
+        client_loop((port, payloads[:20], time.time() + 1))
+
+        deadline = time.time() + duration
+        chunks = [(port, payloads[i::clients], deadline) for i in range(clients)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client_loop, chunks)
+        elapsed = time.perf_counter() - start
+        memory = worker_memory(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = np.concatenate([np.asarray(r[0]) for r in results]) * 1000
+    errors = sum(r[1] for r in results)
+    return {
+        'workers': workers,
+        'requests': int(len(latencies)),
+        'errors': int(errors),
+        'req_per_s': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else float('nan'),
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else float('nan'),
+        'memory': memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8, help='Processos clientes simultâneos')
+    parser.add_argument('--duration', type=float, default=5.0, help='Segundos de medição por configuração')
+    parser.add_argument('--payloads', type=int, default=500)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.payloads, n_filter_sets=12)
+    print(f"CPUs disponíveis: {os.cpu_count()} | clientes: {args.clients} | duração: {args.duration}s")
+    print(f"{'processos':>10} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'erros':>7} {'RSS/PSS/privada por processo (MB)':>36}")
+    baseline = None
+    for workers in args.workers:
+        result = run_load(workers, args.clients, args.duration, payloads)
+        baseline = baseline or result['req_per_s']
+        memory = ', '.join(f"{rss:.0f}/{pss:.0f}/{private:.0f}" for rss, pss, private in result['memory']) or '-'
+        print(f"{workers:>10} {result['req_per_s']:>10.1f} {result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} "
+              f"{result['errors']:>7}   {memory}  (x{result['req_per_s'] / baseline:.2f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Servidor de produção com vários processos de trabalho (pré-fork).
+
+O processo principal carrega o dataset de reviews e constrói os índices do motor uma única vez,
+abre o socket de escuta e só então cria os processos de trabalho com fork(). Os filhos herdam o
+socket e o estado do motor por copy-on-write: as páginas de memória do dataset são compartilhadas
+entre todos os processos enquanto ninguém as modifica (ver recommender_engine.preload_for_fork).
+Cada processo atende requisições com o servidor WSGI do Werkzeug e mantém seu próprio cache de resultados e suas próprias métricas ('/metrics').
+Processos que terminarem inesperadamente são recriados.
+
+Uso (a partir da raiz do repositório):
+    python serve.py --workers 4
+    python serve.py --host 0.0.0.0 --port 8000 --workers 8 --threads
+    python serve.py --workers 1 --profile-slow-ms 200
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+
+from werkzeug.serving import make_server
+
+import src.recommender_engine as recommender
+from app import app, enable_slow_request_profile, recommendation_cache
+from src import metrics
+
+
+# Função para abrir o socket de escuta compartilhado por todos os processos de trabalho
+def open_listener(host, port, backlog=128):
+    """Cria, associa e coloca em escuta o socket TCP; ele é herdado pelos filhos no fork()."""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    listener.set_inheritable(True)
+    return listener
+
+
+# Função executada em cada processo de trabalho
+def run_worker(listener, host, port, threaded):
+    """Atende requisições no socket herdado até receber SIGTERM."""
+    # Ctrl+C é tratado pelo processo principal, que encerra os filhos com SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = make_server(host, port, app, threaded=threaded, fd=listener.fileno())
+    server.serve_forever()
+
+
+# Função para criar um processo de trabalho e retornar seu PID
+def spawn_worker(listener, host, port, threaded):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(listener, host, port, threaded)
+        finally:
+            os._exit(0) # Nunca retorna ao laço do processo principal
+    return pid
+
+
+# Função principal: pré-carrega os dados, cria os processos de trabalho e os supervisiona
+def serve(host='127.0.0.1', port=8000, workers=2, threaded=False):
+    if not hasattr(os, 'fork'):
+        # Plataformas sem fork() (ex.: Windows) usam um único processo
+        print("fork() indisponível nesta plataforma; iniciando um único processo.")
+        make_server(host, port, app, threaded=True).serve_forever()
+        return
+
+    if not recommender.preload_for_fork():
+        print("Aviso: dataset de reviews vazio; as recomendações retornarão erro.")
+
+    listener = open_listener(host, port)
+    children = {spawn_worker(listener, host, port, threaded) for _ in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Servindo em http://{host}:{port} com {workers} processo(s) (PID principal {os.getpid()})", flush=True)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Processo {pid} terminou (status {status}); criando um substituto.", flush=True)
+            children.add(spawn_worker(listener, host, port, threaded))
+    listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Número de processos de trabalho (padrão: número de CPUs)')
+    parser.add_argument('--threads', action='store_true',
+                        help='Atende cada requisição em uma thread dentro de cada processo')
+    parser.add_argument('--cache-entries', type=int, default=None,
+                        help='Limite de entradas do cache de resultados de cada processo (0 desativa)')
+    parser.add_argument('--no-metrics', action='store_true',
+                        help='Desativa a coleta das métricas de latência e de candidatos (src.metrics)')
+    parser.add_argument('--profile-slow-ms', type=float, default=None,
+                        help='Grava as pilhas amostradas (formato collapsed) das requisições mais lentas que este limite')
+    args = parser.parse_args()
+
+    metrics.ENABLED = not args.no_metrics
+    enable_slow_request_profile(args.profile_slow_ms)
+
+    if args.cache_entries is not None:
+        recommendation_cache.max_entries = args.cache_entries
+    serve(args.host, args.port, max(1, args.workers), args.threads)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
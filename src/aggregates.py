@@ -0,0 +1,90 @@
+import pandas as pd
+
+from src.review_store import plain_numeric
+
+# Tabela agregada de avaliações, construída uma única vez na carga dos dados.
+# Cada linha resume todas as reviews de uma oferta (produto, produtor, local, orgânico, coordenadas),
+# de modo que as recomendações trabalham com O(#ofertas) linhas em vez de O(#reviews).
+
+# Colunas que identificam uma oferta na tabela agregada
+AGGREGATE_KEYS = ['produto', 'nome_produtor', 'local', 'organico', 'latitude', 'longitude']
+
+
+# Função para construir a tabela agregada a partir do DataFrame de reviews
+def build_aggregate_table(df_reviews):
+    """
+    Agrupa as reviews por oferta e calcula 'contagem', 'soma_avaliacao' e 'media_avaliacao'.
+    As ofertas mantêm a ordem da primeira ocorrência nas reviews, preservando o critério
+    'keep first' usado nas deduplicações do motor de recomendação.
+    """
+    columns = AGGREGATE_KEYS + ['contagem', 'soma_avaliacao', 'media_avaliacao']
+    if df_reviews is None or df_reviews.empty or not set(AGGREGATE_KEYS + ['avaliacao']) <= set(df_reviews.columns):
+        return pd.DataFrame(columns=columns)
+
+    aggregates = (
+        df_reviews.groupby(AGGREGATE_KEYS, sort=False, dropna=False, observed=True)['avaliacao']
+        .agg(contagem='size', soma_avaliacao='sum')
+        .reset_index()
+    )
+    # Chaves e somas no esquema compacto das reviews (int8, bool, coordenadas internadas) voltam aos tipos usuais
+    aggregates = plain_numeric(aggregates, ['organico', 'latitude', 'longitude', 'contagem', 'soma_avaliacao'])
+    aggregates['media_avaliacao'] = aggregates['soma_avaliacao'] / aggregates['contagem']
+    return aggregates[columns]
+
+
+# Função para calcular médias ponderadas a partir de somas e contagens agregadas
+def weighted_mean(aggregates, by):
+    """
+    Retorna, para cada linha de 'aggregates', a média de avaliação do grupo definido por 'by',
+    equivalente à média sobre as reviews originais do grupo (soma total / contagem total).
+    """
+    grouped = aggregates.groupby(by, sort=False, dropna=False, observed=True)
+    return grouped['soma_avaliacao'].transform('sum') / grouped['contagem'].transform('sum')
+
+
+# Função para somar as agregações de um novo lote de reviews à tabela agregada existente
+def merge_aggregate_tables(aggregates, batch_aggregates):
+    """
+    Retorna uma nova tabela agregada com as contagens e somas do lote acrescentadas (a original não é alterada).
+    Ofertas já existentes mantêm sua posição; ofertas novas entram no final, na ordem em que aparecem no lote,
+    como aconteceria em build_aggregate_table sobre todas as reviews. O custo depende do número de ofertas,
+    e não do número total de reviews.
+    Colunas categóricas mantêm suas categorias (e códigos); valores novos são acrescentados ao final.
+    """
+    if batch_aggregates.empty:
+        return aggregates
+    columns = AGGREGATE_KEYS + ['contagem', 'soma_avaliacao', 'media_avaliacao']
+    if aggregates.empty:
+        return batch_aggregates[columns].reset_index(drop=True)
+
+    def offer_keys(df):
+        return pd.MultiIndex.from_frame(df[AGGREGATE_KEYS].astype(object))
+
+    positions = offer_keys(aggregates).get_indexer(offer_keys(batch_aggregates))
+    found = positions >= 0
+
+    merged = aggregates[columns].copy()
+    counts = merged['contagem'].to_numpy(dtype='int64').copy()
+    sums = merged['soma_avaliacao'].to_numpy(dtype='int64').copy()
+    counts[positions[found]] += batch_aggregates['contagem'].to_numpy(dtype='int64')[found]
+    sums[positions[found]] += batch_aggregates['soma_avaliacao'].to_numpy(dtype='int64')[found]
+    merged['contagem'], merged['soma_avaliacao'] = counts, sums
+
+    new_offers = batch_aggregates.loc[~found, columns]
+    if len(new_offers):
+        categorical = {
+            column: merged[column].dtype for column in AGGREGATE_KEYS
+            if isinstance(merged[column].dtype, pd.CategoricalDtype)
+        }
+        merged = pd.concat([merged.astype({c: object for c in categorical}), new_offers.astype(object)], ignore_index=True)
+        for column, dtype in categorical.items():
+            known = list(dtype.categories)
+            unseen = sorted(set(merged[column].dropna()) - set(known))
+            merged[column] = pd.Categorical(merged[column], categories=known + unseen)
+        for column in ['organico', 'contagem', 'soma_avaliacao']:
+            merged[column] = merged[column].astype('int64')
+        for column in ['latitude', 'longitude']:
+            merged[column] = merged[column].astype(float)
+
+    merged['media_avaliacao'] = merged['soma_avaliacao'] / merged['contagem']
+    return merged
@@ -0,0 +1,203 @@
+import time
+
+import numpy as np
+
+# Otimizador de cesta: poucos produtores (próximos e bem avaliados) que, juntos, cobrem uma lista de compras.
+# Cada parada é um produtor em um local. O custo de uma solução (conjunto de paradas) é
+#     Σ paradas (custo fixo + peso da distância x km) + Σ produtos (custo da melhor oferta escolhida, ou penalidade)
+# onde o custo de uma oferta é 1 - qualidade (avaliação normalizada e status orgânico, src.scoring) e a
+# penalidade vale para produtos da lista que nenhuma parada escolhida cobre.
+# Os produtos que cada parada oferece ficam em bitsets (um bit por produto da lista, empacotados em bytes).
+# A busca começa por uma solução gulosa (acrescenta a parada que mais reduz o custo, depois remove as que
+# não compensam), melhorada por trocas de paradas, e segue com branch-and-bound até esgotar o orçamento de
+# tempo: o resultado é sempre a melhor solução encontrada, e 'optimal' indica se a busca terminou
+# (ótimo entre as paradas candidatas).
+
+# Custo fixo de cada parada (produtor visitado), na escala do custo das ofertas (0 a 1 por produto)
+STOP_COST = 0.5
+
+# Custo por km de distância entre o usuário e a parada
+DISTANCE_WEIGHT = 0.05
+
+# Custo de deixar um produto da lista sem nenhuma parada que o ofereça
+MISSING_PENALTY = 3.0
+
+# Orçamento de tempo do branch-and-bound (segundos)
+TIME_BUDGET_SECONDS = 0.05
+
+# Paradas candidatas mantidas por produto (as de menor custo de oferta + parada); as demais são descartadas
+CANDIDATES_PER_PRODUCT = 16
+
+# Quantidade de bits ligados em cada byte (contagem de bits dos bitsets)
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+
+
+# Função para empacotar uma matriz booleana paradas x produtos em bitsets (bytes por parada)
+def pack_bitsets(coverage):
+    return np.packbits(np.asarray(coverage, dtype=bool), axis=-1)
+
+
+# Função para contar, em cada bitset, os bits também ligados em 'mask'
+def count_common(bitsets, mask):
+    return POPCOUNT[bitsets & mask].sum(axis=-1)
+
+
+# Função para escolher as paradas candidatas (as melhores de cada produto)
+def candidate_stops(offer_costs, stop_costs, per_product=CANDIDATES_PER_PRODUCT):
+    """Retorna os índices das paradas que estão entre as 'per_product' de menor custo para algum produto."""
+    total = offer_costs + stop_costs[:, None]
+    if len(total) <= per_product:
+        return np.flatnonzero(np.isfinite(total).any(axis=1))
+    best = np.argpartition(total, per_product - 1, axis=0)[:per_product]
+    keep = np.zeros(len(total), dtype=bool)
+    keep[best.ravel()] = True
+    return np.flatnonzero(keep & np.isfinite(total).any(axis=1))
+
+
+# Função para calcular o custo de uma solução
+def solution_cost(chosen, offer_costs, stop_costs, missing_penalty):
+    """Retorna (custo total, custo de cada produto) do conjunto de paradas 'chosen'."""
+    product_costs = np.full(offer_costs.shape[1], float(missing_penalty))
+    if len(chosen):
+        product_costs = np.minimum(product_costs, offer_costs[list(chosen)].min(axis=0))
+    return float(stop_costs[list(chosen)].sum() + product_costs.sum()), product_costs
+
+
+# Função para obter uma solução gulosa
+def greedy_basket(offer_costs, stop_costs, missing_penalty=MISSING_PENALTY, max_stops=None):
+    """
+    Acrescenta, a cada passo, a parada que mais reduz o custo total (enquanto houver redução e o limite
+    'max_stops' permitir) e, no fim, remove as paradas cuja retirada reduz o custo. Retorna a lista de paradas.
+    """
+    n_stops = len(stop_costs)
+    max_stops = n_stops if max_stops is None else max_stops
+    current = np.full(offer_costs.shape[1], float(missing_penalty))
+    chosen = []
+    available = np.ones(n_stops, dtype=bool)
+    while len(chosen) < max_stops and available.any():
+        savings = np.maximum(current[None, :] - offer_costs, 0).sum(axis=1)
+        deltas = np.where(available, stop_costs - savings, np.inf)
+        best = int(np.argmin(deltas))
+        if not deltas[best] < 0:
+            break
+        chosen.append(best)
+        available[best] = False
+        current = np.minimum(current, offer_costs[best])
+
+    # Remoção: paradas cujos produtos outras paradas escolhidas já cobrem quase tão bem
+    cost = solution_cost(chosen, offer_costs, stop_costs, missing_penalty)[0]
+    for stop in list(chosen):
+        reduced = [other for other in chosen if other != stop]
+        reduced_cost = solution_cost(reduced, offer_costs, stop_costs, missing_penalty)[0]
+        if reduced_cost < cost:
+            chosen, cost = reduced, reduced_cost
+    return chosen
+
+
+# Função para melhorar uma solução por trocas (busca local)
+def improve_basket(chosen, offer_costs, stop_costs, missing_penalty=MISSING_PENALTY):
+    """Substitui uma parada escolhida pela que mais reduz o custo sem ela, enquanto alguma troca reduzir o custo."""
+    chosen = list(chosen)
+    cost = solution_cost(chosen, offer_costs, stop_costs, missing_penalty)[0]
+    improved = True
+    while improved:
+        improved = False
+        for stop in list(chosen):
+            reduced = [other for other in chosen if other != stop]
+            reduced_cost, current = solution_cost(reduced, offer_costs, stop_costs, missing_penalty)
+            savings = np.maximum(current[None, :] - offer_costs, 0).sum(axis=1)
+            deltas = stop_costs - savings
+            deltas[reduced] = np.inf
+            replacement = int(np.argmin(deltas))
+            if reduced_cost + deltas[replacement] < cost - 1e-12:
+                chosen, cost = reduced + [replacement], reduced_cost + deltas[replacement]
+                improved = True
+    return chosen
+
+
+# Função para otimizar a cesta (guloso + branch-and-bound com orçamento de tempo)
+def optimize_basket(offer_costs, stop_costs, missing_penalty=MISSING_PENALTY, max_stops=None,
+                    time_budget=TIME_BUDGET_SECONDS):
+    """
+    - offer_costs: matriz paradas x produtos com o custo da melhor oferta de cada par (inf = não oferece).
+    - stop_costs: custo de cada parada (custo fixo + distância).
+    Retorna {'stops': paradas escolhidas, 'assignment': parada de cada produto (-1 = não coberto),
+    'cost': custo total, 'optimal': se a busca terminou dentro do orçamento, 'nodes': nós visitados,
+    'lower_bound': limite inferior do custo entre as paradas candidatas}.
+
+    O branch-and-bound decide um produto por nível: ou ele fica com o custo atual (melhor parada já escolhida,
+    ou a penalidade), ou uma nova parada que o oferece mais barato é acrescentada. O limite inferior de cada
+    produto ainda não decidido é o menor entre o custo atual e, para cada parada ainda não escolhida,
+    custo da oferta + custo da parada dividido pelos produtos não decididos que ela cobre (contados pelos bitsets).
+    """
+    offer_costs = np.asarray(offer_costs, dtype=float)
+    stop_costs = np.asarray(stop_costs, dtype=float)
+    n_products = offer_costs.shape[1]
+    max_stops = len(stop_costs) if max_stops is None else max_stops
+    deadline = time.perf_counter() + time_budget
+
+    # A solução gulosa usa todas as paradas; a busca só considera as candidatas (incluindo as da gulosa),
+    # e os índices são convertidos de volta no final
+    greedy = greedy_basket(offer_costs, stop_costs, missing_penalty, max_stops)
+    candidates = np.union1d(candidate_stops(offer_costs, stop_costs), greedy).astype(np.int64)
+    costs, stop_cost = offer_costs[candidates], stop_costs[candidates]
+    bitsets = pack_bitsets(np.isfinite(costs))
+
+    greedy = improve_basket([int(np.searchsorted(candidates, stop)) for stop in greedy], costs, stop_cost, missing_penalty)
+    best = {'cost': solution_cost(greedy, costs, stop_cost, missing_penalty)[0], 'stops': greedy}
+    stats = {'nodes': 0, 'complete': True}
+
+    def search(chosen, current, undecided, fixed_cost):
+        if stats['nodes'] and time.perf_counter() > deadline: # A raiz sempre é avaliada (limite inferior)
+            stats['complete'] = False
+            return
+        stats['nodes'] += 1
+        open_products = np.flatnonzero(undecided)
+        bound_terms = current[open_products]
+        amortized = None
+        if len(chosen) < max_stops and len(open_products):
+            covered = count_common(bitsets, pack_bitsets(undecided))
+            covered[chosen] = 0
+            share = np.where(covered > 0, stop_cost / np.maximum(covered, 1), np.inf)
+            amortized = costs[:, open_products] + share[:, None]
+            bound_terms = np.minimum(bound_terms, amortized.min(axis=0))
+        bound = fixed_cost + bound_terms.sum()
+        stats.setdefault('lower_bound', min(bound, best['cost'])) # Limite da raiz: nenhuma solução custa menos
+        if bound >= best['cost'] - 1e-12:
+            return
+
+        gaps = current[open_products] - bound_terms
+        if not len(open_products) or gaps.max() <= 0:
+            # Nenhuma parada nova reduz o limite: manter os custos atuais é o melhor desta subárvore
+            total = solution_cost(chosen, costs, stop_cost, missing_penalty)[0]
+            if total < best['cost']:
+                best['cost'], best['stops'] = total, list(chosen)
+            return
+
+        # Ramifica no produto com a maior diferença entre o custo atual e o limite inferior
+        column = int(np.argmax(gaps))
+        product = open_products[column]
+        remaining = undecided.copy()
+        remaining[product] = False
+        options = np.flatnonzero(costs[:, product] < current[product])
+        options = options[~np.isin(options, chosen)]
+        options = options[np.argsort(amortized[options, column], kind='stable')]
+        for stop in options:
+            search(chosen + [int(stop)], np.minimum(current, costs[stop]), remaining,
+                   fixed_cost + stop_cost[stop] + costs[stop, product])
+            if not stats['complete']:
+                return
+        search(chosen, current, remaining, fixed_cost + current[product])
+
+    search([], np.full(n_products, float(missing_penalty)), np.ones(n_products, dtype=bool), 0.0)
+
+    stops = candidates[best['stops']]
+    assignment = np.full(n_products, -1, dtype=np.int64)
+    if len(stops):
+        stop_offers = offer_costs[stops]
+        best_stop = np.argmin(stop_offers, axis=0)
+        covered = stop_offers[best_stop, np.arange(n_products)] < missing_penalty
+        assignment[covered] = stops[best_stop[covered]]
+    return {'stops': [int(stop) for stop in stops], 'assignment': assignment, 'cost': best['cost'],
+            'optimal': stats['complete'], 'nodes': stats['nodes'],
+            'lower_bound': best['cost'] if stats['complete'] else stats['lower_bound']}
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Cache de resultados de recomendação.
+# A chave é a consulta normalizada: tipo, filtros (listas ordenadas), preferência por orgânicos e
+# latitude/longitude arredondadas para uma grade configurável. Só a chave é arredondada: o resultado é
+# calculado a partir da posição real do primeiro usuário da célula e reaproveitado pelos demais (o app
+# recalcula a distância das linhas retornadas a partir da posição de cada um).
+# A remoção é LRU com limite de entradas, e cada entrada expira após 'ttl_seconds'.
+
+
+class RecommendationCache:
+    """Cache LRU com TTL, seguro para várias threads, com contadores de acertos e falhas."""
+
+    def __init__(self, max_entries=1024, ttl_seconds=300, grid_size_deg=0.01):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.grid_size_deg = grid_size_deg # Tamanho da célula em graus (0.01° ~ 1,1 km); 0 desativa o arredondamento
+        self.entries = OrderedDict() # chave -> (instante de expiração, valor)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def quantize(self, latitude, longitude):
+        """Arredonda as coordenadas para o centro da célula da grade."""
+        if not self.grid_size_deg:
+            return latitude, longitude
+        grid = self.grid_size_deg
+        return round(round(latitude / grid) * grid, 6), round(round(longitude / grid) * grid, 6)
+
+    def make_key(self, rec_type, filters_key, latitude, longitude, organic_preference):
+        """Monta a chave da consulta normalizada (as coordenadas já devem estar arredondadas)."""
+        return (rec_type, filters_key, latitude, longitude, organic_preference)
+
+    def get(self, key):
+        """Retorna o valor em cache ou None (entradas expiradas contam como falha e são removidas)."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key) # Marca como usada recentemente
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    @property
+    def generation(self):
+        """Geração do cache: muda a cada clear(). Capturada antes de um cálculo, é passada a put()."""
+        return self.invalidations
+
+    def put(self, key, value, generation=None):
+        """
+        Armazena um valor, removendo as entradas menos usadas se o limite for excedido.
+        Com 'generation', o valor é descartado (retorna False) se o cache foi invalidado desde aquela geração:
+        um resultado calculado com os dados antigos não volta ao cache depois de um clear().
+        """
+        with self.lock:
+            if generation is not None and generation != self.invalidations:
+                return False
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        """Invalida todas as entradas (ex.: quando o dataset de reviews é recarregado)."""
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """Retorna os contadores do cache, úteis para ajustar o tamanho da grade."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'ttl_seconds': self.ttl_seconds,
+                'grid_size_deg': self.grid_size_deg,
+            }
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+
+import joblib
+import pandas as pd
+
+from src.geolocation import IpRangeTable
+from src.review_store import load_reviews
+
+# Contexto de dados compartilhado entre o app e o motor de recomendação.
+# Cada artefato (pickle de recursos, parquet de reviews, listas JSON) é carregado uma única vez,
+# apenas quando alguma rota precisa dele, e fica disponível por referência para todos os módulos.
+# reload() descarta os artefatos carregados e avisa os interessados (ex.: o motor, que reconstrói seus índices).
+
+DEFAULT_DATA_DIR = './data'
+
+
+class DataContext:
+    """Carregamento preguiçoso (lazy) e único dos artefatos em 'data_dir'."""
+
+    def __init__(self, data_dir=DEFAULT_DATA_DIR):
+        self.data_dir = data_dir
+        self.version = 0          # Incrementada a cada reload()
+        self.reload_listeners = [] # Funções chamadas após cada reload()
+        self._artifacts = {}
+        self._discards = {}       # Artefato -> quantas vezes foi descartado (um carregamento em curso não é publicado)
+        self._loader_locks = {}   # Artefato -> lock do seu carregamento
+        self._lock = threading.RLock() # Protege apenas os dicionários; nunca fica retido durante um carregamento
+
+    def path(self, *parts):
+        return os.path.join(self.data_dir, *parts)
+
+    def get_artifact(self, name, loader):
+        """
+        Retorna o artefato 'name', carregando-o com 'loader' na primeira vez (uma única vez entre threads).
+        Outros módulos também registram seus artefatos derivados aqui, para que sejam descartados em reload().
+        Cada artefato tem o seu lock de carregamento: um loader lento (ou que espera locks do motor) não bloqueia
+        o carregamento dos demais artefatos nem discard_artifact()/reload(). Se o artefato for descartado durante
+        o carregamento, o valor carregado é retornado a quem o pediu, mas não fica guardado.
+        """
+        try:
+            return self._artifacts[name]
+        except KeyError:
+            pass
+        with self._lock:
+            loader_lock = self._loader_locks.setdefault(name, threading.RLock())
+        with loader_lock:
+            with self._lock:
+                if name in self._artifacts:
+                    return self._artifacts[name]
+                state = (self.version, self._discards.get(name, 0))
+            value = loader()
+            with self._lock:
+                if state == (self.version, self._discards.get(name, 0)):
+                    self._artifacts[name] = value
+            return value
+
+    def _load_json(self, *parts):
+        with open(self.path(*parts), 'r') as f:
+            return json.load(f)
+
+    def discard_artifact(self, name):
+        """Descarta um artefato derivado (será recarregado no próximo acesso), sem alterar a versão do contexto."""
+        with self._lock:
+            self._artifacts.pop(name, None)
+            self._discards[name] = self._discards.get(name, 0) + 1
+
+    def replace_artifact(self, name, value):
+        """
+        Troca um artefato já carregado por uma versão nova (ex.: reconstruída em segundo plano).
+        Retorna False, sem guardar 'value', se o artefato não estiver carregado (ex.: descartado por reload()).
+        """
+        with self._lock:
+            if name not in self._artifacts:
+                return False
+            self._artifacts[name] = value
+            return True
+
+    def is_loaded(self, name):
+        """Indica se o artefato já foi carregado (útil para medir o que cada rota realmente usou)."""
+        return name in self._artifacts
+
+    @property
+    def resources(self):
+        """Dicionário completo de 'full_resources.pkl' (inclui o NearestNeighbors e os LabelEncoders)."""
+        return self.get_artifact('resources', lambda: joblib.load(self.path('model', 'full_resources.pkl')))
+
+    @property
+    def reviews(self):
+        """
+        DataFrame de reviews com produto/produtor/local categóricos.
+        Os códigos vêm das colunas '*_id' do parquet, iguais às dos encoders, sem desserializar o pickle.
+        """
+        return self.get_artifact('reviews', lambda: load_reviews(self.reviews_path))
+
+    @property
+    def reviews_path(self):
+        """Parquet base de reviews (os lotes ingeridos depois dele ficam em 'segments_dir')."""
+        return self.path('datasets', 'df_full_reviews.parquet')
+
+    @property
+    def segments_dir(self):
+        """Diretório dos segmentos append-only de reviews ingeridas (src.review_segments)."""
+        return self.path('datasets', 'segments')
+
+    @property
+    def producers(self):
+        """Catálogo de ofertas (produto, produtor, local, orgânico, coordenadas) usado na ingestão de reviews."""
+        return self.get_artifact('producers', lambda: pd.read_parquet(self.path('datasets', 'producers.parquet')))
+
+    @property
+    def products_list(self):
+        """Lista de produtos exibida no formulário (lida do JSON, sem carregar o pickle)."""
+        return self.get_artifact('products_list', lambda: self._load_json('json', 'products_list.json'))
+
+    @property
+    def producers_ra(self):
+        """Produtores e suas Regiões Administrativas."""
+        return self.get_artifact('producers_ra', lambda: self._load_json('json', 'producers_ra.json'))
+
+    @property
+    def locations(self):
+        """Coordenadas (centroides) de cada Região Administrativa."""
+        return self.get_artifact('locations', lambda: self._load_json('json', 'locations.json'))
+
+    @property
+    def ip_ranges(self):
+        """Faixas de IP -> RA da geolocalização offline (tabela vazia se o arquivo não existir)."""
+        return self.get_artifact('ip_ranges', lambda: IpRangeTable.from_csv(self.path('datasets', 'ip_ranges.csv')))
+
+    def reload(self):
+        """
+        Descarta os artefatos carregados (serão relidos do disco no próximo acesso)
+        e notifica os interessados, para troca dos dados sem reiniciar o processo.
+        """
+        with self._lock:
+            self._artifacts = {}
+            self.version += 1
+        for listener in self.reload_listeners:
+            listener()
+
+
+# Instância única, compartilhada por referência entre app.py e recommender_engine
+context = DataContext()
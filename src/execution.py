@@ -0,0 +1,134 @@
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# Limite e agrupamento dos cálculos do motor.
+# Um conjunto limitado de threads de trabalho consome uma fila de tamanho máximo fixo; com a fila cheia,
+# o pedido é recusado na hora (a rota responde 429 com Retry-After) em vez de acumular requisições à espera.
+# A thread da requisição continua esperando o resultado (future.result) durante todo o cálculo: o conjunto
+# não libera as threads do servidor, apenas limita quantos cálculos rodam ao mesmo tempo e agrupa os idênticos.
+# Pedidos com a mesma chave (a consulta normalizada do cache de resultados) enquanto um cálculo está na fila
+# ou em andamento recebem o mesmo Future ("single-flight"): N clientes idênticos custam um único cálculo e
+# não ocupam posições na fila. A chave deixa de ser compartilhada assim que o cálculo termina; pedidos
+# seguintes são respondidos pelo cache de resultados, preenchido pela própria função calculada.
+# Cada processo de trabalho (serve.py) tem o seu conjunto, criado no primeiro uso (depois do fork).
+
+# Threads de trabalho por processo
+COMPUTE_WORKERS = 2
+
+# Cálculos distintos aguardando na fila, além dos em andamento
+COMPUTE_MAX_QUEUE = 32
+
+# Peso de cada novo cálculo na média móvel da duração (usada no Retry-After)
+DURATION_SMOOTHING = 0.2
+
+# Limites (segundos) do Retry-After sugerido
+RETRY_AFTER_MIN_SECONDS = 1
+RETRY_AFTER_MAX_SECONDS = 30
+
+
+class ComputePool:
+    """Threads de trabalho com fila limitada e agrupamento de pedidos idênticos em andamento."""
+
+    def __init__(self, workers=COMPUTE_WORKERS, max_queue=COMPUTE_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max(1, max_queue)
+        self.queue = queue.Queue(maxsize=max(1, max_queue)) # maxsize=0 seria uma fila sem limite
+        self.inflight = {} # chave -> Future do cálculo na fila ou em andamento
+        self.lock = threading.Lock()
+        self.threads = []
+        self.average_seconds = None # Média móvel da duração dos cálculos
+        self.counts = {'submitted': 0, 'coalesced': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+
+    def submit(self, key, function, *args):
+        """
+        Agenda function(*args) e retorna seu Future; se já houver um cálculo com a mesma chave na fila ou em
+        andamento, retorna o Future dele. Com key=None o pedido nunca é agrupado.
+        Retorna None se a fila estiver cheia (ver retry_after()). Durante o cálculo, 'future.thread_ident' é o id
+        da thread que o executa (usado pelo perfil de requisições lentas, metrics.SlowRequestProfiler.delegate).
+        """
+        with self.lock:
+            if key is not None:
+                future = self.inflight.get(key)
+                if future is not None:
+                    self.counts['coalesced'] += 1
+                    return future
+            # Threads criadas no primeiro uso (em cada processo de trabalho, depois do fork); daemon, para não
+            # atrasar o encerramento do processo
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.worker, name='compute', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+            future = Future()
+            future.thread_ident = None
+            try:
+                self.queue.put_nowait((future, function, args))
+            except queue.Full:
+                self.counts['rejected'] += 1
+                return None
+            self.counts['submitted'] += 1
+            if key is not None:
+                self.inflight[key] = future
+        if key is not None:
+            # Fora do lock: se o cálculo já terminou, o callback roda imediatamente nesta thread
+            future.add_done_callback(lambda done: self.release(key, done))
+        return future
+
+    def release(self, key, future):
+        """Deixa de compartilhar a chave (se ela ainda pertencer a este cálculo)."""
+        with self.lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def forget(self):
+        """Descarta as chaves em andamento (ex.: dados recarregados); os cálculos em curso terminam normalmente."""
+        with self.lock:
+            self.inflight.clear()
+
+    def worker(self):
+        """Laço de cada thread de trabalho: executa os cálculos da fila."""
+        while True:
+            future, function, args = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.perf_counter()
+            future.thread_ident = threading.get_ident()
+            try:
+                result = function(*args)
+            except BaseException as e:
+                outcome = 'failed'
+                future.thread_ident = None
+                future.set_exception(e)
+            else:
+                outcome = 'completed'
+                future.thread_ident = None
+                future.set_result(result)
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.counts[outcome] += 1
+                if self.average_seconds is None:
+                    self.average_seconds = elapsed
+                else:
+                    self.average_seconds += DURATION_SMOOTHING * (elapsed - self.average_seconds)
+
+    def retry_after(self):
+        """Segundos sugeridos até uma nova tentativa: tempo estimado para esvaziar a fila atual."""
+        average = self.average_seconds or 0.0
+        estimate = math.ceil((self.queue.qsize() + self.workers) * average / self.workers)
+        return min(max(estimate, RETRY_AFTER_MIN_SECONDS), RETRY_AFTER_MAX_SECONDS)
+
+    def stats(self):
+        """Tamanho da fila, chaves em andamento, contadores e duração média dos cálculos."""
+        with self.lock:
+            counts, inflight, average = dict(self.counts), len(self.inflight), self.average_seconds
+        return {
+            'workers': self.workers,
+            'queue_depth': self.queue.qsize(),
+            'max_queue': self.max_queue,
+            'inflight_keys': inflight,
+            'average_ms': round(average * 1000, 3) if average is not None else None,
+            **counts,
+        }
@@ -0,0 +1,313 @@
+import csv
+import ipaddress
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from bisect import bisect_right
+
+from src.cache import RecommendationCache
+
+# Geolocalização do usuário pelo IP (rota '/get_location') sem acesso à rede na thread da requisição.
+# O resolvedor padrão é offline: uma tabela de faixas de IP -> RA ('datasets/ip_ranges.csv', colunas 'rede'
+# em notação CIDR e 'ra'), guardada em arrays ordenados pelo início de cada faixa e consultada por bisect;
+# a RA vira coordenadas pelo centroide de 'locations.json'. As faixas de uma mesma versão de IP não se sobrepõem.
+# As respostas (inclusive "não encontrado") ficam em um cache LRU com TTL por prefixo (/24 no IPv4, /48 no IPv6).
+# (faixas menores que esses prefixos compartilham a resposta do primeiro IP consultado no prefixo).
+# Um resolvedor remoto opcional (ex.: um serviço HTTP de GeoIP) só é consultado em segundo plano, em um pool
+# pequeno, com timeout e um disjuntor (circuit breaker): a requisição que não encontra o IP recebe o fallback
+# (Brasília) na hora, e o resultado remoto passa a responder as próximas requisições do mesmo prefixo.
+
+# Localização padrão (Brasília) para IPs locais, inválidos ou não encontrados
+FALLBACK_LATITUDE, FALLBACK_LONGITUDE = -15.7942, -47.8822
+
+# Cache das respostas por prefixo de IP
+CACHE_MAX_ENTRIES = 65536
+CACHE_TTL_SECONDS = 3600
+
+# Tamanho dos prefixos que compartilham a mesma entrada do cache
+IPV4_CACHE_PREFIX = 24
+IPV6_CACHE_PREFIX = 48
+
+# Resolvedor remoto: timeout de cada consulta, threads do pool e limite de consultas pendentes
+REMOTE_TIMEOUT_SECONDS = 1.0
+REMOTE_WORKERS = 2
+REMOTE_MAX_PENDING = 256
+
+# Disjuntor do resolvedor remoto: falhas seguidas para abrir e tempo aberto antes de uma nova tentativa
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 60.0
+
+
+class IpRangeTable:
+    """Faixas de IP -> RA em arrays ordenados (um conjunto por versão de IP), consultadas por bisect."""
+
+    def __init__(self, rows=()):
+        ranges = {4: [], 6: []}
+        for network, ra in rows:
+            network = ipaddress.ip_network(network, strict=False)
+            ranges[network.version].append((int(network.network_address), int(network.broadcast_address), ra))
+        self.starts, self.ends, self.ras = {}, {}, {}
+        for version, entries in ranges.items():
+            entries.sort()
+            self.starts[version] = [start for start, _, _ in entries]
+            self.ends[version] = [end for _, end, _ in entries]
+            self.ras[version] = [ra for _, _, ra in entries]
+
+    @classmethod
+    def from_csv(cls, path):
+        """Lê a tabela de um CSV com as colunas 'rede' e 'ra'; sem o arquivo, retorna uma tabela vazia."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r', newline='') as f:
+            return cls((row['rede'], row['ra']) for row in csv.DictReader(f))
+
+    def __len__(self):
+        return sum(len(starts) for starts in self.starts.values())
+
+    def lookup(self, address):
+        """Retorna a RA da faixa que contém o endereço (objeto de ipaddress), ou None."""
+        value = int(address)
+        starts = self.starts[address.version]
+        position = bisect_right(starts, value) - 1
+        if position >= 0 and value <= self.ends[address.version][position]:
+            return self.ras[address.version][position]
+        return None
+
+
+class OfflineResolver:
+    """Resolvedor padrão: tabela de faixas de IP -> RA e centroides das RAs (lidos por funções, a cada consulta)."""
+
+    name = 'offline'
+
+    def __init__(self, table, locations):
+        self.table = table         # Função que retorna a IpRangeTable atual (ex.: lambda: context.ip_ranges)
+        self.locations = locations # Função que retorna {RA: [latitude, longitude]}
+
+    def resolve(self, address):
+        ra = self.table().lookup(address)
+        coordinates = self.locations().get(ra) if ra is not None else None
+        if coordinates is None:
+            return None
+        return coordinates[0], coordinates[1], ra
+
+
+class StubResolver:
+    """
+    Resolvedor local para testes e benchmarks: {rede ou IP: (latitude, longitude, ra)}.
+    'delay' simula a latência de um serviço remoto e 'fail' faz toda consulta levantar uma exceção.
+    """
+
+    name = 'stub'
+
+    def __init__(self, entries=None, delay=0.0, fail=False):
+        self.entries = [(ipaddress.ip_network(network, strict=False), value) for network, value in (entries or {}).items()]
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def resolve(self, address):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError('Falha simulada do resolvedor')
+        for network, value in self.entries:
+            if address.version == network.version and address in network:
+                return value
+        return None
+
+
+class RemoteResolver:
+    """
+    Resolvedor HTTP: 'url_template' com '{ip}' (ex.: 'http://ip-api.com/json/{ip}') retornando um JSON
+    com as coordenadas nos campos 'latitude_field' e 'longitude_field'. Bloqueia: só é chamado em segundo plano.
+    """
+
+    name = 'remote'
+
+    def __init__(self, url_template, timeout=REMOTE_TIMEOUT_SECONDS, latitude_field='lat', longitude_field='lon'):
+        self.url_template = url_template
+        self.timeout = timeout
+        self.latitude_field = latitude_field
+        self.longitude_field = longitude_field
+
+    def resolve(self, address):
+        with urllib.request.urlopen(self.url_template.format(ip=address), timeout=self.timeout) as response:
+            data = json.load(response)
+        latitude, longitude = data.get(self.latitude_field), data.get(self.longitude_field)
+        if latitude is None or longitude is None:
+            return None
+        return float(latitude), float(longitude), None
+
+
+class CircuitBreaker:
+    """
+    Disjuntor: abre após 'failure_threshold' falhas seguidas e, passados 'reset_seconds', deixa passar
+    uma única consulta de teste (meio aberto); um sucesso fecha o disjuntor e uma falha o abre de novo.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_seconds else 'open'
+
+    def allow(self):
+        """Indica se uma consulta pode ser feita agora."""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+# Função para obter a chave do cache de um endereço: (versão, prefixo que o contém como inteiro)
+def cache_prefix(address):
+    if address.version == 4:
+        return 4, int(address) >> (32 - IPV4_CACHE_PREFIX)
+    return 6, int(address) >> (128 - IPV6_CACHE_PREFIX)
+
+
+# Função para montar a resposta de '/get_location'
+def location_response(latitude, longitude, source, ra=None, message=None):
+    response = {'latitude': latitude, 'longitude': longitude, 'ra': ra, 'source': source}
+    if message:
+        response['message'] = message
+    return response
+
+
+class Geolocator:
+    """
+    Resolve IPs a partir da memória: cache por prefixo e resolvedores locais ('resolvers', em ordem).
+    O resolvedor 'remote', se houver, é consultado apenas em segundo plano, protegido pelo disjuntor.
+    """
+
+    def __init__(self, resolvers, remote=None, cache=None, remote_timeout=REMOTE_TIMEOUT_SECONDS,
+                 remote_workers=REMOTE_WORKERS, max_pending=REMOTE_MAX_PENDING, breaker=None):
+        self.resolvers = list(resolvers)
+        self.remote = remote
+        self.cache = cache or RecommendationCache(max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, grid_size_deg=0)
+        self.remote_timeout = remote_timeout
+        self.remote_workers = remote_workers
+        self.max_pending = max_pending
+        self.breaker = breaker or CircuitBreaker()
+        self.pending = set() # Prefixos com consulta remota na fila ou em andamento
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.workers = []
+        self.remote_results = {'success': 0, 'not_found': 0, 'failure': 0, 'timeout': 0, 'rejected': 0}
+
+    def locate(self, forwarded_for):
+        """
+        Retorna a localização do IP (primeiro endereço de 'X-Forwarded-For' ou o endereço remoto) sem bloquear:
+        {'latitude', 'longitude', 'ra', 'source' ('offline', 'stub', 'remote' ou 'fallback'), 'message'}.
+        """
+        try:
+            address = ipaddress.ip_address((forwarded_for or '').split(',')[0].strip())
+        except ValueError:
+            return location_response(FALLBACK_LATITUDE, FALLBACK_LONGITUDE, 'fallback', message='IP inválido, fallback para Brasília')
+        key = cache_prefix(address)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if address.is_private or address.is_loopback or address.is_link_local or address.is_unspecified:
+            response = location_response(FALLBACK_LATITUDE, FALLBACK_LONGITUDE, 'fallback', message='IP Local, fallback para Brasília')
+            self.cache.put(key, response)
+            return response
+        for resolver in self.resolvers:
+            found = resolver.resolve(address)
+            if found is not None:
+                response = location_response(found[0], found[1], resolver.name, ra=found[2])
+                self.cache.put(key, response)
+                return response
+
+        # Não encontrado localmente: fallback imediato (também em cache); a consulta remota, se houver, o substitui
+        response = location_response(FALLBACK_LATITUDE, FALLBACK_LONGITUDE, 'fallback', message='Fallback Brasília')
+        self.cache.put(key, response)
+        if self.remote is not None:
+            self.schedule_remote(key, address)
+        return response
+
+    def schedule_remote(self, key, address):
+        """Agenda a consulta remota do prefixo, se o disjuntor e o limite de pendências permitirem."""
+        with self.lock:
+            if key in self.pending:
+                return
+            if len(self.pending) >= self.max_pending or not self.breaker.allow():
+                self.remote_results['rejected'] += 1
+                return
+            # Threads criadas no primeiro uso (em cada processo de trabalho, depois do fork); daemon, para não
+            # atrasar o encerramento do processo com consultas pendentes
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            while len(self.workers) < self.remote_workers:
+                worker = threading.Thread(target=self.remote_worker, name='geolocation', daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            self.pending.add(key)
+        self.queue.put((key, address))
+
+    def remote_worker(self):
+        """Laço de cada thread do pool: executa as consultas remotas da fila."""
+        while True:
+            self.remote_lookup(*self.queue.get())
+
+    def remote_lookup(self, key, address):
+        """Executada no pool: consulta o resolvedor remoto e grava a resposta no cache."""
+        start = time.monotonic()
+        outcome = 'failure'
+        try:
+            found = self.remote.resolve(address)
+            if time.monotonic() - start > self.remote_timeout:
+                # Resposta depois do prazo: conta como falha para o disjuntor e é descartada
+                outcome = 'timeout'
+            elif found is None:
+                outcome = 'not_found'
+            else:
+                outcome = 'success'
+                self.cache.put(key, location_response(found[0], found[1], self.remote.name, ra=found[2]))
+        except Exception:
+            outcome = 'failure'
+        finally:
+            if outcome in ('success', 'not_found'):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            with self.lock:
+                self.pending.discard(key)
+                self.remote_results[outcome] += 1
+
+    def stats(self):
+        """Contadores do cache, do resolvedor remoto e o estado do disjuntor."""
+        with self.lock:
+            pending, remote_results = len(self.pending), dict(self.remote_results)
+        return {
+            'cache': self.cache.stats(),
+            'remote': self.remote.name if self.remote is not None else None,
+            'remote_pending': pending,
+            'remote_results': remote_results,
+            'breaker': self.breaker.state,
+        }
@@ -0,0 +1,149 @@
+"""
+Ingestão incremental de reviews.
+
+Cada lote (arquivo CSV/JSON/parquet no formato de 'reviews.csv', ou o corpo de 'POST /reviews') é validado,
+unido ao catálogo de ofertas ('producers.parquet', mesma junção do notebook) para obter local e coordenadas,
+gravado como um segmento append-only (src.review_segments) e somado à tabela agregada do motor,
+sem recalcular nada sobre todas as reviews. Processos que não gravaram o lote (outros workers, ou o
+servidor quando o lote vem da linha de comando) aplicam o segmento na próxima verificação do motor.
+A cada COMPACTION_SEGMENTS segmentos pendentes, os segmentos são incorporados ao parquet base.
+
+Uso (a partir da raiz do repositório):
+    python -m src.ingestion append novas_reviews.csv
+    python -m src.ingestion compact
+    python -m src.ingestion status
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+import src.recommender_engine as recommender
+from src.data_context import context
+from src.review_segments import base_through, compact, list_segments, storage_status, write_segment
+from src.review_store import prepare_reviews
+
+# Colunas de uma review recebida (as mesmas de 'reviews.csv')
+REVIEW_COLUMNS = ['id_usuario', 'produto', 'organico', 'nome_produtor', 'local', 'avaliacao']
+
+# Colunas usadas para localizar a oferta avaliada no catálogo de produtores
+OFFER_KEYS = ['nome_produtor', 'produto', 'organico', 'local']
+
+# Quantidade de segmentos pendentes que dispara a compactação automática
+COMPACTION_SEGMENTS = 32
+
+# Arquivo de trava da compactação (um processo por vez); travas mais antigas que isso são consideradas órfãs
+COMPACTION_LOCK_FILE = 'compaction.lock'
+COMPACTION_LOCK_MAX_AGE_SECONDS = 3600
+
+compaction_lock = threading.Lock()
+
+
+# Função para validar as reviews recebidas e completá-las com os dados da oferta
+def prepare_batch(records, producers=None):
+    """
+    Converte 'records' (lista de dicionários ou DataFrame) em linhas no formato de 'df_full_reviews'.
+    Linhas sem os campos obrigatórios, com avaliação fora de 1 a 5, orgânico diferente de 0/1 ou
+    sem oferta correspondente no catálogo são rejeitadas.
+    Retorna (reviews aceitas, quantidade de rejeitadas).
+    """
+    reviews = pd.DataFrame(records)
+    total = len(reviews)
+    if total == 0 or not set(REVIEW_COLUMNS) <= set(reviews.columns):
+        return pd.DataFrame(columns=REVIEW_COLUMNS + ['latitude', 'longitude']), total
+
+    reviews = reviews[REVIEW_COLUMNS].dropna()
+    reviews['avaliacao'] = pd.to_numeric(reviews['avaliacao'], errors='coerce')
+    reviews['organico'] = pd.to_numeric(reviews['organico'], errors='coerce')
+    reviews = reviews[reviews['avaliacao'].isin([1, 2, 3, 4, 5]) & reviews['organico'].isin([0, 1])]
+    reviews = reviews.astype({'avaliacao': 'int64', 'organico': 'int64'})
+    for column in ['id_usuario', 'produto', 'nome_produtor', 'local']:
+        reviews[column] = reviews[column].astype(str)
+
+    producers = context.producers if producers is None else producers
+    batch = reviews.merge(producers, on=OFFER_KEYS, how='inner')
+    return batch.reset_index(drop=True), total - len(batch)
+
+
+# Função para ingerir um lote de reviews
+def ingest(records, apply=True):
+    """
+    Valida o lote, grava-o como segmento e, se 'apply', soma-o ao estado do motor deste processo.
+    Retorna um resumo com as quantidades aceitas/rejeitadas e o número do segmento.
+    """
+    batch, rejected = prepare_batch(records)
+    summary = {'accepted': len(batch), 'rejected': rejected, 'segment': None}
+    if batch.empty:
+        return summary
+
+    summary['segment'] = write_segment(context.segments_dir, batch, after=base_through(context.reviews_path))
+    if apply:
+        recommender.apply_review_batch(prepare_reviews(batch), segment=summary['segment'])
+
+    pending = list_segments(context.segments_dir, after=base_through(context.reviews_path))
+    if len(pending) >= COMPACTION_SEGMENTS:
+        # A compactação reescreve o parquet base; roda fora da requisição
+        threading.Thread(target=compact_storage, daemon=True).start()
+    return summary
+
+
+# Função para compactar os segmentos no parquet base, um processo por vez
+def compact_storage():
+    """Incorpora os segmentos pendentes ao parquet base. Retorna o número de segmentos incorporados."""
+    if not compaction_lock.acquire(blocking=False):
+        return 0
+    lock_path = os.path.join(context.segments_dir, COMPACTION_LOCK_FILE)
+    try:
+        os.makedirs(context.segments_dir, exist_ok=True)
+        try:
+            if time.time() - os.path.getmtime(lock_path) > COMPACTION_LOCK_MAX_AGE_SECONDS:
+                os.remove(lock_path) # Trava deixada por um processo interrompido
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return 0 # Outro processo está compactando
+        try:
+            return compact(context.reviews_path, context.segments_dir)
+        finally:
+            os.remove(lock_path)
+    finally:
+        compaction_lock.release()
+
+
+# Função para ler um arquivo de lote (CSV, JSON com lista de reviews ou parquet)
+def read_batch_file(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return pd.DataFrame(data.get('reviews', []) if isinstance(data, dict) else data)
+    return pd.read_csv(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    append_parser = subparsers.add_parser('append', help='Grava um lote de reviews como novo segmento')
+    append_parser.add_argument('files', nargs='+')
+    subparsers.add_parser('compact', help='Incorpora os segmentos pendentes ao parquet base')
+    subparsers.add_parser('status', help='Mostra os segmentos pendentes')
+    args = parser.parse_args()
+
+    if args.command == 'append':
+        for path in args.files:
+            # O servidor em execução aplica o segmento na próxima verificação (ensure_data)
+            summary = ingest(read_batch_file(path), apply=False)
+            print(f"{path}: {summary['accepted']} aceitas, {summary['rejected']} rejeitadas, segmento {summary['segment']}")
+    elif args.command == 'compact':
+        print(f"{compact_storage()} segmento(s) incorporado(s) ao parquet base")
+    print(json.dumps(storage_status(context.reviews_path, context.segments_dir), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
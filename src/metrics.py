@@ -0,0 +1,325 @@
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from functools import wraps
+
+# Instrumentação do motor e das rotas: histogramas de latência por etapa dos pipelines, tamanho dos
+# conjuntos de candidatos e contadores dos caches, expostos em '/metrics' no formato texto do Prometheus.
+# As etapas são rotuladas pelo pipeline em execução na thread (definido por recommend/recommend_batch).
+# Com ENABLED = False os pontos de medição retornam logo na primeira linha (custo de uma leitura de global).
+# Cada processo de trabalho (serve.py) mantém suas próprias séries.
+# O SlowRequestProfiler, opcional, amostra as pilhas das requisições em andamento e grava as das lentas no
+# formato "collapsed" (uma pilha por linha, da raiz para a folha, seguida da contagem), aceito pelo
+# flamegraph.pl e pelo speedscope.
+
+# Liga/desliga a coleta das métricas
+ENABLED = True
+
+# Limites (em segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Limites dos buckets do histograma de tamanho dos conjuntos de candidatos
+SIZE_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+# Intervalo de amostragem do perfil de requisições lentas (segundos)
+PROFILE_INTERVAL_SECONDS = 0.005
+
+# Rótulo das etapas executadas fora de um pipeline
+NO_PIPELINE = 'none'
+
+_local = threading.local()
+
+
+# Função para formatar um número no formato do Prometheus
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Função para formatar os rótulos de uma série ('{nome="valor",...}')
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class CounterMetric:
+    """Contador monotônico com rótulos (uma série por combinação de valores dos rótulos)."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.series = {} # valores dos rótulos -> total
+        self.lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            series = sorted(self.series.items())
+        lines.extend(f'{self.name}{format_labels(self.label_names, labels)} {format_value(value)}' for labels, value in series)
+        return lines
+
+
+class HistogramMetric:
+    """Histograma com buckets fixos e rótulos; cada série guarda as contagens por bucket, a soma e o total."""
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {} # valores dos rótulos -> [contagem de cada bucket (o último é +Inf), soma]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        position = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[position] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        bucket_names = self.label_names + ('le',)
+        with self.lock:
+            series = sorted((labels, list(values)) for labels, values in self.series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(bucket_names, labels + (format_value(bound),))} {cumulative}')
+            suffix = format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{suffix} {format_value(values[-1])}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+# Métricas coletadas pelo motor e pelas rotas
+STAGE_SECONDS = HistogramMetric(
+    'recommender_stage_duration_seconds', 'Duração de cada etapa dos pipelines de recomendação.', ('pipeline', 'stage')
+)
+CANDIDATES = HistogramMetric(
+    'recommender_candidates', 'Tamanho dos conjuntos de candidatos selecionados.', ('pipeline',), SIZE_BUCKETS
+)
+REQUEST_SECONDS = HistogramMetric(
+    'http_request_duration_seconds', 'Duração das requisições HTTP por rota, método e status.', ('route', 'method', 'status')
+)
+LOOKUPS = CounterMetric('recommender_lookups_total', 'Consultas a estruturas pré-calculadas por resultado.', ('source', 'result'))
+
+METRICS = [STAGE_SECONDS, CANDIDATES, REQUEST_SECONDS, LOOKUPS]
+
+# Caches exportados na coleta: nome -> objeto com stats() (ex.: RecommendationCache)
+CACHES = {}
+
+
+# Função para obter o pipeline em execução na thread atual
+def current_pipeline():
+    return getattr(_local, 'pipeline', None) or NO_PIPELINE
+
+
+class PipelineLabel:
+    """Contexto que rotula as etapas medidas na thread atual com o tipo de recomendação."""
+
+    __slots__ = ('name', 'previous')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'pipeline', None)
+        _local.pipeline = self.name
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.pipeline = self.previous
+        return False
+
+
+class StageTimer:
+    """Contexto que mede a duração de uma etapa e a registra com o pipeline da thread atual."""
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter() if ENABLED else None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is not None:
+            STAGE_SECONDS.observe((current_pipeline(), self.name), time.perf_counter() - self.start)
+        return False
+
+
+# Função para rotular as etapas do bloco com o pipeline (ex.: with metrics.pipeline('products'): ...)
+def pipeline(name):
+    return PipelineLabel(name)
+
+
+# Função para medir a duração de um bloco como etapa (ex.: with metrics.stage('serialize'): ...)
+def stage(name):
+    return StageTimer(name)
+
+
+# Decorador para medir a duração de uma função como etapa do pipeline
+def timed(stage_name):
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe((current_pipeline(), stage_name), time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+# Função para registrar o tamanho de um conjunto de candidatos do pipeline atual
+def record_candidates(count):
+    if ENABLED:
+        CANDIDATES.observe((current_pipeline(),), count)
+
+
+# Função para registrar uma consulta a uma estrutura pré-calculada (ex.: tabelas de top-k)
+def record_lookup(source, hit):
+    if ENABLED:
+        LOOKUPS.inc((source, 'hit' if hit else 'miss'))
+
+
+# Função para registrar a duração de uma requisição HTTP
+def record_request(route, method, status, seconds):
+    if ENABLED:
+        REQUEST_SECONDS.observe((route, method, str(status)), seconds)
+
+
+# Função para exportar os contadores de um cache na coleta (lidos de cache.stats() a cada '/metrics')
+def register_cache(name, cache):
+    CACHES[name] = cache
+
+
+# Função para gerar as linhas dos caches registrados
+def cache_lines():
+    stats = {name: cache.stats() for name, cache in CACHES.items()}
+    lines = []
+    for field, kind in (('hits', 'counter'), ('misses', 'counter'), ('evictions', 'counter'), ('entries', 'gauge')):
+        name = f'recommender_cache_{field}' + ('_total' if kind == 'counter' else '')
+        lines += [f'# HELP {name} Campo {field!r} de stats() de cada cache.', f'# TYPE {name} {kind}']
+        lines.extend(f'{name}{format_labels(("cache",), (cache,))} {values[field]}' for cache, values in stats.items())
+    return lines
+
+
+# Função para gerar o texto de '/metrics' (formato de exposição do Prometheus, versão 0.0.4)
+def render():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(cache_lines())
+    return '\n'.join(lines) + '\n'
+
+
+# Função para zerar todas as séries (ex.: entre rodadas de um benchmark)
+def reset():
+    for metric in METRICS:
+        with metric.lock:
+            metric.series.clear()
+
+
+# Função para converter a pilha de um frame em uma linha do formato "collapsed" (raiz primeiro)
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        # O flamegraph.pl separa a contagem pelo último espaço: só ';' precisa ser substituído
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)})'.replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """
+    Perfil por amostragem das requisições lentas.
+    Uma thread amostra, a cada 'interval' segundos, a pilha de cada thread com requisição em andamento
+    (begin/end). Ao terminar uma requisição com duração >= 'threshold_ms', as pilhas amostradas são gravadas
+    em 'output_dir' (arquivo '.folded'). Sem requisições em andamento, a thread de amostragem fica parada.
+    Uma requisição que espera por um cálculo em outra thread (delegate) tem amostrada a pilha dessa thread.
+    """
+
+    def __init__(self, threshold_ms, output_dir, interval=PROFILE_INTERVAL_SECONDS):
+        self.threshold_ms = threshold_ms
+        self.output_dir = output_dir
+        self.interval = interval
+        self.active = {} # id da thread -> Counter de pilhas amostradas
+        self.delegates = {} # id da thread da requisição -> objeto com 'thread_ident' (thread que faz o trabalho)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            with self.lock:
+                if not self.active:
+                    self.wakeup.clear()
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self.active.items():
+                    # Enquanto o cálculo delegado roda, a pilha útil é a da thread que o executa
+                    worker = getattr(self.delegates.get(ident), 'thread_ident', None)
+                    frame = frames.get(worker or ident)
+                    if frame is not None:
+                        stacks[collapse_stack(frame)] += 1
+            time.sleep(self.interval)
+
+    def begin(self):
+        """Começa a amostrar a thread atual."""
+        with self.lock:
+            # Após um fork() a thread de amostragem do processo pai não existe no filho
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                self.thread.start()
+            self.active[threading.get_ident()] = Counter()
+            self.wakeup.set()
+        return time.perf_counter()
+
+    def delegate(self, target):
+        """
+        Amostra, no lugar da thread atual, a thread indicada por 'target.thread_ident' enquanto o atributo
+        estiver definido (ex.: o Future de um cálculo do src.execution). Sem efeito se a thread não está sendo amostrada.
+        """
+        with self.lock:
+            ident = threading.get_ident()
+            if ident in self.active:
+                self.delegates[ident] = target
+
+    def end(self, name, started):
+        """Para de amostrar a thread atual; grava as pilhas se a requisição foi lenta. Retorna o caminho ou None."""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            stacks = self.active.pop(threading.get_ident(), None)
+            self.delegates.pop(threading.get_ident(), None)
+        if not stacks or elapsed_ms < self.threshold_ms:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        label = re.sub(r'[^A-Za-z0-9_-]+', '_', name).strip('_') or 'request'
+        path = os.path.join(self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{label}-{elapsed_ms:.0f}ms.folded')
+        with open(path, 'w') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in stacks.most_common())
+        return path
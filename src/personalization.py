@@ -0,0 +1,274 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Recomendações personalizadas por filtragem colaborativa (fatoração de matrizes).
+# A matriz usuário x item (item = par produto-produtor) guarda a média das avaliações de cada usuário
+# em formato CSR. O modelo prevê a avaliação de um usuário para um item como
+#     média global + viés do usuário + viés do item + fator_usuário · fator_item
+# Os vieses são médias com encolhimento (usuários/itens com poucas avaliações ficam perto da média global)
+# e os fatores são treinados por ALS (mínimos quadrados alternados, regularização ponderada pela
+# quantidade de avaliações) sobre o resíduo. Cada passo resolve um sistema f x f por usuário (ou item),
+# todos montados com produtos esparsos e resolvidos em lote pelo np.linalg.solve.
+# O treino é offline (etapa 'user_factors' de src.pipeline); o modelo fica em 'model/user_factors.npz',
+# gerado por 'python -m src.pipeline build --stages user_factors' (não é versionado).
+# Na consulta, a afinidade dos candidatos é um produto interno do fator do usuário com os fatores dos itens;
+# a posição de cada candidato no modelo é obtida por categoria (uma consulta por produto/produtor distinto),
+# e não por candidato.
+
+# Modelo treinado (relativo ao diretório de dados)
+USER_FACTORS_PATH = ('model', 'user_factors.npz')
+
+# Hiperparâmetros padrão do treino
+DEFAULT_FACTORS = 16
+DEFAULT_REGULARIZATION = 0.1
+DEFAULT_ITERATIONS = 10
+BIAS_REGULARIZATION = 5.0 # Avaliações "fictícias" na média global somadas a cada viés
+ALS_SEED = 7
+
+# Escala das avaliações, usada para levar a previsão ao intervalo 0 a 1 (mesma escala de 'avaliacao_norm')
+RATING_MIN = 1.0
+RATING_MAX = 5.0
+
+
+# Função para montar a matriz usuário x item de avaliações médias a partir das reviews
+def interaction_matrix(df_reviews):
+    """
+    Retorna (usuários, produtos dos itens, produtores dos itens, matriz CSR usuários x itens).
+    Os usuários ficam em ordem crescente (a consulta usa busca binária); avaliações repetidas
+    do mesmo usuário para o mesmo item entram pela média.
+    """
+    user_codes, users = pd.factorize(df_reviews['id_usuario'].astype(str), sort=True)
+    items = pd.MultiIndex.from_arrays([df_reviews['produto'].astype(str), df_reviews['nome_produtor'].astype(str)])
+    item_codes, item_labels = pd.factorize(items, sort=True)
+    shape = (len(users), len(item_labels))
+    ratings = df_reviews['avaliacao'].to_numpy(dtype=float)
+
+    # Somas e contagens por par (coo_matrix soma as entradas repetidas na conversão para CSR)
+    sums = sparse.coo_matrix((ratings, (user_codes, item_codes)), shape=shape).tocsr()
+    counts = sparse.coo_matrix((np.ones(len(ratings)), (user_codes, item_codes)), shape=shape).tocsr()
+    means = sums.copy()
+    means.data = sums.data / counts.data
+    return (
+        np.asarray(users, dtype=str),
+        np.asarray(item_labels.get_level_values(0), dtype=str),
+        np.asarray(item_labels.get_level_values(1), dtype=str),
+        means,
+    )
+
+
+# Função para calcular os vieses (com encolhimento) de usuários e itens
+def rating_biases(ratings, regularization=BIAS_REGULARIZATION):
+    """Retorna (média global, viés de cada usuário, viés de cada item) da matriz CSR de avaliações."""
+    global_mean = float(ratings.data.mean()) if ratings.nnz else 0.0
+    indicator = ratings.copy()
+    indicator.data = np.ones_like(indicator.data)
+    residual = ratings.copy()
+    residual.data = residual.data - global_mean
+
+    item_counts = np.asarray(indicator.sum(axis=0)).ravel()
+    item_bias = np.asarray(residual.sum(axis=0)).ravel() / (item_counts + regularization)
+    residual = residual.tocsc()
+    residual.data -= np.repeat(item_bias, np.diff(residual.indptr))
+    residual = residual.tocsr()
+    user_counts = np.diff(residual.indptr)
+    user_bias = np.asarray(residual.sum(axis=1)).ravel() / (user_counts + regularization)
+    return global_mean, user_bias, item_bias
+
+
+# Função para resolver um passo do ALS: os fatores das linhas de 'ratings', com os fatores das colunas fixos
+def solve_factors(ratings, fixed, regularization):
+    """
+    Para cada linha u, com as colunas avaliadas Q_u (n_u x f) e as avaliações r_u:
+        x_u = (Q_uᵀ Q_u + λ n_u I)⁻¹ Q_uᵀ r_u = Q_uᵀ (Q_u Q_uᵀ + λ n_u I)⁻¹ r_u
+    Linhas com menos avaliações que fatores (a maioria dos usuários) usam a segunda forma, um sistema
+    n_u x n_u: as linhas com o mesmo n_u são empilhadas e resolvidas juntas. As demais montam Q_uᵀ Q_u
+    (produto de matrizes por linha) e resolvem os sistemas f x f em lote. Linhas sem avaliações ficam nulas.
+    """
+    n_rows, n_factors = ratings.shape[0], fixed.shape[1]
+    counts = np.diff(ratings.indptr)
+    solved = np.zeros((n_rows, n_factors))
+
+    for count in np.unique(counts[(counts > 0) & (counts < n_factors)]):
+        rows = np.flatnonzero(counts == count)
+        positions = ratings.indptr[rows][:, None] + np.arange(count)
+        vectors = fixed[ratings.indices[positions]] # linhas x n_u x f
+        kernel = vectors @ vectors.transpose(0, 2, 1) + regularization * count * np.eye(count)
+        weights = np.linalg.solve(kernel, ratings.data[positions][:, :, None])
+        solved[rows] = (vectors.transpose(0, 2, 1) @ weights)[:, :, 0]
+
+    rows = np.flatnonzero(counts >= n_factors)
+    if len(rows):
+        gram = np.empty((len(rows), n_factors, n_factors))
+        targets = np.empty((len(rows), n_factors))
+        for i, row in enumerate(rows):
+            start, stop = ratings.indptr[row], ratings.indptr[row + 1]
+            vectors = fixed[ratings.indices[start:stop]]
+            gram[i] = vectors.T @ vectors
+            targets[i] = vectors.T @ ratings.data[start:stop]
+        gram += (regularization * counts[rows])[:, None, None] * np.eye(n_factors)
+        solved[rows] = np.linalg.solve(gram, targets[:, :, None])[:, :, 0]
+    return solved
+
+
+# Função para treinar os fatores por ALS
+def train_factors(ratings, factors=DEFAULT_FACTORS, regularization=DEFAULT_REGULARIZATION,
+                  iterations=DEFAULT_ITERATIONS, seed=ALS_SEED):
+    """
+    Retorna (média global, vieses dos usuários, vieses dos itens, fatores dos usuários, fatores dos itens).
+    Os fatores aproximam o resíduo das avaliações após a média global e os vieses.
+    """
+    global_mean, user_bias, item_bias = rating_biases(ratings)
+    residual = ratings.tocoo()
+    residual = sparse.csr_matrix(
+        (residual.data - global_mean - user_bias[residual.row] - item_bias[residual.col], (residual.row, residual.col)),
+        shape=ratings.shape
+    )
+    residual_by_item = residual.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    item_factors = rng.normal(scale=0.1, size=(ratings.shape[1], factors))
+    user_factors = np.zeros((ratings.shape[0], factors))
+    for _ in range(iterations):
+        user_factors = solve_factors(residual, item_factors, regularization)
+        item_factors = solve_factors(residual_by_item, user_factors, regularization)
+    return global_mean, user_bias, item_bias, user_factors, item_factors
+
+
+class UserFactorModel:
+    """
+    Modelo treinado: usuários (ordenados), itens (produto, produtor), vieses, fatores e a matriz
+    de avaliações do treino (CSR).
+    """
+
+    def __init__(self, users, item_products, item_producers, ratings, global_mean,
+                 user_bias, item_bias, user_factors, item_factors):
+        self.users = np.asarray(users, dtype=str)
+        self.item_products = np.asarray(item_products, dtype=str)
+        self.item_producers = np.asarray(item_producers, dtype=str)
+        self.ratings = sparse.csr_matrix(ratings)
+        self.global_mean = float(global_mean)
+        self.user_bias = np.asarray(user_bias, dtype=float)
+        self.item_bias = np.asarray(item_bias, dtype=float)
+        self.user_factors = np.asarray(user_factors, dtype=float)
+        self.item_factors = np.asarray(item_factors, dtype=float)
+        self.producer_codes, producers = pd.factorize(self.item_producers)
+        self.producers = pd.Index(producers)
+        product_codes, products = pd.factorize(self.item_products)
+        self.products = pd.Index(products)
+        # Chave de cada item (produto x produtor) em ordem crescente, com a posição do item correspondente
+        item_keys = product_codes.astype(np.int64) * len(self.producers) + self.producer_codes
+        self.item_key_order = np.argsort(item_keys, kind='stable')
+        self.item_keys = item_keys[self.item_key_order]
+
+    @classmethod
+    def train(cls, df_reviews, factors=DEFAULT_FACTORS, regularization=DEFAULT_REGULARIZATION,
+              iterations=DEFAULT_ITERATIONS, seed=ALS_SEED):
+        """Treina o modelo a partir de um DataFrame de reviews (id_usuario, produto, nome_produtor, avaliacao)."""
+        users, item_products, item_producers, ratings = interaction_matrix(df_reviews)
+        return cls(users, item_products, item_producers, ratings,
+                   *train_factors(ratings, factors, regularization, iterations, seed))
+
+    def save(self, file):
+        """Grava o modelo em formato .npz ('file' é um caminho ou um arquivo aberto em modo binário)."""
+        np.savez(
+            file, users=self.users, item_products=self.item_products, item_producers=self.item_producers,
+            ratings_data=self.ratings.data, ratings_indices=self.ratings.indices, ratings_indptr=self.ratings.indptr,
+            ratings_shape=np.array(self.ratings.shape), global_mean=np.array(self.global_mean),
+            user_bias=self.user_bias, item_bias=self.item_bias,
+            user_factors=self.user_factors, item_factors=self.item_factors,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            ratings = sparse.csr_matrix(
+                (data['ratings_data'], data['ratings_indices'], data['ratings_indptr']), shape=tuple(data['ratings_shape'])
+            )
+            return cls(data['users'], data['item_products'], data['item_producers'], ratings, data['global_mean'],
+                       data['user_bias'], data['item_bias'], data['user_factors'], data['item_factors'])
+
+    def __len__(self):
+        return len(self.users)
+
+    def user_index(self, user_id):
+        """Posição do usuário no modelo (busca binária nos ids ordenados), ou None se desconhecido."""
+        if user_id is None or not len(self.users):
+            return None
+        position = int(np.searchsorted(self.users, str(user_id)))
+        if position < len(self.users) and self.users[position] == str(user_id):
+            return position
+        return None
+
+    def predict(self, user_indices):
+        """Avaliações previstas dos usuários para todos os itens (matriz usuários x itens, um produto de matrizes)."""
+        user_indices = np.atleast_1d(np.asarray(user_indices, dtype=np.int64))
+        return (self.global_mean + self.user_bias[user_indices, None] + self.item_bias[None, :]
+                + self.user_factors[user_indices] @ self.item_factors.T)
+
+    def affinity(self, user_id, products, producers):
+        """
+        Afinidade (0 a 1) do usuário com cada item (produto, produtor) informado, a partir da avaliação prevista.
+        Itens ausentes do treino recebem a previsão sem o termo do item. Retorna None se o usuário é desconhecido.
+        """
+        user = self.user_index(user_id)
+        if user is None:
+            return None
+        predicted = self.predict(user)[0]
+        positions = self.item_positions(products, producers)
+        fallback = self.global_mean + self.user_bias[user]
+        values = np.where(positions >= 0, predicted[np.maximum(positions, 0)], fallback)
+        return normalized_rating(values)
+
+    def producer_affinity(self, user_id, producers):
+        """Afinidade (0 a 1) do usuário com cada produtor: média das previsões para os itens do produtor."""
+        user = self.user_index(user_id)
+        if user is None:
+            return None
+        predicted = self.predict(user)[0]
+        sums = np.bincount(self.producer_codes, weights=predicted, minlength=len(self.producers))
+        counts = np.bincount(self.producer_codes, minlength=len(self.producers))
+        by_producer = sums / np.maximum(counts, 1)
+        positions = index_positions(self.producers, producers)
+        fallback = self.global_mean + self.user_bias[user]
+        return normalized_rating(np.where(positions >= 0, by_producer[np.maximum(positions, 0)], fallback))
+
+    def item_positions(self, products, producers):
+        """Posição de cada item (produto, produtor) no modelo, ou -1 se o item não fez parte do treino."""
+        product_positions = index_positions(self.products, products)
+        producer_positions = index_positions(self.producers, producers)
+        keys = product_positions * len(self.producers) + producer_positions
+        positions = np.full(len(keys), -1, dtype=np.int64)
+        if not len(self.item_keys):
+            return positions
+        slots = np.minimum(np.searchsorted(self.item_keys, keys), len(self.item_keys) - 1)
+        found = (product_positions >= 0) & (producer_positions >= 0) & (self.item_keys[slots] == keys)
+        positions[found] = self.item_key_order[slots[found]]
+        return positions
+
+
+# Função para obter a posição de cada valor em 'index' (-1 se ausente)
+def index_positions(index, values):
+    """
+    Com valores categóricos (as colunas do motor), a busca é feita uma vez por categoria e
+    levada aos valores pelos códigos; nos demais casos, uma única busca vetorizada no índice.
+    """
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        by_category = index.get_indexer(np.asarray(values.cat.categories, dtype=str))
+        # Código -1 (valor ausente) cai na posição extra, -1
+        return np.append(by_category, -1)[np.asarray(values.cat.codes)].astype(np.int64)
+    return index.get_indexer(np.asarray(values, dtype=str)).astype(np.int64)
+
+
+# Função para levar avaliações (previstas) ao intervalo 0 a 1
+def normalized_rating(values):
+    return np.clip((np.asarray(values, dtype=float) - RATING_MIN) / (RATING_MAX - RATING_MIN), 0.0, 1.0)
+
+
+# Função para carregar o modelo treinado, se existir
+def load_user_model(path):
+    """Retorna o UserFactorModel de 'path', ou None se o modelo ainda não foi treinado."""
+    try:
+        return UserFactorModel.load(path)
+    except FileNotFoundError:
+        return None
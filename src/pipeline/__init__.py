@@ -0,0 +1,9 @@
+"""
+Pipeline de build dos artefatos do app (substitui as células de pré-processamento do notebook).
+
+Etapas em src.pipeline.stages, executadas com cache por src.pipeline.runner. Uso:
+    python -m src.pipeline build
+    python -m src.pipeline status
+"""
+from src.pipeline.runner import Build, Stage, run_stages, stage_order
+from src.pipeline.stages import STAGES
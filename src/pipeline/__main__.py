@@ -0,0 +1,53 @@
+"""
+Build reprodutível dos artefatos usados pelo app (parquet, encoders, modelo e listas JSON).
+
+Cada etapa só é executada se suas entradas, parâmetros ou código mudaram desde a última execução
+(manifesto em 'data/.build/manifest.json'). A junção e a codificação das reviews rodam em blocos
+e em vários processos; as coordenadas das RAs vêm do cache de geocodificação.
+
+Uso (a partir da raiz do repositório):
+    python -m src.pipeline build
+    python -m src.pipeline build --stages resources --jobs 4
+    python -m src.pipeline build --force
+    python -m src.pipeline status
+"""
+import argparse
+import os
+import time
+
+from src.data_context import DEFAULT_DATA_DIR
+from src.pipeline.runner import Build, run_stages
+from src.pipeline.stages import STAGES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['build', 'status'])
+    parser.add_argument('--stages', nargs='+', help='Etapas a executar (as dependências desatualizadas também rodam)')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Processos para as etapas em blocos')
+    parser.add_argument('--chunk-size', type=int, default=100_000, help='Linhas por bloco na leitura das reviews')
+    parser.add_argument('--force', action='store_true', help='Executa as etapas mesmo se estiverem atualizadas')
+    parser.add_argument('--online', action='store_true', help='Consulta o Nominatim para cidades fora do cache')
+    parser.add_argument('--discard-ingested', action='store_true',
+                        help="Reconstrói o parquet de reviews mesmo que ele contenha reviews ingeridas fora de 'reviews.csv'")
+    args = parser.parse_args()
+
+    build = Build(args.data_dir, jobs=args.jobs, chunk_size=args.chunk_size,
+                  options={'online': args.online, 'discard_ingested': args.discard_ingested})
+    for stage in STAGES:
+        print(f"{stage.name:<20} {stage.description}")
+    print()
+
+    start = time.perf_counter()
+    try:
+        statuses = run_stages(build, STAGES, selected=args.stages, force=args.force, dry_run=args.command == 'status')
+    except (FileNotFoundError, LookupError, RuntimeError, ValueError) as e:
+        raise SystemExit(f"Erro no build: {e}")
+    if args.command == 'build':
+        executed = sum(status == 'executada' for status in statuses.values())
+        print(f"\n{executed} de {len(statuses)} etapa(s) executada(s) em {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
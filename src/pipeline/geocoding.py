@@ -0,0 +1,69 @@
+import json
+import os
+import time
+
+# Geocodificação das RAs sem depender da rede a cada build.
+# As coordenadas vêm da tabela offline 'json/locations.json' já versionada e de um cache em disco
+# (nome -> [latitude, longitude]). Somente cidades ausentes do cache são consultadas no Nominatim,
+# e apenas quando o build é chamado com '--online'; o resultado é gravado no cache na mesma hora.
+
+# Cache de geocodificação (relativo a 'data_dir'; fora do controle de versão)
+GEOCODE_CACHE_PATH = os.path.join('.build', 'geocode_cache.json')
+
+# Tabela offline usada para semear o cache
+OFFLINE_TABLE_PATH = os.path.join('json', 'locations.json')
+
+# Intervalo entre consultas ao Nominatim (política de uso: no máximo 1 requisição por segundo)
+NOMINATIM_INTERVAL_SECONDS = 1.0
+
+
+class GeocodeCache:
+    """Cache persistente de coordenadas por cidade."""
+
+    def __init__(self, path, seed_path=None):
+        self.path = path
+        self.entries = {}
+        # A tabela offline prevalece sobre o cache: correções manuais em 'locations.json' são preservadas
+        for source in (path, seed_path):
+            if source and os.path.exists(source):
+                with open(source, 'r') as f:
+                    self.entries.update(json.load(f))
+
+    def get(self, city):
+        return self.entries.get(city)
+
+    def put(self, city, coordinates):
+        self.entries[city] = coordinates
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(self.path + '.tmp', self.path)
+
+
+# Função para consultar as coordenadas de uma cidade no Nominatim (mesma consulta do notebook)
+def geocode_online(city):
+    from geopy.geocoders import Nominatim
+    geolocator = Nominatim(user_agent="loc_producers", timeout=10)
+    location = geolocator.geocode(f"{city}, DF, Brasil")
+    return [location.latitude, location.longitude] if location else None
+
+
+# Função para obter as coordenadas de uma lista de cidades
+def geocode_cities(cities, cache, online=False):
+    """
+    Retorna {cidade: [latitude, longitude]} na ordem de 'cities'.
+    Cidades fora do cache só são consultadas com 'online'; sem ele, a ausência é um erro.
+    """
+    missing = [city for city in cities if cache.get(city) is None]
+    if missing and not online:
+        raise LookupError(
+            f"Sem coordenadas em cache para: {', '.join(missing)}. Execute o build com '--online' para geocodificá-las."
+        )
+    for position, city in enumerate(missing):
+        if position:
+            time.sleep(NOMINATIM_INTERVAL_SECONDS)
+        coordinates = geocode_online(city)
+        if coordinates is None:
+            raise LookupError(f"O Nominatim não encontrou a cidade: {city}")
+        cache.put(city, coordinates)
+    return {city: cache.get(city) for city in cities}
@@ -0,0 +1,179 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+
+# Execução das etapas do build com cache.
+# Cada etapa declara os arquivos que lê e os que grava (caminhos relativos a 'data_dir').
+# A chave de uma etapa é o hash do conteúdo das entradas + parâmetros + código do módulo da etapa e dos
+# módulos de que ela depende (ex.: o treino do modelo em src.personalization);
+# se a chave e o hash das saídas coincidem com o manifesto da última execução, a etapa é pulada.
+# A ordem de execução vem das dependências: uma etapa roda depois das que produzem suas entradas.
+
+# Manifesto das execuções (relativo a 'data_dir'; fora do controle de versão)
+MANIFEST_PATH = os.path.join('.build', 'manifest.json')
+
+# Tamanho dos blocos lidos ao calcular o hash de um arquivo
+HASH_BLOCK_SIZE = 1 << 20
+
+
+class Stage:
+    """
+    Etapa do build: 'run(build)' lê 'inputs' e grava 'outputs' (caminhos relativos a 'data_dir').
+    'modules' lista os módulos, além do da própria etapa, cujo código determina as saídas (entram na chave).
+    """
+
+    def __init__(self, name, run, inputs, outputs, params=None, modules=(), description=''):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {} # Opções do build que alteram o resultado (entram na chave)
+        self.modules = [inspect.getmodule(run)] + [module for module in modules if module is not inspect.getmodule(run)]
+        self.description = description
+
+
+class Build:
+    """Estado de uma execução do pipeline: diretório de dados, opções e hashes dos arquivos."""
+
+    def __init__(self, data_dir, jobs=1, chunk_size=100_000, options=None):
+        self.data_dir = data_dir
+        self.jobs = max(1, jobs)
+        self.chunk_size = chunk_size
+        self.options = options or {}
+        self.manifest = self._read_manifest()
+        self._file_hashes = {}
+
+    def path(self, relative_path):
+        return os.path.join(self.data_dir, relative_path)
+
+    def _read_manifest(self):
+        try:
+            with open(self.path(MANIFEST_PATH), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {'stages': {}, 'files': {}}
+
+    def write_manifest(self):
+        path = self.path(MANIFEST_PATH)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    def file_hash(self, relative_path):
+        """
+        Hash SHA-256 do conteúdo do arquivo, ou None se ele não existe.
+        Arquivos com o mesmo tamanho e mtime da execução anterior reutilizam o hash do manifesto.
+        """
+        if relative_path in self._file_hashes:
+            return self._file_hashes[relative_path]
+        try:
+            stat = os.stat(self.path(relative_path))
+        except FileNotFoundError:
+            return None
+        signature = [stat.st_size, stat.st_mtime_ns]
+        cached = self.manifest['files'].get(relative_path)
+        if cached and cached['stat'] == signature:
+            digest = cached['sha256']
+        else:
+            sha = hashlib.sha256()
+            with open(self.path(relative_path), 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            self.manifest['files'][relative_path] = {'stat': signature, 'sha256': digest}
+        self._file_hashes[relative_path] = digest
+        return digest
+
+    def forget(self, relative_path):
+        """Descarta o hash memorizado de um arquivo (após a etapa que o grava)."""
+        self._file_hashes.pop(relative_path, None)
+
+    def stage_key(self, stage):
+        """Chave da etapa: entradas + parâmetros + código (etapa e módulos declarados). None se alguma entrada não existe."""
+        inputs = {path: self.file_hash(path) for path in stage.inputs}
+        if None in inputs.values():
+            return None
+        payload = json.dumps({
+            'inputs': inputs,
+            'params': stage.params,
+            # Módulo inteiro (inclui as funções auxiliares da etapa) e os módulos de que a etapa depende
+            'code': {module.__name__: inspect.getsource(module) for module in stage.modules},
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def is_current(self, stage, key):
+        """Indica se a última execução registrada teve a mesma chave e se as saídas não foram alteradas desde então."""
+        previous = self.manifest['stages'].get(stage.name)
+        if previous is None or previous['key'] != key:
+            return False
+        return all(self.file_hash(path) == previous['outputs'].get(path) for path in stage.outputs)
+
+
+# Função para ordenar as etapas pelas dependências entre entradas e saídas
+def stage_order(stages, selected=None):
+    """
+    Retorna as etapas na ordem de execução. Com 'selected' (nomes), inclui apenas essas etapas
+    e as que produzem, direta ou indiretamente, as suas entradas.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    producer = {output: stage.name for stage in stages for output in stage.outputs}
+    order, visiting = [], set()
+
+    def visit(name):
+        if any(stage.name == name for stage in order):
+            return
+        if name in visiting:
+            raise ValueError(f"Dependência circular entre as etapas envolvendo '{name}'.")
+        visiting.add(name)
+        for path in by_name[name].inputs:
+            if path in producer:
+                visit(producer[path])
+        visiting.discard(name)
+        order.append(by_name[name])
+
+    for name in (selected or [stage.name for stage in stages]):
+        if name not in by_name:
+            raise ValueError(f"Etapa desconhecida: {name}. Etapas: {', '.join(by_name)}")
+        visit(name)
+    return order
+
+
+# Função para executar as etapas, pulando as que estão atualizadas
+def run_stages(build, stages, selected=None, force=False, dry_run=False, log=print):
+    """
+    Executa as etapas (e suas dependências) em ordem. Retorna {etapa: 'executada' | 'atualizada' | 'pendente'}.
+    'force' executa mesmo as etapas atualizadas; 'dry_run' só informa o que seria executado.
+    """
+    statuses = {}
+    pending_outputs = set() # Saídas que seriam regravadas (simulação)
+    for stage in stage_order(stages, selected):
+        key = build.stage_key(stage)
+        if key is None and not dry_run:
+            missing = [path for path in stage.inputs if build.file_hash(path) is None]
+            raise FileNotFoundError(f"Etapa '{stage.name}': entradas não encontradas: {', '.join(missing)}")
+        upstream_pending = any(path in pending_outputs for path in stage.inputs)
+        if not force and not upstream_pending and key is not None and build.is_current(stage, key):
+            statuses[stage.name] = 'atualizada'
+            log(f"[{stage.name}] atualizada, pulando")
+            continue
+        if dry_run:
+            statuses[stage.name] = 'pendente'
+            pending_outputs.update(stage.outputs)
+            log(f"[{stage.name}] seria executada")
+            continue
+
+        start = time.perf_counter()
+        stage.run(build)
+        for path in stage.outputs:
+            build.forget(path)
+        build.manifest['stages'][stage.name] = {
+            'key': key,
+            'outputs': {path: build.file_hash(path) for path in stage.outputs},
+        }
+        build.write_manifest() # Uma falha em uma etapa posterior não invalida as já concluídas
+        statuses[stage.name] = 'executada'
+        log(f"[{stage.name}] executada em {time.perf_counter() - start:.2f}s")
+    return statuses
@@ -0,0 +1,244 @@
+import contextlib
+import json
+import os
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import LabelEncoder
+
+from src import personalization, review_store
+from src.personalization import DEFAULT_FACTORS, DEFAULT_ITERATIONS, DEFAULT_REGULARIZATION, USER_FACTORS_PATH, UserFactorModel
+from src.pipeline import geocoding
+from src.pipeline.geocoding import GEOCODE_CACHE_PATH, OFFLINE_TABLE_PATH, GeocodeCache, geocode_cities
+from src.pipeline.runner import Stage
+from src.review_segments import base_through, list_segments
+from src.review_store import classes_from_ids
+
+# Etapas do build, equivalentes às células de pré-processamento do notebook 'iia_trabalho_1.ipynb'.
+# As fontes são 'datasets/reviews.csv', 'datasets/producers.csv' e as listas JSON editadas à mão
+# ('cities_list.json', 'products_list.json', 'producers_ra.json'); a geração dos dados sintéticos
+# (Faker + sementes aleatórias) continua no notebook.
+
+# Colunas usadas na junção das reviews com o catálogo de produtores (mesma junção do notebook)
+MERGE_KEYS = ['nome_produtor', 'produto', 'organico', 'local']
+
+# Colunas codificadas pelos LabelEncoders (coluna de valores -> (coluna de códigos, chave em 'full_resources.pkl'))
+ENCODED_COLUMNS = {
+    'id_usuario': ('usuario_id', 'le_usuario'),
+    'produto': ('produto_id', 'le_produto'),
+    'nome_produtor': ('produtor_id', 'le_produtor'),
+    'local': ('local_id', 'le_local'),
+}
+
+# Features do NearestNeighbors e quantidade de vizinhos (as mesmas do notebook)
+FEATURE_COLS = ["produto_id", "organico", "produtor_id", "local_id", "latitude", "longitude"]
+KNN_NEIGHBORS = 6
+
+
+# Função para gravar um arquivo de forma atômica (temporário + os.replace)
+@contextlib.contextmanager
+def atomic_output(build, relative_path):
+    """Fornece um caminho temporário; o arquivo final só é substituído se a escrita terminar sem erro."""
+    path = build.path(relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_json(build, relative_path):
+    with open(build.path(relative_path), 'r') as f:
+        return json.load(f)
+
+
+# Função para gravar JSON no mesmo formato dos arquivos de 'data/json'
+def write_json(build, relative_path, data):
+    with atomic_output(build, relative_path) as tmp_path:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+# Função para aplicar uma função a vários blocos, em paralelo quando há mais de um processo disponível
+def parallel_map(build, func, items):
+    items = list(items)
+    if build.jobs == 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ProcessPoolExecutor(max_workers=min(build.jobs, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+# Função para ler um CSV em blocos de 'build.chunk_size' linhas
+def read_csv_chunks(build, relative_path):
+    return list(pd.read_csv(build.path(relative_path), chunksize=build.chunk_size))
+
+
+# Função para remover acentos e trocar espaços por '_' (name_formatter do notebook)
+def name_formatter(name):
+    new_name = unicodedata.normalize('NFKD', name)
+    return new_name.encode('ascii', 'ignore').decode('ascii').replace(' ', '_')
+
+
+# Etapa: coordenadas de cada RA, a partir do cache de geocodificação
+def build_locations(build):
+    cities = read_json(build, 'json/cities_list.json')
+    cache = GeocodeCache(build.path(GEOCODE_CACHE_PATH), seed_path=build.path(OFFLINE_TABLE_PATH))
+    locations = geocode_cities(cities, cache, online=build.options.get('online', False))
+    write_json(build, 'json/locations.json', locations)
+
+
+# Etapa: nomes 'Produtor_RA' de cada produtor em cada RA (producer_name_formatter do notebook)
+def build_producers_formatted(build):
+    producers_ra = read_json(build, 'json/producers_ra.json')
+    producers_formatted = [
+        f"{producer.replace(' ', '_')}_{name_formatter(ra)}"
+        for producer, ras in producers_ra.items()
+        for ra in ras
+    ]
+    write_json(build, 'json/producers_formatted.json', producers_formatted)
+
+
+# Etapa: catálogo de ofertas em parquet
+def build_producers(build):
+    df_products = pd.read_csv(build.path('datasets/producers.csv'))
+    with atomic_output(build, 'datasets/producers.parquet') as tmp_path:
+        df_products.to_parquet(tmp_path, index=False)
+
+
+# Função (executada por bloco) para somar e contar as avaliações por produtor x produto
+def rating_sums(chunk):
+    grouped = chunk.groupby(['nome_produtor', 'produto'])['avaliacao']
+    return pd.DataFrame({'soma': grouped.sum(), 'contagem': grouped.count()})
+
+
+# Etapa: matriz de utilidade produtor x produto (média das avaliações; 0 sem avaliações)
+def build_matrix(build):
+    partials = parallel_map(build, rating_sums, read_csv_chunks(build, 'datasets/reviews.csv'))
+    totals = pd.concat(partials).groupby(level=[0, 1]).sum()
+    means = (totals['soma'] / totals['contagem']).unstack('produto', fill_value=0)
+    utility_matrix = means.sort_index().sort_index(axis=1).round(2)
+    with atomic_output(build, 'datasets/matrix_reviews.csv') as tmp_path:
+        utility_matrix.to_csv(tmp_path)
+
+
+# Função (executada por bloco) para juntar reviews e ofertas e listar os valores de cada coluna codificada
+def merge_chunk(args):
+    reviews, products = args
+    merged = reviews.merge(products, on=MERGE_KEYS, how='inner')
+    return merged, {column: pd.unique(merged[column]) for column in ENCODED_COLUMNS}
+
+
+# Função (executada por bloco) para acrescentar as colunas de códigos
+def encode_chunk(args):
+    merged, classes = args
+    for column, (code_column, _) in ENCODED_COLUMNS.items():
+        merged[code_column] = pd.Categorical(merged[column], categories=classes[column]).codes.astype('int64')
+    return merged
+
+
+# Etapa: reviews completas (reviews + coordenadas das ofertas) com os códigos dos LabelEncoders
+def build_full_reviews(build):
+    """
+    Junta as reviews às ofertas e codifica as colunas categóricas, em blocos e em paralelo.
+    Os códigos são os de um LabelEncoder ajustado no dataset completo: classes ordenadas, calculadas
+    a partir da união dos valores encontrados em cada bloco.
+    """
+    base_path = build.path('datasets/df_full_reviews.parquet')
+    ingested = base_through(base_path) or list_segments(build.path('datasets/segments'))
+    if ingested and not build.options.get('discard_ingested', False):
+        raise RuntimeError(
+            "Há reviews ingeridas (src.ingestion) que não estão em 'reviews.csv'; reconstruir o parquet as descartaria. "
+            "Use '--discard-ingested' para reconstruir mesmo assim."
+        )
+
+    products = pd.read_csv(build.path('datasets/producers.csv'))
+    chunks = read_csv_chunks(build, 'datasets/reviews.csv')
+    merged_chunks = parallel_map(build, merge_chunk, [(chunk, products) for chunk in chunks])
+    classes = {
+        column: np.sort(pd.unique(np.concatenate([values[column] for _, values in merged_chunks])))
+        for column in ENCODED_COLUMNS
+    }
+
+    df_full_reviews = pd.concat([merged for merged, _ in merged_chunks], ignore_index=True)
+    with atomic_output(build, 'datasets/df_full_reviews.csv') as tmp_path:
+        df_full_reviews.to_csv(tmp_path, index=False)
+
+    encoded = parallel_map(build, encode_chunk, [(merged, classes) for merged, _ in merged_chunks])
+    df_full_reviews = pd.concat(encoded, ignore_index=True)
+    with atomic_output(build, 'datasets/df_full_reviews.parquet') as tmp_path:
+        df_full_reviews.to_parquet(tmp_path)
+
+
+# Etapa: encoders, modelo de vizinhos e listas salvos em 'full_resources.pkl'
+def build_resources(build):
+    df_full_reviews = pd.read_parquet(build.path('datasets/df_full_reviews.parquet'))
+
+    resources = {}
+    for column, (code_column, encoder_key) in ENCODED_COLUMNS.items():
+        # As classes saem da própria coluna de códigos, sem reordenar todos os valores
+        encoder = LabelEncoder()
+        encoder.classes_ = np.array(classes_from_ids(df_full_reviews[column], df_full_reviews[code_column]), dtype=object)
+        resources[encoder_key] = encoder
+
+    knn_model = NearestNeighbors(n_neighbors=KNN_NEIGHBORS, metric='euclidean')
+    knn_model.fit(df_full_reviews[FEATURE_COLS].values)
+
+    resources = {
+        "knn_model": knn_model,
+        **resources,
+        "feature_cols": FEATURE_COLS,
+        "cities_list": read_json(build, 'json/cities_list.json'),
+        "products_list": read_json(build, 'json/products_list.json'),
+        "producers_formatted": read_json(build, 'json/producers_formatted.json'),
+    }
+    with atomic_output(build, 'model/full_resources.pkl') as tmp_path:
+        joblib.dump(resources, tmp_path)
+
+
+# Etapa: modelo de filtragem colaborativa (fatores de usuários e itens treinados por ALS)
+def build_user_factors(build):
+    columns = ['id_usuario', 'produto', 'nome_produtor', 'avaliacao']
+    df_full_reviews = pd.read_parquet(build.path('datasets/df_full_reviews.parquet'), columns=columns)
+    model = UserFactorModel.train(
+        df_full_reviews, factors=DEFAULT_FACTORS, regularization=DEFAULT_REGULARIZATION, iterations=DEFAULT_ITERATIONS
+    )
+    with atomic_output(build, os.path.join(*USER_FACTORS_PATH)) as tmp_path:
+        with open(tmp_path, 'wb') as f: # Com um arquivo aberto, o np.savez não acrescenta '.npz' ao nome
+            model.save(f)
+
+
+STAGES = [
+    Stage('locations', build_locations,
+          inputs=['json/cities_list.json'], outputs=['json/locations.json'], modules=[geocoding],
+          description='Coordenadas das RAs (cache de geocodificação)'),
+    Stage('producers_formatted', build_producers_formatted,
+          inputs=['json/producers_ra.json'], outputs=['json/producers_formatted.json'],
+          description="Nomes 'Produtor_RA'"),
+    Stage('producers', build_producers,
+          inputs=['datasets/producers.csv'], outputs=['datasets/producers.parquet'],
+          description='Catálogo de ofertas em parquet'),
+    Stage('matrix', build_matrix,
+          inputs=['datasets/reviews.csv'], outputs=['datasets/matrix_reviews.csv'],
+          description='Matriz de utilidade produtor x produto'),
+    Stage('full_reviews', build_full_reviews,
+          inputs=['datasets/reviews.csv', 'datasets/producers.csv'],
+          outputs=['datasets/df_full_reviews.csv', 'datasets/df_full_reviews.parquet'],
+          description='Junção reviews x ofertas e codificação'),
+    Stage('resources', build_resources,
+          inputs=['datasets/df_full_reviews.parquet', 'json/cities_list.json',
+                  'json/products_list.json', 'json/producers_formatted.json'],
+          outputs=['model/full_resources.pkl'],
+          params={'feature_cols': FEATURE_COLS, 'n_neighbors': KNN_NEIGHBORS}, modules=[review_store],
+          description='Encoders e NearestNeighbors'),
+    Stage('user_factors', build_user_factors,
+          inputs=['datasets/df_full_reviews.parquet'], outputs=[os.path.join(*USER_FACTORS_PATH)],
+          params={'factors': DEFAULT_FACTORS, 'regularization': DEFAULT_REGULARIZATION, 'iterations': DEFAULT_ITERATIONS},
+          modules=[personalization], description='Fatores de usuários e itens (filtragem colaborativa)'),
+]
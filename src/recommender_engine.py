@@ -1,22 +1,271 @@
-import joblib
+import gc
+import threading
+import time
+
+import numpy as np
 import pandas as pd
 from geopy.distance import geodesic
 
-# Carregamento inicial de recursos (modelo e dataset de reviews)
-# Estes recursos são fundamentais para o funcionamento do motor de recomendação.
-try:
-    # 'full_resources.pkl' geralmente contém dados pré-processados como listas de produtos, produtores, etc.
-    resources = joblib.load('./data/model/full_resources.pkl')
-    # 'df_full_reviews.parquet' é o dataset principal com todas as avaliações e informações associadas.
-    df_full_reviews = pd.read_parquet('./data/datasets/df_full_reviews.parquet')
-except FileNotFoundError:
-    print("Erro ao carregar recursos no recommender_engine. Verifique os caminhos dos arquivos.")
-    resources = None # Define como None para que a aplicação possa tratar a ausência dos dados
-    df_full_reviews = pd.DataFrame() # Define como DataFrame vazio
-except Exception as e:
-    print(f"Erro ao carregar recursos no recommender_engine: {e}")
-    resources = None
-    df_full_reviews = pd.DataFrame()
+from src import basket, metrics
+from src.aggregates import build_aggregate_table, merge_aggregate_tables, weighted_mean
+from src.cache import RecommendationCache
+from src.data_context import context
+from src.distance import DEFAULT_DISTANCE_MODE, distance_matrix_km, distances_km
+from src.review_segments import base_through, list_segments, merge_reviews, read_segment
+from src.review_store import IndexedStore, format_memory_report, prepare_reviews
+from src.personalization import USER_FACTORS_PATH, load_user_model
+from src.scoring import AFFINITY_WEIGHT, blend_affinity, get_weights, score_candidates
+from src.similarity import build_similarity
+from src.spatial_index import COORD_ID_COLUMN, SpatialIndex
+
+# Estado do motor de recomendação.
+# O dataset de reviews vem do contexto de dados compartilhado (src.data_context), carregado uma única vez
+# e apenas na primeira recomendação; o app usa o mesmo contexto, sem carregar os arquivos novamente.
+# - df_full_reviews: avaliações carregadas do disco (parquet base + segmentos), com produto/produtor/local categóricos.
+#   Sem segmentos pendentes, as colunas são views do arquivo Arrow mapeado em memória (src.review_store).
+#   Lotes ingeridos depois da carga (apply_review_batch) atualizam apenas a tabela agregada, de forma incremental.
+# - offer_store: tabela agregada por oferta (produto, produtor, local, orgânico, coordenadas) com índices
+#   invertidos produto/produtor/local -> linhas; as funções recommend_* pontuam esta tabela compacta.
+# - spatial_index: índice espacial (BallTree) sobre as coordenadas das ofertas, usado nas consultas com raio máximo.
+#   Também é o dicionário de coordenadas: cada oferta guarda em 'coord_id' o id da sua coordenada distinta,
+#   e as distâncias são calculadas uma vez por coordenada distinta e copiadas para as linhas por esse id.
+df_full_reviews = pd.DataFrame()
+offer_store = IndexedStore(build_aggregate_table(df_full_reviews))
+df_aggregates = offer_store.df
+spatial_index = SpatialIndex.from_frame(df_aggregates)
+
+# Memo de distâncias por posição do usuário: (modo, latitude, longitude) -> (índice, distâncias até cada
+# coordenada distinta). Usuários que repetem a posição não recalculam nenhuma distância.
+# Por padrão o memo não arredonda as posições (grade 0): a proximidade é normalizada pela maior distância,
+# e mesmo um deslocamento submétrico muda o resultado quando todos os candidatos estão na coordenada do usuário.
+DISTANCE_MEMO_ENTRIES = 4096
+DISTANCE_MEMO_GRID_DEG = 0
+distance_memo = RecommendationCache(
+    max_entries=DISTANCE_MEMO_ENTRIES, ttl_seconds=float('inf'), grid_size_deg=DISTANCE_MEMO_GRID_DEG
+)
+metrics.register_cache('distances', distance_memo) # Acertos do memo exportados em '/metrics'
+
+# Versão do contexto de dados refletida no estado atual (None enquanto nada foi carregado)
+loaded_version = None
+load_lock = threading.RLock()
+
+# Imprime os bytes por coluna da tabela de reviews a cada carga (esquema compacto de src.review_store)
+MEMORY_REPORT_ON_LOAD = True
+
+# Segmentos de reviews ingeridas (src.review_segments) já refletidos no estado do motor.
+# Segmentos gravados por outros processos (CLI de ingestão, outros workers) são verificados a cada
+# SEGMENT_POLL_SECONDS, na chamada de ensure_data.
+SEGMENT_POLL_SECONDS = 2.0
+segments_through = 0      # Último segmento já incorporado ao parquet base carregado
+applied_segments = set()  # Segmentos posteriores ao base já aplicados
+last_segment_poll = 0.0
+
+# Funções chamadas sempre que o dataset de reviews é substituído (ex.: invalidação de caches de resultados)
+reload_listeners = []
+
+
+# Índices de similaridade (src.similarity) são derivados da tabela agregada e refeitos após cada recarga ou lote.
+# A reconstrução roda em uma thread de segundo plano, fora do caminho das requisições (e do lock do contexto):
+# enquanto isso, o índice anterior continua respondendo; vizinhos sem oferta na tabela nova são ignorados.
+# Com False, o índice é descartado e reconstruído pela próxima consulta "mais como este".
+SIMILARITY_BACKGROUND_REBUILD = True
+similarity_lock = threading.Lock()
+similarity_rebuilding = False # Há uma thread de reconstrução em andamento
+
+
+# Função para agendar a reconstrução dos índices de similaridade após uma troca da tabela agregada
+def refresh_similarity():
+    """
+    Se os índices já estiverem carregados, inicia (uma única) thread que os reconstrói a partir da tabela atual.
+    Índices ainda não usados não são construídos: a primeira consulta que precisar deles os constrói.
+    """
+    global similarity_rebuilding
+    if not SIMILARITY_BACKGROUND_REBUILD:
+        context.discard_artifact('similarity')
+        return
+    if not context.is_loaded('similarity'):
+        return
+    with similarity_lock:
+        if similarity_rebuilding:
+            return # A thread em andamento confere a tabela atual ao terminar
+        similarity_rebuilding = True
+    threading.Thread(target=rebuild_similarity, name='similarity', daemon=True).start()
+
+
+# Função executada pela thread de reconstrução dos índices de similaridade
+def rebuild_similarity():
+    """
+    Constrói os índices da tabela agregada atual e os publica no contexto. Se a tabela mudou durante a
+    construção (outro lote ingerido), constrói de novo a partir da mais recente antes de publicar.
+    A decisão de encerrar e a liberação de 'similarity_rebuilding' ficam sob o mesmo lock, para que
+    nenhuma troca da tabela fique sem reconstrução.
+    """
+    global similarity_rebuilding
+    index, aggregates = None, None
+    try:
+        while True:
+            with similarity_lock:
+                if index is not None and aggregates is df_aggregates:
+                    context.replace_artifact('similarity', index) # Não publica se reload() descartou os índices
+                # Encerra com os índices em dia ou descartados por reload() (o próximo acesso os constrói)
+                if aggregates is df_aggregates or not context.is_loaded('similarity'):
+                    similarity_rebuilding = False
+                    return
+                aggregates = df_aggregates
+            index = build_similarity(aggregates)
+    except Exception as e:
+        print(f"Erro ao reconstruir os índices de similaridade: {e}")
+        context.discard_artifact('similarity') # A próxima consulta tenta reconstruí-los
+        with similarity_lock:
+            similarity_rebuilding = False
+
+
+reload_listeners.append(refresh_similarity)
+
+
+# Função para (re)definir o dataset de reviews usado pelo motor e reconstruir as estruturas derivadas
+def set_reviews(df_reviews):
+    """Substitui o DataFrame de reviews do motor e reconstrói a tabela agregada e seus índices (invertidos e espacial)."""
+    global df_full_reviews, df_aggregates, offer_store, spatial_index, loaded_version
+    # Constrói todas as estruturas antes de publicá-las, para que requisições em andamento não vejam um estado misto
+    new_offer_store = IndexedStore(build_aggregate_table(df_reviews))
+    new_spatial_index = SpatialIndex.from_frame(new_offer_store.df)
+    new_offer_store.df[COORD_ID_COLUMN] = new_spatial_index.coord_ids
+
+    df_full_reviews = df_reviews
+    spatial_index, offer_store, df_aggregates = new_spatial_index, new_offer_store, new_offer_store.df
+    loaded_version = context.version
+    distance_memo.clear() # As distâncias memorizadas referem-se às coordenadas do índice anterior
+    for listener in reload_listeners:
+        listener()
+
+
+# Função para carregar o dataset de reviews a partir do contexto de dados compartilhado
+def load_data():
+    """
+    Lê as reviews do contexto (parquet base + segmentos ingeridos ainda não compactados) e reconstrói
+    o estado do motor. Em caso de erro, o dataset fica vazio.
+    """
+    global segments_through, applied_segments
+    segments = []
+    through = 0
+    try:
+        # 'df_full_reviews.parquet' é o dataset principal com todas as avaliações e informações associadas.
+        df_reviews = context.reviews
+        through = base_through(context.reviews_path)
+        segments = list_segments(context.segments_dir, after=through)
+        if segments:
+            df_reviews = prepare_reviews(merge_reviews([df_reviews] + [read_segment(path) for _, path in segments]))
+    except FileNotFoundError:
+        print("Erro ao carregar recursos no recommender_engine. Verifique os caminhos dos arquivos.")
+        df_reviews = pd.DataFrame() # Define como DataFrame vazio para que a aplicação possa tratar a ausência dos dados
+    except Exception as e:
+        print(f"Erro ao carregar recursos no recommender_engine: {e}")
+        df_reviews = pd.DataFrame()
+    set_reviews(df_reviews)
+    segments_through, applied_segments = through, {sequence for sequence, _ in segments}
+    if MEMORY_REPORT_ON_LOAD and not df_reviews.empty:
+        print(format_memory_report(df_reviews))
+
+
+# Função para acrescentar um lote de reviews ao estado do motor sem reconstruí-lo a partir de todas as reviews
+def apply_review_batch(batch_reviews, segment=None):
+    """
+    Soma as contagens e avaliações do lote à tabela agregada (src.aggregates.merge_aggregate_tables),
+    de modo que 'media_avaliacao' e as médias por produto-produtor calculadas nas consultas já o incluem.
+    O novo estado é montado por completo antes de ser publicado: cada consulta vê o lote inteiro ou nada dele.
+    O índice espacial é publicado antes da tabela de ofertas; como os ids de coordenadas seguem a ordem
+    de primeira ocorrência, os ids da tabela anterior continuam válidos no novo índice.
+    'segment' é o número do segmento gravado para o lote (lotes já aplicados são ignorados).
+    Retorna False se o lote já havia sido aplicado.
+    """
+    global offer_store, df_aggregates, spatial_index
+    ensure_data()
+    with load_lock:
+        if segment is not None and (segment <= segments_through or segment in applied_segments):
+            return False
+        aggregates = offer_store.df.drop(columns=[COORD_ID_COLUMN], errors='ignore')
+        new_offer_store = IndexedStore(merge_aggregate_tables(aggregates, build_aggregate_table(batch_reviews)))
+        new_spatial_index = SpatialIndex.from_frame(new_offer_store.df)
+        new_offer_store.df[COORD_ID_COLUMN] = new_spatial_index.coord_ids
+
+        spatial_index = new_spatial_index
+        offer_store, df_aggregates = new_offer_store, new_offer_store.df
+        if segment is not None:
+            applied_segments.add(segment)
+        distance_memo.clear()
+        for listener in reload_listeners:
+            listener()
+    return True
+
+
+# Função para aplicar os segmentos gravados por outros processos
+def sync_segments():
+    """
+    Aplica, em ordem, os segmentos ainda não refletidos no motor. Se outro processo compactou segmentos
+    que este processo ainda não tinha aplicado, recarrega o parquet base.
+    """
+    global last_segment_poll, segments_through, applied_segments
+    with load_lock:
+        last_segment_poll = time.monotonic()
+        through = base_through(context.reviews_path)
+        if any(sequence not in applied_segments for sequence in range(segments_through + 1, through + 1)):
+            context.discard_artifact('reviews')
+            load_data()
+            return
+        if through > segments_through:
+            # Segmentos já aplicados foram compactados no parquet base
+            segments_through = through
+            applied_segments = {sequence for sequence in applied_segments if sequence > through}
+        for sequence, path in list_segments(context.segments_dir, after=max(through, segments_through)):
+            if sequence not in applied_segments:
+                apply_review_batch(prepare_reviews(read_segment(path)), segment=sequence)
+
+
+# Função para garantir que o motor tenha os dados da versão atual do contexto
+def ensure_data():
+    """
+    Carrega os dados na primeira chamada (ou após context.reload()) e aplica periodicamente os segmentos
+    ingeridos por outros processos. Retorna False se não houver reviews.
+    """
+    if loaded_version != context.version:
+        with load_lock:
+            if loaded_version != context.version:
+                load_data()
+    elif time.monotonic() - last_segment_poll > SEGMENT_POLL_SECONDS:
+        sync_segments()
+    return not offer_store.empty
+
+
+# Um reload() explícito do contexto recarrega o motor imediatamente (e invalida os caches registrados)
+context.reload_listeners.append(ensure_data)
+
+
+# Função para preparar o motor antes de criar processos de trabalho com fork()
+def preload_for_fork():
+    """
+    Carrega o dataset e constrói os índices no processo principal, antes do fork(), para que os filhos
+    herdem as mesmas páginas de memória (copy-on-write) em vez de cada um carregar sua própria cópia.
+    As estruturas do motor são arrays NumPy/Arrow e categóricas (sem um objeto Python por linha);
+    gc.freeze() move os objetos já existentes para a geração permanente do coletor de lixo, que deixa
+    de percorrê-los (e de escrever em seus cabeçalhos) nos processos filhos.
+    Retorna False se não houver reviews.
+    """
+    loaded = ensure_data()
+    gc.collect()
+    gc.freeze()
+    return loaded
+
+
+# Função para garantir que a fonte de dados de uma consulta esteja indexada
+def as_store(source):
+    """Retorna 'source' como IndexedStore; DataFrames avulsos são indexados na hora."""
+    if source is None:
+        ensure_data()
+        return offer_store
+    if isinstance(source, IndexedStore):
+        return source
+    return IndexedStore(source)
 
 # Função para calcular a distância geodésica entre duas coordenadas (latitude, longitude)
 def get_distance(coord1, coord2):
@@ -24,9 +273,10 @@ def get_distance(coord1, coord2):
     return geodesic(coord1, coord2).kilometers
 
 # Função para obter um conjunto inicial de candidatos para recomendação
-def get_recommendation_candidates(desired_products, producer, location):
+@metrics.timed('candidates')
+def get_recommendation_candidates(desired_products, producer, location, df_source=None):
     """
-    Filtra o DataFrame de reviews para encontrar candidatos iniciais baseados em:
+    Filtra as ofertas (tabela agregada indexada, ou 'df_source') para encontrar candidatos iniciais baseados em:
     - Produtos desejados
     - Produtor específico
     - Localização (Região Administrativa)
@@ -34,42 +284,42 @@ def get_recommendation_candidates(desired_products, producer, location):
     Itens que correspondem exatamente a todos os critérios de entrada (produtos desejados de um produtor específico)
     podem ser excluídos para focar em "alternativas" ou "descobertas", dependendo da interpretação.
     A lógica de exclusão de 'exact_match_criteria' precisa ser revisada se o objetivo for outro.
+    A seleção usa os índices invertidos: união/diferença de listas ordenadas de linhas.
     """
-    # global df_full_reviews # Não é mais necessário com a passagem explícita ou carregamento no início do módulo
+    store = as_store(df_source)
 
-    if df_full_reviews.empty:
+    if store.empty:
         return pd.DataFrame() # Retorna DataFrame vazio se não houver reviews carregados
 
     if isinstance(desired_products, str): # Garante que desired_products seja uma lista
         desired_products = [desired_products]
 
-    # Cria máscaras booleanas para cada critério de filtro
-    product_match = df_full_reviews['produto'].isin(desired_products) if desired_products else pd.Series([False] * len(df_full_reviews))
-    producer_match = df_full_reviews['nome_produtor'] == producer if producer else pd.Series([False] * len(df_full_reviews))
-    location_match = df_full_reviews['local'] == location if location else pd.Series([False] * len(df_full_reviews))
-    
-    # Combina as máscaras com OR: um item é candidato se corresponder a qualquer um dos critérios
-    candidates = df_full_reviews[product_match | producer_match | location_match].copy()
+    # Linhas de cada critério de filtro (listas ordenadas do índice invertido)
+    producer_rows = store.rows('nome_produtor', [producer] if producer else [])
+    location_rows = store.rows('local', [location] if location else [])
+
+    # Combina os critérios com OR: um item é candidato se corresponder a qualquer um deles
+    rows = np.union1d(producer_rows, location_rows)
 
     # Lógica de exclusão: Remove combinações que são consideradas "exatas" demais,
     # potencialmente para sugerir alternativas.
-    # ATENÇÃO: A lógica atual pode excluir todos os 'desired_products'.
+    # ATENÇÃO: A lógica atual exclui todos os 'desired_products' (as linhas que só entrariam pelo
+    # critério de produto são removidas em seguida, por isso nem chegam a ser unidas).
     # Isso pode ser intencional para um sistema que busca "outras opções além das já conhecidas/pedidas".
-    if desired_products: 
-        exact_match_criteria = (
-            (candidates['produto'].isin(desired_products) & (candidates['nome_produtor'] == producer if producer else False)) |
-            (candidates['produto'].isin(desired_products)) # Esta condição sozinha já remove todos os produtos desejados
-        )
-        candidates = candidates[~exact_match_criteria]
+    if desired_products:
+        rows = np.setdiff1d(rows, store.rows('produto', desired_products), assume_unique=True)
 
-    return candidates
+    return store.take(rows)
 
 
 # Função para calcular a distância de cada candidato em relação à localização do usuário e normalizá-la
-def normalize_distance(candidates, latitude, longitude):
+@metrics.timed('distance')
+def normalize_distance(candidates, latitude, longitude, mode=DEFAULT_DISTANCE_MODE):
     """
     Calcula a distância em km de cada candidato até o usuário e cria uma métrica de 'proximidade' (0 a 1).
     Distâncias infinitas (coordenadas ausentes) resultam em proximidade 0.
+    As distâncias são calculadas de uma só vez pelo motor vetorizado (src.distance);
+    'mode' escolhe entre 'vincenty' (equivalente ao geodesic) e 'haversine' (mais rápido).
     """
     if candidates.empty or 'latitude' not in candidates.columns or 'longitude' not in candidates.columns:
         # Se o DataFrame não estiver vazio mas faltarem colunas de coordenadas, adiciona-as com valores padrão.
@@ -78,36 +328,97 @@ def normalize_distance(candidates, latitude, longitude):
             candidates['proximidade'] = 0.0
         return candidates
         
-    # Calcula a distância para cada candidato
-    candidates['distancia_km'] = candidates.apply(
-        lambda row: get_distance((latitude, longitude), (row['latitude'], row['longitude']))
-        if pd.notnull(row['latitude']) and pd.notnull(row['longitude']) else float('inf'), # Distância infinita se coordenadas ausentes
-        axis=1
-    )
-    
-    valid_distances = candidates['distancia_km'][candidates['distancia_km'] != float('inf')]
-    if not valid_distances.empty:
-        max_dist = valid_distances.max()
-        if max_dist == 0: # Se a distância máxima for 0 (todos os pontos no local do usuário ou apenas um ponto)
-             candidates['proximidade'] = candidates['distancia_km'].apply(lambda x: 1.0 if x == 0 else 0.0) # Proximidade é 1 se a distância é 0, senão 0
-        else:
-            # Normaliza a distância para uma pontuação de proximidade (1 - distancia_normalizada)
-            # Quanto menor a distância, maior a proximidade.
-            candidates['proximidade'] = 1 - (candidates['distancia_km'] / max_dist)
-            candidates.loc[candidates['distancia_km'] == float('inf'), 'proximidade'] = 0 # Garante que distâncias infinitas tenham proximidade 0
-    else: # Caso todas as distâncias sejam infinitas ou não haja distâncias válidas
-        candidates['proximidade'] = 0.0
-        
+    if COORD_ID_COLUMN in candidates.columns:
+        # Ofertas da tabela indexada: uma distância por coordenada distinta, copiada para as linhas pelo id
+        distances = gather_distances(
+            location_distances([latitude], [longitude], mode)[0], candidates[COORD_ID_COLUMN].to_numpy()
+        )
+    else:
+        # Calcula a distância para todos os candidatos em uma única passada (NaN -> distância infinita)
+        distances = distances_km(
+            latitude, longitude,
+            candidates['latitude'].to_numpy(dtype=float),
+            candidates['longitude'].to_numpy(dtype=float),
+            mode=mode
+        )
+    candidates['distancia_km'] = distances
+    candidates['proximidade'] = proximity_from_distances(distances)
     return candidates
 
 
+# Função para calcular (ou recuperar do memo) as distâncias de usuários até as coordenadas distintas das ofertas
+def location_distances(latitudes, longitudes, mode=DEFAULT_DISTANCE_MODE):
+    """
+    Retorna a matriz usuários x coordenadas distintas do índice espacial, em km.
+    As posições são arredondadas pela grade do memo (se houver) e as distâncias são calculadas a partir delas;
+    somente as posições ainda não memorizadas são calculadas (todas juntas, em uma matriz).
+    """
+    index = spatial_index # Referência local: set_reviews pode trocar o índice durante a consulta
+    positions = [distance_memo.quantize(float(lat), float(lon)) for lat, lon in zip(latitudes, longitudes)]
+    rows = [None] * len(positions)
+    missing = []
+    for i, (latitude, longitude) in enumerate(positions):
+        entry = distance_memo.get((mode, latitude, longitude))
+        if entry is not None and entry[0] is index:
+            rows[i] = entry[1]
+        else:
+            missing.append(i)
+
+    if missing:
+        computed = distance_matrix_km(
+            [positions[i][0] for i in missing], [positions[i][1] for i in missing],
+            index.coordinates[:, 0], index.coordinates[:, 1], mode=mode
+        )
+        for i, distances in zip(missing, computed):
+            rows[i] = distances
+            distance_memo.put((mode, *positions[i]), (index, distances))
+
+    if not rows:
+        return np.empty((0, len(index)))
+    return np.vstack(rows)
+
+
+# Função para copiar as distâncias por coordenada distinta para as linhas dos candidatos
+def gather_distances(location_rows, coord_ids):
+    """
+    Seleciona, para cada candidato, a distância da sua coordenada ('coord_ids'; -1 = sem coordenada -> infinito).
+    Aceita um vetor de distâncias (um usuário) ou uma matriz usuários x coordenadas distintas.
+    """
+    coord_ids = np.asarray(coord_ids, dtype=np.int64)
+    location_rows = np.asarray(location_rows, dtype=float)
+    if location_rows.shape[-1] == 0:
+        return np.full(location_rows.shape[:-1] + coord_ids.shape, np.inf)
+    distances = np.take(location_rows, np.maximum(coord_ids, 0), axis=-1)
+    return np.where(coord_ids >= 0, distances, np.inf)
+
+
+# Função para converter distâncias em proximidade (0 a 1), por linha de uma matriz ou para um vetor
+def proximity_from_distances(distances):
+    """
+    Normaliza as distâncias pela maior distância finita (última dimensão): proximidade = 1 - distancia / max.
+    Distâncias infinitas têm proximidade 0; se a maior distância for 0, a proximidade é 1 onde a distância é 0.
+    Aceita um vetor (um usuário) ou uma matriz usuários x candidatos (recomendações em lote).
+    """
+    distances = np.asarray(distances, dtype=float)
+    finite = np.isfinite(distances)
+    # Maior distância finita de cada usuário (-inf quando não há nenhuma distância válida)
+    max_dist = np.max(np.where(finite, distances, -np.inf), axis=-1, keepdims=True, initial=-np.inf)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Quanto menor a distância, maior a proximidade; distâncias infinitas ficam com proximidade 0.
+        proximity = np.where(finite, 1 - (distances / max_dist), 0.0)
+    # Se a distância máxima for 0 (todos os pontos no local do usuário ou apenas um ponto)
+    return np.where(max_dist == 0, np.where(distances == 0, 1.0, 0.0), proximity)
+
+
 # Função para calcular a avaliação média por combinação produto-produtor e normalizá-la
+@metrics.timed('average_rating')
 def calculate_average_rating(candidates):
     """
     Calcula a avaliação média para cada par (produto, nome_produtor) e normaliza essa avaliação (0 a 1).
     Adiciona as colunas 'media_produtor_produto' e 'avaliacao_norm' aos candidatos.
     """
-    if candidates.empty or 'avaliacao' not in candidates.columns:
+    if candidates.empty or ('avaliacao' not in candidates.columns and 'soma_avaliacao' not in candidates.columns):
         # Adiciona colunas de avaliação com valores padrão se não existirem ou se o DataFrame estiver vazio.
         if not candidates.empty:
             candidates['media_produtor_produto'] = 0.0
@@ -127,6 +438,12 @@ def calculate_average_rating(candidates):
             candidates['avaliacao_norm'] = 0.0
             return candidates
 
+    # Candidatos vindos da tabela agregada: a média do par é a soma total dividida pela contagem total
+    if 'soma_avaliacao' in candidates.columns and 'contagem' in candidates.columns:
+        candidates['media_produtor_produto'] = weighted_mean(candidates, ['produto', 'nome_produtor'])
+        candidates['avaliacao_norm'] = candidates['media_produtor_produto'] / 5.0
+        return candidates
+
     # Calcula a média da 'avaliacao' agrupando por 'produto' e 'nome_produtor'
     candidates['media_produtor_produto'] = (
         candidates.groupby(['produto', 'nome_produtor'])['avaliacao']
@@ -138,103 +455,157 @@ def calculate_average_rating(candidates):
 
 
 # Função para calcular o score final de uma recomendação com base em diversos fatores e pesos
-def calculate_score(recommendation_type: int, is_organic_preference: int, feature_values: list) -> float:
+def calculate_score(recommendation_type: int, is_organic_preference: int, feature_values: list, affinity: float = None) -> float:
     """
     Calcula um score para um item de recomendação.
     - recommendation_type: 0 para Produtos, 1 para Produtores, 2 para Produtos de um Produtor.
     - is_organic_preference: 1 se o usuário quer orgânicos, 0 se selecionou "Não".
     - feature_values: Lista contendo [avaliacao_norm, proximidade, item_is_organic_actual (0 ou 1)]
+    - affinity: afinidade prevista do usuário com o item (0 a 1), nas consultas personalizadas.
     Os pesos são ajustados com base no tipo de recomendação e na preferência por orgânicos.
     """
-    weights = {
-        "rating": 0.5,      # Peso padrão para avaliação
-        "proximity": 0.5,   # Peso padrão para proximidade
-        "organic_bonus_or_penalty": 0.0 # Peso para o status orgânico do item
-    }
-    
-    # Para "Melhores Produtos" (tipo 0) ou "Melhores Produtos de Produtor" (tipo 2)
-    if recommendation_type in (0, 2):
-        if is_organic_preference == 1: # Usuário especificou preferência por orgânicos
-            weights.update({
-                "rating": 0.3,
-                "proximity": 0.5,
-                "organic_bonus_or_penalty": 0.2 # Bônus para itens que são orgânicos
-            })
-        else: # Usuário selecionou "Não" para orgânicos (is_organic_preference == 0)
-            weights.update({
-                "rating": 0.5, 
-                "proximity": 0.5, 
-                "organic_bonus_or_penalty": -1.0 # Penalidade alta para itens orgânicos se o usuário não os quer
-            })
-        # feature_values[0] = avaliacao_norm
-        # feature_values[1] = proximidade
-        # feature_values[2] = item_is_organic_actual (status orgânico real do item)
-        return (
-            weights["rating"] * feature_values[0]
-            + weights["proximity"] * feature_values[1]
-            + weights["organic_bonus_or_penalty"] * feature_values[2]
-        )
+    score = base_score(recommendation_type, is_organic_preference, feature_values)
+    if affinity is not None:
+        score = (1 - AFFINITY_WEIGHT) * score + AFFINITY_WEIGHT * affinity
+    return score
 
-    # Para "Melhores Produtores" (tipo 1)
-    elif recommendation_type == 1:
-        # A preferência por orgânicos não afeta diretamente o score dos produtores nesta lógica.
-        # O status orgânico considerado (feature_values[2]) seria o do produtor em si (se vende algo orgânico, por exemplo).
-        weights.update({
-            "rating": 0.7, # Maior peso para a avaliação média do produtor
-            "proximity": 0.3,
-            # "organic_bonus_or_penalty": 0.0 # Não há bônus/penalidade explícita por orgânico no score do produtor aqui
-        })
-        # Para o tipo 1, a fórmula original usa apenas avaliação e proximidade.
-        # feature_values[2] (status orgânico do produtor) não é usado nesta fórmula específica.
-        return (
-            weights["rating"] * feature_values[0]  # avaliacao_norm (média do produtor)
-            + weights["proximity"] * feature_values[1]  # proximidade
-        )
-    return 0.0 # Score padrão se o tipo de recomendação não for reconhecido
+
+# Função para calcular o score de um item com o perfil de pesos registrado em src.scoring, sem a afinidade do usuário
+def base_score(recommendation_type, is_organic_preference, feature_values):
+    """
+    Soma ponderada de feature_values ([avaliacao_norm, proximidade, orgânico]) com os pesos de get_weights.
+    A soma segue a ordem das colunas e ignora pesos nulos, como score_features: os scores são idênticos bit a bit.
+    Tipos sem perfil registrado têm score 0.
+    """
+    score = 0.0
+    for weight, value in zip(get_weights(recommendation_type, is_organic_preference).tolist(), feature_values):
+        if weight != 0:
+            score = score + weight * value
+    return score
 
 
-# Função principal para recomendar os "Melhores Produtos"
-def recommend_best_products(desired_products, producer, location, organic_preference, latitude, longitude):
+# Função para numerar os grupos de 'key' (valores ausentes formam um grupo próprio)
+def group_codes(candidates, key):
     """
-    Recomenda os melhores produtos com base nos filtros, preferência por orgânicos e localização do usuário.
-    Combina filtros, cálculo de distância, avaliação média e score para classificar os produtos.
+    Retorna o número do grupo de cada linha. Colunas categóricas (as da tabela de ofertas) são combinadas
+    pelos seus códigos inteiros, sem o custo de montar um groupby; as demais usam groupby().ngroup().
+    A numeração dos grupos não precisa seguir nenhuma ordem: select_top_k decide pelas posições das linhas.
     """
-    if df_full_reviews.empty:
-        return pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']})
+    if isinstance(key, str):
+        key = [key]
+    columns = [candidates[column] for column in key]
+    if not all(isinstance(column.dtype, pd.CategoricalDtype) for column in columns):
+        return candidates.groupby(key, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+
+    combined = np.zeros(len(candidates), dtype=np.int64)
+    for column in columns:
+        # Código -1 (valor ausente) vira 0; as categorias ocupam 1..n
+        combined = combined * (len(column.cat.categories) + 1) + (column.cat.codes.to_numpy().astype(np.int64) + 1)
+    return np.unique(combined, return_inverse=True)[1].ravel()
+
+
+# Função para selecionar os k melhores candidatos sem ordenar todo o conjunto
+@metrics.timed('sort')
+def select_top_k(candidates, k, key=None, score_column='score'):
+    """
+    Retorna as 'k' linhas de maior score, em ordem decrescente, mantendo apenas a melhor linha de cada 'key'
+    (equivale a sort_values + drop_duplicates + head, sem a ordenação completa).
+    - Deduplicação: máximo do score por grupo, em uma passada (O(n)).
+    - Seleção: np.argpartition sobre os representantes dos grupos (O(#grupos)); só os k escolhidos são ordenados.
+    Empates são resolvidos de forma determinística pela posição da linha (a primeira ocorrência vence),
+    inclusive na fronteira do k-ésimo lugar. Scores NaN ficam por último.
+    """
+    if candidates.empty or k <= 0:
+        return candidates.iloc[0:0]
 
-    # 1. Obter candidatos iniciais
-    candidates = get_recommendation_candidates(desired_products, producer, location)
+    scores = candidates[score_column].to_numpy(dtype=float)
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    positions = np.arange(len(scores))
+
+    if key:
+        # Representante de cada grupo: linha de maior score (a de menor posição em caso de empate)
+        codes = group_codes(candidates, key)
+        n_groups = codes.max() + 1
+        group_max = np.full(n_groups, -np.inf)
+        np.maximum.at(group_max, codes, scores)
+        is_max = scores == group_max[codes]
+        best = np.full(n_groups, len(scores))
+        np.minimum.at(best, codes[is_max], positions[is_max])
+        positions, scores = best, scores[best]
+
+    if len(positions) > k:
+        # Valor do k-ésimo maior score: tudo acima entra; empatados com ele entram por ordem de posição
+        threshold = -np.partition(-scores, k - 1)[k - 1]
+        above = scores > threshold
+        tied = np.flatnonzero(scores == threshold)
+        tied = tied[np.argsort(positions[tied], kind='stable')][:k - np.count_nonzero(above)]
+        keep = np.concatenate((np.flatnonzero(above), tied))
+        positions, scores = positions[keep], scores[keep]
+
+    # Ordena apenas os selecionados: score decrescente, posição crescente nos empates
+    order = np.lexsort((positions, -scores))
+    return candidates.iloc[positions[order]]
+
+
+# Função para obter o modelo de filtragem colaborativa (src.personalization), carregado no primeiro uso
+def current_user_model():
+    """Retorna o UserFactorModel treinado offline, ou None se 'model/user_factors.npz' não existir."""
+    return context.get_artifact('user_factors', lambda: load_user_model(context.path(*USER_FACTORS_PATH)))
+
+
+# Função para misturar ao score dos candidatos a afinidade prevista de um usuário
+@metrics.timed('personalize')
+def personalize_scores(candidates, scores, user_id, by_producer=False):
+    """
+    Com 'user_id' conhecido pelo modelo, retorna os scores misturados à afinidade prevista (src.scoring.blend_affinity)
+    de cada par produto-produtor ('by_producer': de cada produtor). Sem usuário ou modelo, os scores não mudam.
+    """
+    if not user_id:
+        return scores
+    model = current_user_model()
+    if model is None:
+        return scores
+    if by_producer:
+        affinity = model.producer_affinity(user_id, candidates['nome_produtor'])
+    else:
+        affinity = model.affinity(user_id, candidates['produto'], candidates['nome_produtor'])
+    return blend_affinity(scores, affinity)
+
+
+# Função que prepara os candidatos de "Melhores Produtos" (etapas que não dependem da localização do usuário)
+def prepare_best_products(desired_products, producer, location):
+    """
+    Seleciona as ofertas candidatas e calcula sua avaliação média.
+    O resultado pode ser reaproveitado por várias consultas com os mesmos filtros (recomendações em lote).
+    """
+    # 1. Obter candidatos iniciais (ofertas da tabela agregada)
+    candidates = get_recommendation_candidates(desired_products, producer, location, df_source=offer_store)
+    metrics.record_candidates(len(candidates))
 
     if candidates.empty:
         return pd.DataFrame() # Retorna DataFrame vazio se nenhum candidato for encontrado
 
-    # 2. Calcular e normalizar distância
-    candidates = normalize_distance(candidates, latitude, longitude)
-    # 3. Calcular avaliação média
+    # 2. Calcular avaliação média (ponderada pelas contagens da tabela agregada)
     candidates = calculate_average_rating(candidates) # Cria 'media_produtor_produto' e 'avaliacao_norm'
 
     # Garante que a coluna 'organico' (0 ou 1) exista nos candidatos
     if 'organico' not in candidates.columns:
         candidates['organico'] = 0 # Fallback: assume não orgânico se a coluna estiver ausente
-        
-    # Prepara os dados para cálculo do score
-    features_values_df = pd.DataFrame({
-        'avaliacao_norm': candidates['avaliacao_norm'],
-        'proximidade': candidates['proximidade'],
-        'item_is_organic_actual': candidates['organico'] # Status orgânico real do item
-    })
-    
-    # 4. Calcular score para cada candidato
-    candidates["score"] = features_values_df.apply(
-        lambda row: calculate_score(0, organic_preference, row.tolist()), axis=1 # Tipo 0 para "Melhores Produtos"
-    )
+    return candidates
 
-    # 5. Ordenar por score e selecionar os top N (ex: 5)
-    top_recommendations = (
-        candidates.sort_values(by='score', ascending=False)
-        .drop_duplicates(subset=['produto', 'nome_produtor']) # Mantém o melhor score para cada par produto-produtor
-        .head(5)
-    )
+
+# Função que pontua e ordena candidatos de "Melhores Produtos" que já possuem 'distancia_km' e 'proximidade'
+def rank_best_products(candidates, organic_preference, top_n=5, user_id=None):
+    """
+    Calcula o score de cada candidato e retorna os 'top_n' melhores pares produto-produtor.
+    Com 'user_id', o score inclui a afinidade prevista do usuário com cada par.
+    """
+    # Calcular o score de todos os candidatos de uma vez (matriz de features x pesos do perfil)
+    # Colunas: avaliacao_norm, proximidade e organico (status orgânico real do item); tipo 0 para "Melhores Produtos"
+    candidates["score"] = personalize_scores(candidates, score_candidates(candidates, 0, organic_preference), user_id)
+
+    # Selecionar os top N (ex: 5) por score, mantendo o melhor score para cada par produto-produtor
+    top_recommendations = select_top_k(candidates, top_n, key=['produto', 'nome_produtor'])
 
     # Retorna as colunas relevantes, incluindo latitude/longitude para o mapa
     return top_recommendations[[
@@ -243,30 +614,67 @@ def recommend_best_products(desired_products, producer, location, organic_prefer
     ]].round({'media_produtor_produto': 2, 'distancia_km': 2, 'score': 2})
 
 
+# Função principal para recomendar os "Melhores Produtos"
+def recommend_best_products(desired_products, producer, location, organic_preference, latitude, longitude, top_n=5, user_id=None):
+    """
+    Recomenda os melhores produtos com base nos filtros, preferência por orgânicos e localização do usuário.
+    Combina filtros, cálculo de distância, avaliação média e score para classificar os produtos.
+    Com 'user_id', o ranking é personalizado pela afinidade prevista do usuário (src.personalization).
+    """
+    if not ensure_data():
+        return pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']})
+
+    # 1-2. Obter candidatos iniciais e sua avaliação média
+    candidates = prepare_best_products(desired_products, producer, location)
+
+    if candidates.empty:
+        return pd.DataFrame() # Retorna DataFrame vazio se nenhum candidato for encontrado
+
+    # 3. Calcular e normalizar distância
+    candidates = normalize_distance(candidates, latitude, longitude)
+    # 4-5. Calcular score, ordenar e selecionar os melhores
+    return rank_best_products(candidates, organic_preference, top_n, user_id)
+
+
 # Função auxiliar para obter produtores candidatos com base em um produto de interesse
-def get_producer_recomendation(df_reviews, product_of_interest):
+@metrics.timed('candidates')
+def get_producer_recomendation(df_reviews, product_of_interest, within_rows=None):
     """
-    Filtra o DataFrame de reviews para encontrar produtores.
+    Filtra o DataFrame de reviews (ou o armazenamento indexado) para encontrar produtores.
     Se 'product_of_interest' for fornecido, retorna produtores que vendem esse produto.
     Caso contrário, retorna todos os produtores distintos presentes nas reviews.
+    'within_rows' (lista ordenada de linhas, por exemplo do índice espacial) restringe a busca a essas linhas.
+    Quando 'df_reviews' é a tabela agregada, 'contagem' e 'soma_avaliacao' de cada linha retornada
+    passam a ser os totais do produtor entre as ofertas filtradas.
     """
-    if df_reviews.empty:
+    store = as_store(df_reviews)
+    if store.empty:
         return pd.DataFrame()
         
     if product_of_interest and product_of_interest.strip() != "":
-        # Filtra reviews pelo produto de interesse
-        candidates = df_reviews[df_reviews['produto'] == product_of_interest].copy()
+        # Filtra pelo produto de interesse usando o índice invertido
+        rows = store.rows('produto', product_of_interest)
     else: # Se nenhum produto específico, considera todos os produtores
-        candidates = df_reviews.copy()
+        rows = store.all_rows()
+    if within_rows is not None:
+        rows = np.intersect1d(rows, within_rows, assume_unique=True)
+    candidates = store.take(rows)
 
     if candidates.empty:
         return pd.DataFrame() 
+
+    # Acumula as avaliações de todas as ofertas filtradas do produtor antes de deduplicar
+    if 'soma_avaliacao' in candidates.columns and 'contagem' in candidates.columns:
+        grouped = candidates.groupby('nome_produtor', sort=False, observed=True)
+        candidates['soma_avaliacao'] = grouped['soma_avaliacao'].transform('sum')
+        candidates['contagem'] = grouped['contagem'].transform('sum')
     
     # Retorna produtores únicos, mantendo a primeira ocorrência de cada um para preservar suas informações
     return candidates.drop_duplicates(subset=['nome_produtor'], keep='first')
 
 
 # Função para calcular a avaliação média de cada produtor
+@metrics.timed('average_rating')
 def calculate_average_producer_rating(candidates_df_from_reviews):
     """
     Calcula a avaliação média geral para cada produtor com base nas reviews fornecidas.
@@ -277,6 +685,9 @@ def calculate_average_producer_rating(candidates_df_from_reviews):
         return pd.DataFrame()
 
     grouping_cols = ['nome_produtor', 'local', 'latitude', 'longitude']
+    # O id da coordenada depende apenas de latitude/longitude: mantê-lo no agrupamento preserva o dicionário de coordenadas
+    if COORD_ID_COLUMN in candidates_df_from_reviews.columns:
+        grouping_cols.append(COORD_ID_COLUMN)
     # Assume que 'organico' no nível do produtor significa algo como "certificado" ou "vende produtos orgânicos".
     # Esta coluna deve vir do df_full_reviews e ser mantida em get_producer_recomendation.
     if 'organico' in candidates_df_from_reviews.columns:
@@ -289,12 +700,22 @@ def calculate_average_producer_rating(candidates_df_from_reviews):
              if 'organico' not in grouping_cols: grouping_cols.append('organico_placeholder_producer')
 
     # Agrega as reviews para obter estatísticas por produtor
-    producer_agg = (
-        candidates_df_from_reviews.groupby(grouping_cols, observed=True, dropna=False)
-        .agg(
-            media_avaliacao=('avaliacao', 'mean'), # Média das avaliações do produtor
-            ).reset_index()
-    )
+    if 'soma_avaliacao' in candidates_df_from_reviews.columns and 'contagem' in candidates_df_from_reviews.columns:
+        # Linhas da tabela agregada: média = soma total / contagem total
+        producer_agg = (
+            candidates_df_from_reviews.groupby(grouping_cols, observed=True, dropna=False)
+            .agg(soma_avaliacao=('soma_avaliacao', 'sum'), contagem=('contagem', 'sum'))
+            .reset_index()
+        )
+        producer_agg['media_avaliacao'] = producer_agg['soma_avaliacao'] / producer_agg['contagem']
+        producer_agg = producer_agg.drop(columns=['soma_avaliacao', 'contagem'])
+    else:
+        producer_agg = (
+            candidates_df_from_reviews.groupby(grouping_cols, observed=True, dropna=False)
+            .agg(
+                media_avaliacao=('avaliacao', 'mean'), # Média das avaliações do produtor
+                ).reset_index()
+        )
     # Renomeia ou remove a coluna placeholder de orgânico, se usada.
     if 'organico_placeholder_producer' in producer_agg.columns and 'organico' not in producer_agg.columns :
         producer_agg.rename(columns={'organico_placeholder_producer': 'organico'}, inplace=True)
@@ -310,18 +731,15 @@ def calculate_average_producer_rating(candidates_df_from_reviews):
     return producer_agg
 
 
-# Função principal para recomendar os "Melhores Produtores"
-def recommend_best_productors(product_of_interest, latitude, longitude, organic_preference=0, top_n=5):
+# Função que prepara os candidatos de "Melhores Produtores" (etapas que não dependem da localização do usuário)
+def prepare_best_productors(product_of_interest, within_rows=None):
     """
-    Recomenda os melhores produtores, opcionalmente filtrados por um produto de interesse.
-    Classifica os produtores com base em sua avaliação média, proximidade e, potencialmente, status orgânico.
-    A 'organic_preference' do usuário não é usada diretamente no score tipo 1 pela função 'calculate_score' atual.
+    Seleciona os produtores candidatos (que vendem o produto ou todos) e calcula sua avaliação média.
+    'within_rows' restringe a seleção às linhas informadas (por exemplo, as do índice espacial).
     """
-    if df_full_reviews.empty:
-        return pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']})
-
-    # 1. Obter produtores candidatos (que vendem o produto ou todos)
-    producers_from_reviews = get_producer_recomendation(df_full_reviews, product_of_interest)
+    # 1. Obter produtores candidatos (que vendem o produto ou todos) a partir da tabela agregada
+    producers_from_reviews = get_producer_recomendation(offer_store, product_of_interest, within_rows=within_rows)
+    metrics.record_candidates(len(producers_from_reviews))
 
     if producers_from_reviews.empty:
         return pd.DataFrame()
@@ -332,28 +750,26 @@ def recommend_best_productors(product_of_interest, latitude, longitude, organic_
     if producers_details.empty:
         return pd.DataFrame()
 
-    # 3. Calcular e normalizar distância
-    producers_details = normalize_distance(producers_details, latitude, longitude)
-    
     # Garante que a coluna 'organico' (status do produtor) exista para o score
     if 'organico' not in producers_details.columns:
         producers_details['organico'] = 0 # Fallback: assume não orgânico
+    return producers_details
+
 
-    # Prepara os dados para cálculo do score
-    features_values_df = pd.DataFrame({
-        'avaliacao_norm': producers_details['avaliacao_norm'],
-        'proximidade': producers_details['proximidade'],
-        'item_is_organic_actual': producers_details['organico'] # Status orgânico do produtor
-    })
-
-    # 4. Calcular score para cada produtor
-    # Para recomendação tipo 1 (produtores), 'organic_preference' do usuário não é usada pela 'calculate_score'.
-    producers_details["score"] = features_values_df.apply(
-        lambda row: calculate_score(1, organic_preference, row.tolist()), axis=1 # Tipo 1 para "Melhores Produtores"
+# Função que pontua e ordena produtores candidatos que já possuem 'distancia_km' e 'proximidade'
+def rank_best_productors(producers_details, organic_preference=0, top_n=5, user_id=None):
+    """
+    Calcula o score de cada produtor e retorna os 'top_n' melhores.
+    Com 'user_id', o score inclui a afinidade prevista do usuário com cada produtor.
+    """
+    # Calcular o score de todos os produtores de uma vez (matriz de features x pesos do perfil)
+    # Para recomendação tipo 1 (produtores), o perfil de pesos não usa 'organic_preference' nem o status orgânico.
+    producers_details["score"] = personalize_scores(
+        producers_details, score_candidates(producers_details, 1, organic_preference), user_id, by_producer=True
     )
     
-    # 5. Ordenar por score e selecionar os top N
-    top_result = producers_details.sort_values(by='score', ascending=False).head(top_n)
+    # Selecionar os top N por score
+    top_result = select_top_k(producers_details, top_n)
 
     # Retorna as colunas relevantes
     return top_result[[
@@ -362,78 +778,367 @@ def recommend_best_productors(product_of_interest, latitude, longitude, organic_
     ]].round({'media_avaliacao': 2, 'distancia_km': 2, 'score': 2})
 
 
+# Função principal para recomendar os "Melhores Produtores"
+def recommend_best_productors(product_of_interest, latitude, longitude, organic_preference=0, top_n=5, max_distance_km=None, user_id=None):
+    """
+    Recomenda os melhores produtores, opcionalmente filtrados por um produto de interesse.
+    Classifica os produtores com base em sua avaliação média, proximidade e, potencialmente, status orgânico.
+    A 'organic_preference' do usuário não é usada diretamente no score tipo 1 pela função 'calculate_score' atual.
+    Com 'max_distance_km', responde "os melhores top_n produtores a até R km": o índice espacial descarta
+    os pontos mais distantes antes do cálculo de score, e a proximidade é normalizada entre os que restam.
+    Com 'user_id', o ranking é personalizado pela afinidade prevista do usuário (src.personalization).
+    """
+    if not ensure_data():
+        return pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']})
+
+    # 0. Restringir às ofertas dentro do raio máximo, se informado
+    within_rows = None
+    if max_distance_km is not None:
+        within_rows = spatial_index.rows_within(latitude, longitude, max_distance_km)
+
+    # 1-2. Obter produtores candidatos e sua avaliação média
+    producers_details = prepare_best_productors(product_of_interest, within_rows=within_rows)
+
+    if producers_details.empty:
+        return pd.DataFrame()
+
+    # 3. Calcular e normalizar distância
+    producers_details = normalize_distance(producers_details, latitude, longitude)
+    # 4-5. Calcular score, ordenar e selecionar os top N
+    return rank_best_productors(producers_details, organic_preference, top_n, user_id)
+
+
 # Função auxiliar para obter produtos de um produtor específico, excluindo uma lista de indesejados
-def get_products_recomendation(df_source_reviews, producer_name, unwanted_products_list):
+@metrics.timed('candidates')
+def get_products_recomendation(df_source_reviews, producer_name, unwanted_products_list, local_filter=None):
     """
-    Filtra o DataFrame de reviews para encontrar produtos de um 'producer_name' específico.
-    Exclui produtos que estão na 'unwanted_products_list'.
+    Filtra o DataFrame de reviews (ou o armazenamento indexado) para encontrar produtos de um 'producer_name' específico.
+    Exclui produtos que estão na 'unwanted_products_list' e, se 'local_filter' for informado,
+    mantém apenas as ofertas dessa Região Administrativa.
     """
-    if df_source_reviews.empty or not producer_name:
+    store = as_store(df_source_reviews)
+    if store.empty or not producer_name:
         return pd.DataFrame()
 
     if unwanted_products_list is None:
         unwanted_products_list = []
 
-    # Filtra por nome do produtor e remove produtos indesejados
-    candidates = df_source_reviews[
-        (df_source_reviews['nome_produtor'] == producer_name) &
-        (~df_source_reviews['produto'].isin(unwanted_products_list)) # '~' é o operador NOT para boolean Series
-    ].copy()
+    # Linhas do produtor, sem os produtos indesejados (interseção/diferença de listas ordenadas)
+    rows = store.rows('nome_produtor', producer_name)
+    if local_filter:
+        rows = np.intersect1d(rows, store.rows('local', local_filter), assume_unique=True)
+    if unwanted_products_list:
+        rows = np.setdiff1d(rows, store.rows('produto', unwanted_products_list), assume_unique=True)
+    
+    return store.take(rows)
+
+
+# Função que prepara os candidatos de "Produtos de um Produtor" (etapas que não dependem da localização do usuário)
+def prepare_best_product_productors(producer_name, local_filter, unwanted_products=None):
+    """Seleciona as ofertas do produtor (no local, se informado) e calcula a avaliação média de cada produto."""
+    # 1. Obter produtos do produtor (excluindo indesejados) a partir das ofertas indexadas
+    # 2. O filtro de local (Região Administrativa), se fornecido, é aplicado na mesma seleção
+    candidates = get_products_recomendation(offer_store, producer_name, unwanted_products, local_filter=local_filter)
+    metrics.record_candidates(len(candidates))
+
+    if candidates.empty: # Nenhum produto deste produtor (na RA especificada, se houver)
+        return pd.DataFrame() 
+
+    # 3. Calcular avaliação média dos produtos (agrupado por produto e nome_produtor)
+    candidates = calculate_average_rating(candidates) 
     
+    # Garante que a coluna 'organico' (status do produto) exista
+    if 'organico' not in candidates.columns:
+        candidates['organico'] = 0 # Fallback
     return candidates
 
 
+# Função que pontua e ordena produtos de um produtor que já possuem 'distancia_km' e 'proximidade'
+def rank_best_product_productors(candidates, organic_preference, top_n=5, user_id=None):
+    """
+    Calcula o score de cada produto candidato e retorna os 'top_n' melhores produtos distintos.
+    Com 'user_id', o score inclui a afinidade prevista do usuário com cada produto do produtor.
+    """
+    # Calcular o score de todos os candidatos de uma vez (matriz de features x pesos do perfil)
+    # Colunas: avaliacao_norm, proximidade e organico (status orgânico real do item); tipo 2 para "Produtos de Produtor"
+    candidates["score"] = personalize_scores(candidates, score_candidates(candidates, 2, organic_preference), user_id)
+    
+    # Selecionar os top N por score, mantendo apenas o melhor score de cada produto
+    resultado = select_top_k(candidates, top_n, key=['produto'])
+
+    # Retorna as colunas relevantes
+    return resultado[['produto', 'nome_produtor', 'local', 'organico', 
+                      'media_produtor_produto', 'distancia_km', 'score', 'latitude', 'longitude'
+                      ]].round({'media_produtor_produto': 2, 'distancia_km': 2, 'score': 2})
+
+
 # Função principal para recomendar os "Melhores Produtos de um Produtor Específico"
-def recommend_best_product_productors(producer_name, local_filter, organic_preference, latitude, longitude, unwanted_products=None):
+def recommend_best_product_productors(producer_name, local_filter, organic_preference, latitude, longitude, unwanted_products=None, top_n=5, user_id=None):
     """
     Recomenda os melhores produtos de um produtor específico, com opção de filtro por local (RA)
     e preferência por orgânicos.
+    Com 'user_id', o ranking é personalizado pela afinidade prevista do usuário (src.personalization).
     """
-    if df_full_reviews.empty:
+    if not ensure_data():
         return pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']})
     if not producer_name:
          return pd.DataFrame({'mensagem': ['Nome do produtor não fornecido.']})
 
-    # 1. Obter produtos do produtor (excluindo indesejados)
-    candidates = get_products_recomendation(df_full_reviews, producer_name, unwanted_products)
+    # 1-3. Obter produtos do produtor e sua avaliação média
+    candidates = prepare_best_product_productors(producer_name, local_filter, unwanted_products)
 
     if candidates.empty:
         return pd.DataFrame() 
 
-    # 2. Aplicar filtro de local (Região Administrativa) se fornecido
-    if local_filter and not candidates.empty:
-        candidates = candidates[candidates['local'] == local_filter].copy()
-        if candidates.empty: # Nenhum produto deste produtor na RA especificada
-            return pd.DataFrame() 
+    # 4. Calcular e normalizar distância
+    candidates = normalize_distance(candidates, latitude, longitude)
+    # 5-6. Calcular score, ordenar e selecionar os melhores
+    return rank_best_product_productors(candidates, organic_preference, top_n, user_id)
+
+
+# Função para obter os índices de similaridade da tabela agregada atual (construídos no primeiro uso)
+def current_similarity():
+    """Retorna {'producers': SimilarityIndex, 'products': SimilarityIndex} (src.similarity)."""
+    ensure_data()
+    aggregates = df_aggregates
+    return context.get_artifact('similarity', lambda: build_similarity(aggregates))
 
-    if candidates.empty: # Verificação adicional de segurança
+
+# Função para encontrar, para cada valor de uma coluna, a oferta mais próxima do usuário
+def nearest_offers(column, values, latitude, longitude):
+    """Retorna (linhas da tabela agregada, distâncias em km): a oferta mais próxima de cada valor, na ordem de 'values'."""
+    store = offer_store
+    distances_by_coord = location_distances([latitude], [longitude])[0]
+    coord_ids = store.df[COORD_ID_COLUMN].to_numpy()
+    rows, distances = [], []
+    for value in values:
+        value_rows = store.rows(column, value)
+        value_distances = gather_distances(distances_by_coord, coord_ids[value_rows])
+        nearest = int(np.argmin(value_distances)) # Empate: primeira linha da tabela
+        rows.append(value_rows[nearest])
+        distances.append(value_distances[nearest])
+    return np.array(rows, dtype=np.int64), np.array(distances, dtype=float)
+
+
+# Função para montar o resultado de "mais como este": vizinhos, similaridade, média e oferta mais próxima
+def similar_items_result(kind, column, label, latitude, longitude, top_n, offer_columns):
+    index = current_similarity()[kind]
+    neighbors, similarities = index.neighbors(label, top_n)
+    # Vizinhos sem oferta na tabela atual (índice de uma versão anterior) são ignorados
+    available = [i for i, neighbor in enumerate(neighbors) if len(offer_store.rows(column, neighbor))]
+    if not available:
         return pd.DataFrame()
+    neighbors = [neighbors[i] for i in available]
+    rows, distances = nearest_offers(column, neighbors, latitude, longitude)
+    offers = offer_store.df
+    result = {column: neighbors, 'similaridade': np.round(similarities[available], 2),
+              'media_avaliacao': np.round(index.ratings_of(neighbors), 2)}
+    for offer_column in [*offer_columns, 'latitude', 'longitude']:
+        result[offer_column] = offers[offer_column].to_numpy()[rows]
+    result['distancia_km'] = np.round(distances, 2)
+    return pd.DataFrame(result)[[column, 'similaridade', 'media_avaliacao', *offer_columns, 'distancia_km', 'latitude', 'longitude']]
 
-    # 3. Calcular e normalizar distância
-    candidates = normalize_distance(candidates, latitude, longitude)
-    # 4. Calcular avaliação média dos produtos (agrupado por produto e nome_produtor)
-    candidates = calculate_average_rating(candidates) 
-    
-    # Garante que a coluna 'organico' (status do produto) exista
-    if 'organico' not in candidates.columns:
-        candidates['organico'] = 0 # Fallback
 
-    # Prepara os dados para cálculo do score
-    features_values_df = pd.DataFrame({
-        'avaliacao_norm': candidates['avaliacao_norm'],
-        'proximidade': candidates['proximidade'],
-        'item_is_organic_actual': candidates['organico'] # Status orgânico real do produto
-    })
-    
-    # 5. Calcular score para cada produto candidato
-    candidates["score"] = features_values_df.apply(
-        lambda row: calculate_score(2, organic_preference, row.tolist()), axis=1 # Tipo 2 para "Produtos de Produtor"
+# Função principal para recomendar "Produtores Parecidos" com um produtor
+def recommend_similar_producers(producer, latitude, longitude, organic_preference=0, top_n=5):
+    """
+    Recomenda os produtores mais similares a 'producer' (avaliações parecidas nos mesmos produtos),
+    pela similaridade pré-calculada em src.similarity, com a oferta de cada um mais próxima do usuário.
+    A ordem é a da similaridade: a localização e a 'organic_preference' não entram no ranking.
+    """
+    if not ensure_data():
+        return pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']})
+    if not producer:
+        return pd.DataFrame({'mensagem': ['Nome do produtor não fornecido.']})
+    return similar_items_result(
+        'producers', 'nome_produtor', producer, latitude, longitude, top_n,
+        ['local', 'organico']
     )
-    
-    # 6. Ordenar por score, remover duplicatas de produto (mantendo o melhor score) e selecionar top N
-    resultado = candidates.sort_values(by='score', ascending=False).drop_duplicates(subset=['produto']).head(5)
 
-    # Retorna as colunas relevantes
-    return resultado[['produto', 'nome_produtor', 'local', 'organico', 
-                      'media_produtor_produto', 'distancia_km', 'score', 'latitude', 'longitude'
-                      ]].round({'media_produtor_produto': 2, 'distancia_km': 2, 'score': 2})
\ No newline at end of file
+
+# Função principal para recomendar "Produtos Avaliados em Conjunto" com um produto
+def recommend_similar_products(product, latitude, longitude, organic_preference=0, top_n=5):
+    """
+    Recomenda os produtos mais similares a 'product' (bem avaliados pelos mesmos produtores),
+    pela similaridade pré-calculada em src.similarity, com a oferta de cada um mais próxima do usuário.
+    A ordem é a da similaridade: a localização e a 'organic_preference' não entram no ranking.
+    """
+    if not ensure_data():
+        return pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']})
+    if not product:
+        return pd.DataFrame({'mensagem': ['Produto não fornecido.']})
+    return similar_items_result(
+        'products', 'produto', product, latitude, longitude, top_n,
+        ['nome_produtor', 'local', 'organico']
+    )
+
+
+# Função principal para recomendar uma "Cesta": poucos produtores que, juntos, cobrem a lista de compras
+def recommend_basket(desired_products, latitude, longitude, organic_preference=0, max_stops=None):
+    """
+    Escolhe as paradas (produtor em um local) que minimizam o custo de src.basket: custo fixo e distância
+    de cada parada, mais o custo da melhor oferta de cada produto (1 - qualidade pelo perfil do tipo 3)
+    ou a penalidade dos produtos não cobertos.
+    Retorna uma linha por produto coberto, com a parada (1 = mais próxima) e a oferta escolhida.
+    """
+    if not ensure_data():
+        return pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']})
+    if isinstance(desired_products, str):
+        desired_products = [desired_products]
+    products = list(dict.fromkeys(desired_products or []))
+    if not products:
+        return pd.DataFrame({'mensagem': ['Nenhum produto informado para a cesta.']})
+
+    store = offer_store
+    offers = store.take(store.rows('produto', products))
+    if offers.empty:
+        return pd.DataFrame()
+    offers = calculate_average_rating(offers)
+    offers['proximidade'] = 0.0 # A distância entra pelo custo da parada
+    offers['custo'] = 1 - score_candidates(offers, 3, organic_preference)
+    offers['distancia_km'] = gather_distances(
+        location_distances([latitude], [longitude])[0], offers[COORD_ID_COLUMN].to_numpy()
+    )
+
+    # Melhor oferta de cada par parada x produto (ex.: versões orgânica e convencional do mesmo produto)
+    offers = offers.sort_values('custo', kind='stable').drop_duplicates(['nome_produtor', 'local', 'produto'])
+    stop_codes, stops = pd.factorize(pd.MultiIndex.from_arrays([offers['nome_produtor'], offers['local']]))
+    product_codes = pd.Index(products).get_indexer(offers['produto'])
+    offer_costs = np.full((len(stops), len(products)), np.inf)
+    offer_costs[stop_codes, product_codes] = offers['custo'].to_numpy()
+    stop_distances = np.full(len(stops), np.inf)
+    np.minimum.at(stop_distances, stop_codes, offers['distancia_km'].to_numpy())
+    stop_costs = basket.STOP_COST + basket.DISTANCE_WEIGHT * stop_distances
+
+    with metrics.stage('optimize'):
+        solution = basket.optimize_basket(offer_costs, stop_costs, max_stops=max_stops)
+    chosen = sorted(solution['stops'], key=lambda stop: stop_distances[stop])
+    if not chosen:
+        return pd.DataFrame()
+
+    # Uma linha por produto coberto: a oferta da parada à qual ele foi atribuído
+    stop_number = {stop: number for number, stop in enumerate(chosen, start=1)}
+    assigned = {(stop, product) for product, stop in enumerate(solution['assignment']) if stop >= 0}
+    selected = [(stop, product) in assigned for stop, product in zip(stop_codes, product_codes)]
+    result = offers[selected].copy()
+    result['parada'] = [stop_number[stop] for stop in stop_codes[selected]]
+    result = result.sort_values(['parada', 'produto'], kind='stable')
+    return result[[
+        'parada', 'produto', 'nome_produtor', 'local', 'organico',
+        'media_produtor_produto', 'distancia_km', 'latitude', 'longitude'
+    ]].round({'media_produtor_produto': 2, 'distancia_km': 2}).reset_index(drop=True)
+
+
+# Etapas de cada tipo de recomendação: (função principal, preparo dos candidatos, ranking)
+# Os filtros de uma consulta são os argumentos nomeados da função principal, exceto localização e preferência orgânica.
+RECOMMENDATION_PIPELINES = {
+    'products': (recommend_best_products, prepare_best_products, rank_best_products),
+    'producers': (recommend_best_productors, prepare_best_productors, rank_best_productors),
+    'producer-products': (recommend_best_product_productors, prepare_best_product_productors, rank_best_product_productors),
+    # Similaridade pré-calculada: não há candidatos a pontuar, cada consulta é uma leitura do índice
+    'similar-producers': (recommend_similar_producers, None, None),
+    'similar-products': (recommend_similar_products, None, None),
+    # Cesta: a escolha das paradas depende da localização do usuário (sem etapa de preparo compartilhada)
+    'basket': (recommend_basket, None, None),
+}
+
+# Filtros que não afetam a seleção de candidatos, apenas o ranking
+# ('user_id': id do usuário das consultas personalizadas, src.personalization)
+RANKING_OPTIONS = ('top_n', 'user_id')
+
+
+# Função que executa uma única recomendação a partir do tipo e dos filtros
+def recommend(rec_type, filters, latitude, longitude, organic_preference):
+    """
+    Despacha para a função principal do tipo (RECOMMENDATION_PIPELINES).
+    - rec_type: 'products', 'producers', 'producer-products', 'similar-producers', 'similar-products' ou 'basket'.
+    - filters: argumentos nomeados da função correspondente (ex.: {'desired_products': [...], 'producer': ...}).
+    """
+    if rec_type not in RECOMMENDATION_PIPELINES:
+        raise ValueError(f"Tipo de recomendação inválido: {rec_type}")
+    recommend_function = RECOMMENDATION_PIPELINES[rec_type][0]
+    # As etapas medidas dentro da função são rotuladas com o tipo (src.metrics)
+    with metrics.pipeline(rec_type), metrics.stage('total'):
+        return recommend_function(
+            **filters, organic_preference=organic_preference, latitude=latitude, longitude=longitude
+        )
+
+
+# Função para gerar uma chave hashable que identifica os filtros de uma consulta
+def filters_key(rec_type, filters):
+    """Normaliza os filtros (listas viram tuplas ordenadas) para agrupar consultas equivalentes."""
+    return (rec_type, tuple(sorted(
+        (name, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value)
+        for name, value in filters.items()
+    )))
+
+
+# Função para recomendar em lote: muitas consultas (usuários/localizações) em uma única chamada
+def recommend_batch(queries, mode=DEFAULT_DISTANCE_MODE):
+    """
+    Executa várias recomendações de uma vez e retorna uma lista de DataFrames, na ordem das consultas.
+    Cada consulta é um dicionário com 'type', 'filters', 'latitude', 'longitude' e 'organic'.
+    Consultas com o mesmo tipo e filtros de seleção compartilham a seleção de candidatos e a avaliação média,
+    e suas distâncias são calculadas como uma única matriz usuários x candidatos; as opções de ranking
+    ('top_n', 'user_id') são aplicadas por consulta.
+    Consultas de produtores com 'max_distance_km' dependem da localização na seleção e são executadas individualmente,
+    assim como as de similaridade (tipos sem etapa de preparo).
+    """
+    results = [None] * len(queries)
+    if not ensure_data():
+        return [pd.DataFrame({'mensagem': ['Dataset de reviews não carregado.']}) for _ in queries]
+
+    # Agrupa as consultas pelos filtros normalizados
+    groups = {}
+    for position, query in enumerate(queries):
+        rec_type, filters = query['type'], dict(query.get('filters') or {})
+        if rec_type not in RECOMMENDATION_PIPELINES:
+            raise ValueError(f"Tipo de recomendação inválido: {rec_type}")
+        if (RECOMMENDATION_PIPELINES[rec_type][1] is None or filters.get('max_distance_km') is not None
+                or (rec_type == 'producer-products' and not filters.get('producer_name'))):
+            results[position] = recommend(
+                rec_type, filters, query['latitude'], query['longitude'], query.get('organic', 0)
+            )
+            continue
+        filters.pop('max_distance_km', None)
+        selection = {name: value for name, value in filters.items() if name not in RANKING_OPTIONS}
+        groups.setdefault(filters_key(rec_type, selection), (rec_type, selection, []))[2].append(position)
+
+    for rec_type, selection, positions in groups.values():
+        # Etapas do grupo rotuladas com o tipo (src.metrics)
+        with metrics.pipeline(rec_type):
+            _, prepare, rank = RECOMMENDATION_PIPELINES[rec_type]
+            candidates = prepare(**selection)
+
+            if candidates.empty:
+                for position in positions:
+                    results[position] = pd.DataFrame()
+                continue
+
+            # Distâncias de todos os usuários do grupo a todos os candidatos em uma única passada
+            latitudes = [queries[p]['latitude'] for p in positions]
+            longitudes = [queries[p]['longitude'] for p in positions]
+            with metrics.stage('distance'):
+                if COORD_ID_COLUMN in candidates.columns:
+                    # Usuários x coordenadas distintas (com memo), depois cópia para as colunas dos candidatos pelo id
+                    distances = gather_distances(
+                        location_distances(latitudes, longitudes, mode), candidates[COORD_ID_COLUMN].to_numpy()
+                    )
+                else:
+                    distances = distance_matrix_km(
+                        latitudes, longitudes,
+                        candidates['latitude'].to_numpy(dtype=float), candidates['longitude'].to_numpy(dtype=float),
+                        mode=mode
+                    )
+                proximity = proximity_from_distances(distances)
+
+            for row, position in enumerate(positions):
+                ranked = candidates.copy(deep=False) # As colunas acrescentadas não alteram 'candidates' (copy-on-write)
+                ranked['distancia_km'] = distances[row]
+                ranked['proximidade'] = proximity[row]
+                ranking_options = {
+                    name: value for name, value in (queries[position].get('filters') or {}).items() if name in RANKING_OPTIONS
+                }
+                results[position] = rank(ranked, queries[position].get('organic', 0), **ranking_options)
+
+    return results
@@ -0,0 +1,170 @@
+import gzip
+import json
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Codificação em JSON dos DataFrames de resultado do motor, direto dos arrays de cada coluna.
+# Em vez de montar um dicionário por linha (to_dict) e converter cada escalar do NumPy (jsonify), cada
+# coluna vira um array de fragmentos JSON: categorias e textos são codificados uma vez por valor distinto
+# (códigos das categorias / pd.factorize) e números de uma só vez pelo codificador em C do módulo json
+# (a lista inteira da coluna, depois dividida nas vírgulas). Os fragmentos são então montados:
+# - "records": lista de objetos, uma por linha (formato atual de '/recommend');
+# - "columnar": {"length": n, "columns": {"coluna": [valores], ...}}, com os nomes uma única vez;
+# - NDJSON: um objeto por linha de texto, enviado em blocos (respostas grandes e lotes), com gzip opcional.
+# Valores ausentes e floats não finitos (NaN, inf) viram null.
+
+# Formatos de resposta aceitos no campo 'format' do payload
+RESPONSE_FORMATS = ('records', 'columnar')
+
+# Tipos de conteúdo das respostas
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Linhas de NDJSON por bloco enviado
+NDJSON_CHUNK_LINES = 256
+
+# Tamanho mínimo (bytes) de um corpo para comprimi-lo com gzip, e nível de compressão
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+# Limite de tipos categóricos com as categorias já codificadas em memória
+CATEGORY_CACHE_MAX_ENTRIES = 64
+
+# Categorias codificadas por tipo categórico (os resultados do motor compartilham os tipos do dataset)
+_category_fragments = {}
+
+
+# Função para converter escalares do NumPy/pandas em tipos serializáveis (usada pelo codificador JSON)
+def to_builtin(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return str(value)
+
+
+# Codificador reutilizado em todas as chamadas (json.dumps com argumentos cria um novo a cada chamada)
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=to_builtin)
+
+
+# Função para codificar um valor isolado em JSON (UTF-8 sem escapes, floats não finitos como null)
+def encode_value(value):
+    if isinstance(value, float) and not np.isfinite(value):
+        return 'null'
+    return _encoder.encode(value)
+
+
+# Função para codificar os valores distintos usados uma vez e espalhá-los pelos códigos (-1 = ausente)
+def take_fragments(codes, uniques):
+    fragments = np.full(len(uniques) + 1, 'null', dtype=object)
+    used = np.unique(codes[codes >= 0])
+    fragments[used] = [encode_value(value) for value in uniques.take(used).tolist()]
+    return fragments[codes].tolist()
+
+
+# Função para obter os fragmentos de todas as categorias de um tipo categórico (o último é o ausente)
+def category_fragments(dtype):
+    fragments = _category_fragments.get(dtype)
+    if fragments is None:
+        if len(_category_fragments) >= CATEGORY_CACHE_MAX_ENTRIES:
+            _category_fragments.clear()
+        fragments = np.array([encode_value(value) for value in dtype.categories.tolist()] + ['null'], dtype=object)
+        _category_fragments[dtype] = fragments
+    return fragments
+
+
+# Função para obter os valores de uma coluna numérica do NumPy como lista do Python (None = ausente)
+def numeric_values(values):
+    if values.dtype.kind == 'f':
+        finite = np.isfinite(values)
+        if not finite.all():
+            values = values.astype(object)
+            values[~finite] = None
+    return values.tolist()
+
+
+# Função para verificar se a coluna tem um tipo numérico (ou booleano) do NumPy
+def is_numeric(series):
+    return isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biuf'
+
+
+# Função para converter uma coluna em uma lista de fragmentos JSON (um por linha)
+def column_fragments(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return category_fragments(series.dtype)[series.array.codes].tolist()
+    if is_numeric(series):
+        # Números não contêm vírgulas: a lista codificada de uma vez é dividida nos valores
+        return _encoder.encode(numeric_values(series.to_numpy()))[1:-1].split(',') if len(series) else []
+    # Textos, objetos e tipos do pandas com valores ausentes (Int64, string, ...)
+    codes, uniques = pd.factorize(series)
+    return take_fragments(codes, uniques)
+
+
+# Função para converter uma coluna no array JSON do formato colunar
+def column_array(series):
+    if is_numeric(series):
+        return _encoder.encode(numeric_values(series.to_numpy()))
+    return '[' + ','.join(column_fragments(series)) + ']'
+
+
+# Função para obter os nomes e os fragmentos de todas as colunas de um resultado (None = sem resultado)
+def frame_fragments(frame):
+    if frame is None:
+        return [], []
+    names = [encode_value(str(column)) for column in frame.columns]
+    return names, [column_fragments(series) for _, series in frame.items()]
+
+
+# Função para codificar as linhas de um resultado como objetos JSON (um texto por linha)
+def encode_rows(frame):
+    if frame is None or frame.empty:
+        return []
+    names, columns = frame_fragments(frame)
+    template = '{' + ','.join(f"{name.replace('%', '%%')}:%s" for name in names) + '}'
+    return [template % row for row in zip(*columns)]
+
+
+# Função para codificar um resultado como lista de objetos ("records")
+def encode_records(frame):
+    return '[' + ','.join(encode_rows(frame)) + ']'
+
+
+# Função para codificar um resultado no formato colunar
+def encode_columnar(frame):
+    if frame is None:
+        return '{"length":0,"columns":{}}'
+    body = ','.join(f'{encode_value(str(column))}:{column_array(series)}' for column, series in frame.items())
+    return f'{{"length":{len(frame)},"columns":{{{body}}}}}'
+
+
+# Função para codificar um resultado no formato pedido ('records' ou 'columnar')
+def encode_frame(frame, response_format='records'):
+    return encode_columnar(frame) if response_format == 'columnar' else encode_records(frame)
+
+
+# Função para agrupar linhas de NDJSON em blocos de bytes (cada linha termina em '\n')
+def ndjson_chunks(lines, chunk_lines=NDJSON_CHUNK_LINES):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= chunk_lines:
+            yield ('\n'.join(batch) + '\n').encode()
+            batch = []
+    if batch:
+        yield ('\n'.join(batch) + '\n').encode()
+
+
+# Função para comprimir um corpo completo com gzip
+def gzip_body(body, level=GZIP_LEVEL):
+    return gzip.compress(body, compresslevel=level)
+
+
+# Função para comprimir uma sequência de blocos como um único fluxo gzip
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """Cada bloco é descarregado com Z_SYNC_FLUSH: o cliente consegue descomprimir o que já recebeu."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # 16 + MAX_WBITS: cabeçalho gzip
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
@@ -0,0 +1,244 @@
+import os
+import re
+import socket
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.review_store import ID_COLUMNS, classes_from_ids, encoder_categories, plain_numeric
+
+# Armazenamento append-only de lotes de reviews.
+# Cada lote ingerido vira um segmento parquet imutável ('segment-000001.parquet', ...) ao lado do parquet base.
+# O número do segmento é reservado de forma exclusiva (O_EXCL), o arquivo é escrito em um temporário e só
+# então renomeado: leitores nunca veem um segmento pela metade, mesmo com vários processos gravando.
+# A reserva ('.claim') registra o host e o pid de quem grava: reservas de um processo que já terminou, ou
+# mais antigas que CLAIM_MAX_AGE_SECONDS, são abandonadas (o processo parou antes de renomear o segmento)
+# e removidas pela compactação, que de outro modo ficaria parada nelas para sempre.
+# A compactação incorpora os segmentos ao parquet base e grava, nos metadados do próprio parquet,
+# até qual segmento ele já contém ('ingest_through'), em uma única troca atômica de arquivo.
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{6})\.parquet$')
+CLAIM_PATTERN = re.compile(r'^segment-(\d{6})\.claim$')
+
+# Chave dos metadados do parquet base com o último segmento incorporado
+BASE_THROUGH_KEY = b'ingest_through'
+
+# Idade máxima (segundos) de uma reserva de número de segmento; mais antiga que isso, é considerada abandonada
+CLAIM_MAX_AGE_SECONDS = 600
+
+# Colunas de códigos inteiros mantidas na compactação (coluna de valores -> coluna de códigos)
+CODE_COLUMNS = dict(ID_COLUMNS, id_usuario='usuario_id')
+
+
+def segment_name(sequence):
+    return f'segment-{sequence:06d}.parquet'
+
+
+def claim_name(sequence):
+    return f'segment-{sequence:06d}.claim'
+
+
+# Função para listar os segmentos completos de um diretório
+def list_segments(segments_dir, after=0):
+    """Retorna [(número, caminho)] dos segmentos com número maior que 'after', em ordem crescente."""
+    if not os.path.isdir(segments_dir):
+        return []
+    segments = []
+    for entry in os.scandir(segments_dir):
+        match = SEGMENT_PATTERN.match(entry.name)
+        if match and int(match.group(1)) > after:
+            segments.append((int(match.group(1)), entry.path))
+    return sorted(segments)
+
+
+# Função para listar os números reservados cujos segmentos ainda estão sendo gravados
+def claimed_sequences(segments_dir):
+    if not os.path.isdir(segments_dir):
+        return []
+    return sorted(int(match.group(1)) for match in map(CLAIM_PATTERN.match, os.listdir(segments_dir)) if match)
+
+
+# Função para verificar se um processo deste host ainda está em execução
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # O processo existe, mas pertence a outro usuário
+    return True
+
+
+# Função para verificar se uma reserva foi abandonada por um processo interrompido
+def is_abandoned_claim(claim_path, max_age_seconds=CLAIM_MAX_AGE_SECONDS):
+    """
+    Uma reserva é abandonada se for mais antiga que 'max_age_seconds' ou se o processo que a criou
+    (mesmo host) não existir mais. Reservas de outros hosts dependem apenas da idade.
+    """
+    try:
+        if time.time() - os.path.getmtime(claim_path) > max_age_seconds:
+            return True
+        with open(claim_path, 'r') as f:
+            host, _, pid = f.read().partition(' ')
+    except FileNotFoundError:
+        return False # O segmento acabou de ser gravado
+    if host != socket.gethostname() or not pid.strip().isdigit():
+        return False
+    return not process_alive(int(pid))
+
+
+# Função para remover as reservas abandonadas e listar as que continuam ativas
+def release_abandoned_claims(segments_dir, max_age_seconds=CLAIM_MAX_AGE_SECONDS):
+    """Retorna os números reservados por processos ativos, em ordem crescente."""
+    active = []
+    for sequence in claimed_sequences(segments_dir):
+        claim_path = os.path.join(segments_dir, claim_name(sequence))
+        if not is_abandoned_claim(claim_path, max_age_seconds):
+            active.append(sequence)
+            continue
+        try:
+            os.remove(claim_path)
+        except FileNotFoundError:
+            pass
+    return active
+
+
+# Função para ler até qual segmento o parquet base já foi compactado
+def base_through(base_path):
+    """Retorna o número do último segmento incorporado ao parquet base (0 se nenhum)."""
+    try:
+        metadata = pq.read_schema(base_path).metadata or {}
+    except (FileNotFoundError, OSError):
+        return 0
+    return int(metadata.get(BASE_THROUGH_KEY, b'0'))
+
+
+# Função para reservar o próximo número de segmento
+def claim_sequence(segments_dir, after=0):
+    """
+    Cria, de forma exclusiva (O_EXCL), o arquivo '.claim' do próximo número livre, com o host e o pid deste
+    processo. Retorna (número, caminho da reserva).
+    """
+    os.makedirs(segments_dir, exist_ok=True)
+    existing = [sequence for sequence, _ in list_segments(segments_dir)]
+    sequence = max(existing + claimed_sequences(segments_dir) + [after]) + 1
+    while True:
+        claim_path = os.path.join(segments_dir, claim_name(sequence))
+        try:
+            descriptor = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            sequence += 1 # Outro processo reservou este número
+    try:
+        os.write(descriptor, f'{socket.gethostname()} {os.getpid()}'.encode())
+    finally:
+        os.close(descriptor)
+    return sequence, claim_path
+
+
+# Função para gravar um lote de reviews como um novo segmento
+def write_segment(segments_dir, reviews, after=0):
+    """
+    Grava 'reviews' como o próximo segmento e retorna seu número ('after' é o último número já
+    compactado no parquet base: os segmentos compactados são removidos, mas seus números não são reutilizados).
+    O número é reservado com um arquivo '.claim' (claim_sequence); o parquet é escrito em um
+    temporário e renomeado, de modo que o segmento aparece para os leitores já completo.
+    """
+    sequence, claim_path = claim_sequence(segments_dir, after)
+    path = os.path.join(segments_dir, segment_name(sequence))
+    tmp_path = path + '.tmp'
+    try:
+        reviews.reset_index(drop=True).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        # Com erro na gravação, a reserva também é liberada (o número fica sem segmento)
+        try:
+            os.remove(claim_path)
+        except FileNotFoundError:
+            pass # Removida como abandonada por uma compactação
+    return sequence
+
+
+# Função para ler um segmento
+def read_segment(path):
+    return pd.read_parquet(path)
+
+
+# Função para concatenar o parquet base com os segmentos, recalculando as colunas de códigos
+def merge_reviews(frames):
+    """
+    Concatena DataFrames de reviews. As colunas '*_id' das linhas já codificadas são preservadas
+    e os valores novos recebem os códigos seguintes (mesma regra de to_categorical).
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    # Colunas compactas voltam aos tipos usuais e as categóricas a valores simples,
+    # para que a concatenação não dependa das categorias
+    frames = [plain_numeric(frame) for frame in frames]
+    frames = [
+        frame.astype({column: object for column in frame.columns if isinstance(frame[column].dtype, pd.CategoricalDtype)})
+        for frame in frames
+    ]
+    merged = pd.concat(frames, ignore_index=True)
+    for column, code_column in CODE_COLUMNS.items():
+        if column not in merged.columns:
+            continue
+        classes = classes_from_ids(merged[column], merged[code_column]) if code_column in merged.columns else None
+        categories = encoder_categories(merged[column], classes=classes)
+        merged[code_column] = pd.Categorical(merged[column], categories=categories).codes.astype('int64')
+    return merged
+
+
+# Função para incorporar os segmentos ao parquet base (compactação)
+def compact(base_path, segments_dir):
+    """
+    Reescreve o parquet base com os segmentos já gravados e remove os segmentos incorporados.
+    A troca do parquet é atômica (arquivo temporário + os.replace) e o próprio parquet registra o último
+    segmento incorporado; se o processo parar antes de remover os segmentos, eles são ignorados na leitura.
+    Retorna o número de segmentos incorporados.
+    """
+    through = base_through(base_path)
+    segments = list_segments(segments_dir, after=through)
+    # Só entra o prefixo anterior ao primeiro número reservado e ainda não gravado (o base não pode pulá-lo);
+    # reservas abandonadas por processos interrompidos são removidas e deixam de bloquear a compactação
+    claims = release_abandoned_claims(segments_dir)
+    if claims:
+        segments = [(sequence, path) for sequence, path in segments if sequence < claims[0]]
+    if not segments:
+        return 0
+
+    merged = merge_reviews([pd.read_parquet(base_path)] + [read_segment(path) for _, path in segments])
+    last = segments[-1][0]
+    table = pa.Table.from_pandas(merged, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[BASE_THROUGH_KEY] = str(last).encode()
+    tmp_path = base_path + '.tmp'
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, base_path)
+
+    for sequence, path in segments:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass # Já removido por uma compactação anterior interrompida
+    return len(segments)
+
+
+# Função para resumir o estado do armazenamento
+def storage_status(base_path, segments_dir):
+    through = base_through(base_path)
+    segments = list_segments(segments_dir, after=through)
+    return {
+        'base': base_path,
+        'base_through': through,
+        'pending_segments': len(segments),
+        'pending_reviews': sum(pq.read_metadata(path).num_rows for _, path in segments),
+    }
+
@@ -0,0 +1,373 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# Armazenamento indexado de reviews/ofertas.
+# As colunas textuais filtradas a cada requisição ('produto', 'nome_produtor', 'local') são convertidas
+# em categóricas, com códigos inteiros iguais aos dos LabelEncoders salvos em 'full_resources.pkl'.
+# Para cada código é pré-calculada a lista ordenada de linhas que o contêm (índice invertido),
+# de modo que a seleção de candidatos vira união/interseção de arrays de inteiros ordenados,
+# com custo proporcional ao número de linhas encontradas e não ao tamanho do dataset.
+
+# Colunas indexadas e o encoder correspondente em 'full_resources.pkl'
+INDEXED_COLUMNS = {
+    'produto': 'le_produto',
+    'nome_produtor': 'le_produtor',
+    'local': 'le_local',
+}
+
+# Colunas do parquet com os códigos já gerados pelos mesmos encoders (dispensam carregar o pickle)
+ID_COLUMNS = {
+    'produto': 'produto_id',
+    'nome_produtor': 'produtor_id',
+    'local': 'local_id',
+}
+
+
+# Função para recuperar as classes de um encoder a partir da coluna de códigos do próprio dataset
+def classes_from_ids(values, ids):
+    """
+    Retorna as classes na ordem dos códigos (valor de código i na posição i), ou None se os pares
+    valor/código não formarem uma codificação completa e consistente.
+    """
+    pairs = pd.DataFrame({'value': values, 'id': ids}).dropna().drop_duplicates()
+    if pairs.empty or pairs['value'].duplicated().any() or pairs['id'].duplicated().any():
+        return None
+    if sorted(pairs['id']) != list(range(len(pairs))):
+        return None
+    return list(pairs.sort_values('id')['value'])
+
+
+# Função para montar as categorias de uma coluna a partir do encoder salvo
+def encoder_categories(values, encoder=None, classes=None):
+    """
+    Retorna as categorias de uma coluna: primeiro as classes do LabelEncoder (preservando seus códigos),
+    seguidas de eventuais valores ainda não vistos pelo encoder.
+    'classes' pode substituir o encoder (ex.: classes recuperadas de uma coluna de códigos).
+    """
+    known = list(encoder.classes_) if encoder is not None else list(classes or [])
+    known_set = set(known)
+    unseen = sorted(v for v in pd.unique(values) if pd.notnull(v) and v not in known_set)
+    return known + unseen
+
+
+# Função para converter as colunas indexadas de um DataFrame em categóricas codificadas pelos encoders
+def to_categorical(df, resources=None):
+    """
+    Converte 'produto', 'nome_produtor' e 'local' em colunas categóricas alinhadas aos LabelEncoders.
+    Sem os encoders de 'resources', usa as colunas de códigos do dataset ('produto_id', ...);
+    colunas que já são categóricas são mantidas como estão.
+    """
+    resources = resources or {}
+    df = df.copy(deep=False) # As colunas substituídas abaixo não alteram 'df'; as demais não são copiadas
+    for column, encoder_key in INDEXED_COLUMNS.items():
+        if column not in df.columns:
+            continue
+        encoder = resources.get(encoder_key)
+        if encoder is None and isinstance(df[column].dtype, pd.CategoricalDtype):
+            continue
+        classes = None
+        if encoder is None and ID_COLUMNS[column] in df.columns:
+            classes = classes_from_ids(df[column], df[ID_COLUMNS[column]])
+        categories = encoder_categories(df[column], encoder, classes)
+        df[column] = pd.Categorical(df[column], categories=categories)
+    return df
+
+
+# Função para identificar colunas cujos valores são objetos Python individuais
+def is_object_column(series):
+    """Indica se a coluna guarda um objeto Python por linha (dtype object ou string com armazenamento 'python')."""
+    dtype = series.dtype
+    if isinstance(dtype, pd.StringDtype):
+        return dtype.storage == 'python'
+    return dtype == object
+
+
+# Função para deixar o DataFrame apenas com buffers NumPy/Arrow (compartilháveis entre processos)
+def to_shared_columns(df):
+    """
+    Converte as colunas de objetos Python restantes (ex.: 'id_usuario') em categóricas.
+    Cada linha de uma coluna object é um objeto com contador de referências próprio: basta lê-la
+    (ou o coletor de lixo percorrê-la) para que as páginas de memória sejam copiadas em cada processo filho.
+    Categóricas guardam apenas códigos inteiros em um array NumPy e um vetor pequeno de categorias.
+    """
+    object_columns = [column for column in df.columns if is_object_column(df[column])]
+    if not object_columns:
+        return df
+    df = df.copy(deep=False)
+    for column in object_columns:
+        df[column] = df[column].astype('category')
+    return df
+
+
+# Esquema compacto da tabela de reviews em memória.
+# Avaliações (1 a 5) em int8, orgânico em bool, códigos dos encoders no menor inteiro que os comporta,
+# textos (inclusive 'id_usuario') como categóricas e coordenadas internadas: poucas coordenadas distintas
+# (os centroides das RAs) viram uma categórica de float64, com 1 ou 2 bytes por linha e valores exatos.
+# Coordenadas variadas só passam a float32 se o valor em float32 for idêntico ao original;
+# as distâncias e os rankings não mudam. A tabela agregada de ofertas volta aos tipos usuais (plain_numeric).
+
+# Colunas de coordenadas
+COORDINATE_COLUMNS = ['latitude', 'longitude']
+
+# Máximo de coordenadas distintas para internar a coluna como categórica
+MAX_INTERNED_COORDINATES = 1 << 15
+
+
+# Função para converter as colunas da tabela de reviews para o esquema compacto
+def compact_reviews(df):
+    """Retorna 'df' com os tipos compactos; colunas cujos valores não cabem no tipo compacto são mantidas."""
+    df = df.copy(deep=False)
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if isinstance(values.dtype, pd.StringDtype) or values.dtype == object:
+            df[column] = values.astype('category')
+        elif column == 'avaliacao' and pd.api.types.is_integer_dtype(values.dtype):
+            if values.empty or (values.min() >= np.iinfo(np.int8).min and values.max() <= np.iinfo(np.int8).max):
+                df[column] = values.astype(np.int8)
+        elif column == 'organico' and pd.api.types.is_integer_dtype(values.dtype):
+            if values.isin([0, 1]).all():
+                df[column] = values.astype(bool)
+        elif column in COORDINATE_COLUMNS and pd.api.types.is_float_dtype(values.dtype):
+            if values.nunique(dropna=False) <= MAX_INTERNED_COORDINATES:
+                df[column] = values.astype('category')
+            elif np.array_equal(values.astype(np.float32).astype(float).to_numpy(), values.to_numpy(), equal_nan=True):
+                df[column] = values.astype(np.float32)
+        elif column.endswith('_id') and pd.api.types.is_integer_dtype(values.dtype):
+            df[column] = pd.to_numeric(values, downcast='integer')
+    return df
+
+
+# Função para devolver as colunas numéricas compactas aos tipos usuais (int64, float64)
+def plain_numeric(df, columns=None):
+    """
+    Converte coordenadas internadas e float32 em float64, orgânico em 0/1 (int64) e inteiros pequenos em int64.
+    Usada nas tabelas pequenas derivadas das reviews (ex.: a tabela agregada) e antes de concatenar lotes.
+    """
+    columns = [column for column in (columns if columns is not None else df.columns) if column in df.columns]
+    df = df.copy(deep=False)
+    for column in columns:
+        dtype = df[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            if pd.api.types.is_numeric_dtype(dtype.categories.dtype):
+                df[column] = df[column].astype(dtype.categories.dtype)
+        elif pd.api.types.is_bool_dtype(dtype):
+            df[column] = df[column].astype('int64')
+        elif pd.api.types.is_signed_integer_dtype(dtype) and dtype != np.int64:
+            df[column] = df[column].astype('int64')
+        elif dtype == np.float32:
+            df[column] = df[column].astype(float)
+    return df
+
+
+# Função para preparar um DataFrame de reviews no formato usado pelo motor
+def prepare_reviews(df, resources=None):
+    """
+    Codifica as colunas indexadas com os encoders de 'resources' ou, se eles não forem informados,
+    com as colunas de códigos gravadas junto às reviews. As demais colunas textuais também viram
+    categóricas (ver to_shared_columns) e as numéricas passam ao esquema compacto (compact_reviews).
+    """
+    return compact_reviews(to_shared_columns(to_categorical(df, resources)))
+
+
+# Função para medir a memória de cada coluna de um DataFrame
+def memory_report(df):
+    """
+    Retorna um DataFrame com o tipo, o total de bytes e os bytes por linha de cada coluna
+    (categóricas incluem as categorias; colunas mapeadas do arquivo Arrow contam o tamanho mapeado).
+    """
+    usage = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'dtype': [str(df[column].dtype).split('(')[0] for column in df.columns],
+        'bytes': usage.to_numpy(),
+    }, index=df.columns)
+    report.loc['total'] = ['', int(usage.sum())]
+    report['bytes_por_linha'] = report['bytes'] / max(len(df), 1)
+    return report
+
+
+# Função para formatar o relatório de memória para o log
+def format_memory_report(df, title='Memória da tabela de reviews'):
+    report = memory_report(df)
+    lines = [f"{title}: {len(df)} linhas"]
+    for column, row in report.iterrows():
+        lines.append(f"  {column:<15} {row['dtype']:<10} {row['bytes'] / 2**20:>10.2f} MB {row['bytes_por_linha']:>8.2f} B/linha")
+    return '\n'.join(lines)
+
+
+# Cópia mapeável em memória do parquet de reviews.
+# O parquet é comprimido e precisa ser decodificado (e copiado para o heap) por cada processo.
+# Ao lado dele é mantido um arquivo Arrow IPC sem compressão, com as colunas textuais em dicionário
+# (códigos inteiros + categorias): o arquivo é aberto com mmap e as colunas viram arrays NumPy que
+# apontam para as páginas do arquivo, sem cópia. Todos os processos que leem o mesmo arquivo
+# compartilham essas páginas pelo page cache do sistema, e a carga não depende do tamanho do dataset.
+
+# Extensão do arquivo Arrow gerado ao lado do parquet
+ARROW_SUFFIX = '.arrow'
+
+# Chave dos metadados do arquivo Arrow com a assinatura (tamanho e mtime) do parquet de origem
+ARROW_SOURCE_KEY = b'source_parquet'
+
+# Versão do esquema gravado no arquivo Arrow (arquivos de outra versão são regenerados)
+ARROW_FORMAT_VERSION = 2
+
+
+# Função para obter o caminho do arquivo Arrow correspondente a um parquet
+def arrow_path(parquet_path):
+    return os.path.splitext(parquet_path)[0] + ARROW_SUFFIX
+
+
+# Função para identificar uma versão do parquet (reescritas pela compactação ou pelo build mudam a assinatura)
+def source_signature(path):
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}:v{ARROW_FORMAT_VERSION}'.encode()
+
+
+# Função para gravar as reviews preparadas em Arrow IPC, com as colunas textuais em dicionário
+def write_reviews_arrow(df, path, source_signature=b''):
+    """
+    Grava 'df' (já preparado por prepare_reviews) em um único bloco por coluna e sem compressão,
+    condições para que a leitura com mmap não copie os dados. A troca do arquivo é atômica.
+    """
+    df = df.copy(deep=False)
+    for column in df.columns:
+        if df[column].dtype == object or isinstance(df[column].dtype, pd.StringDtype):
+            df[column] = df[column].astype('category')
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    metadata = dict(table.schema.metadata or {})
+    metadata[ARROW_SOURCE_KEY] = source_signature
+    table = table.replace_schema_metadata(metadata)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+# Função para montar um DataFrame cujas colunas são views das colunas de uma tabela Arrow
+def frame_from_arrow(table):
+    """
+    Colunas numéricas viram arrays NumPy sobre os buffers da tabela e colunas em dicionário viram
+    categóricas cujos códigos são os índices do dicionário, também sem cópia.
+    Colunas com valores nulos (ou de outros tipos) são convertidas normalmente, com cópia.
+    """
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        array = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+        if array.null_count:
+            columns[name] = column.to_pandas()
+        elif pa.types.is_dictionary(array.type):
+            codes = array.indices.to_numpy(zero_copy_only=True)
+            categories = pd.CategoricalDtype(array.dictionary.to_pandas())
+            columns[name] = pd.Categorical.from_codes(codes, dtype=categories, validate=False)
+        elif pa.types.is_integer(array.type) or pa.types.is_floating(array.type):
+            columns[name] = array.to_numpy(zero_copy_only=True)
+        else:
+            columns[name] = column.to_pandas()
+    return pd.DataFrame(columns, copy=False)
+
+
+# Função para abrir o arquivo Arrow de reviews com mmap, se ele corresponder ao parquet atual
+def open_mapped_reviews(parquet_path):
+    """Retorna as reviews mapeadas do arquivo Arrow, ou None se ele não existir ou estiver desatualizado."""
+    try:
+        source = pa.memory_map(arrow_path(parquet_path), 'r')
+        table = ipc.open_file(source).read_all() # Lê apenas os metadados; os buffers apontam para o mmap
+    except (FileNotFoundError, OSError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(ARROW_SOURCE_KEY) != source_signature(parquet_path):
+        return None
+    return frame_from_arrow(table)
+
+
+# Função para carregar o parquet de reviews já com as colunas indexadas em formato categórico
+def load_reviews(path, resources=None):
+    """
+    Lê as reviews preparadas com prepare_reviews. Sem 'resources' (códigos do próprio parquet),
+    usa a cópia Arrow mapeada em memória, gerando-a na primeira carga após cada alteração do parquet.
+    """
+    if resources is not None:
+        return prepare_reviews(pd.read_parquet(path), resources)
+    mapped = open_mapped_reviews(path)
+    if mapped is not None:
+        return mapped
+
+    df = prepare_reviews(pd.read_parquet(path))
+    try:
+        write_reviews_arrow(df, arrow_path(path), source_signature(path))
+    except OSError as e:
+        print(f"Não foi possível gravar a cópia Arrow das reviews ({e}); usando o parquet.")
+        return df
+    mapped = open_mapped_reviews(path)
+    return df if mapped is None else mapped
+
+
+class IndexedStore:
+    """
+    DataFrame (reviews ou tabela agregada de ofertas) acompanhado de índices invertidos
+    valor -> linhas para as colunas de INDEXED_COLUMNS.
+    Os índices seguem o formato CSR: para o código c, as linhas são order[offsets[c]:offsets[c + 1]],
+    já em ordem crescente.
+    """
+
+    def __init__(self, df, resources=None):
+        self.df = to_categorical(df, resources).reset_index(drop=True)
+        self.vocabulary = {} # coluna -> {valor: código}
+        self.order = {}      # coluna -> linhas ordenadas por código
+        self.offsets = {}    # coluna -> início de cada código em 'order'
+
+        for column in INDEXED_COLUMNS:
+            if column not in self.df.columns:
+                continue
+            categorical = self.df[column].cat
+            codes = np.asarray(self.df[column].array.codes) # View dos códigos (sem cópia)
+            self.vocabulary[column] = {value: code for code, value in enumerate(categorical.categories)}
+            # argsort estável mantém as linhas de cada código em ordem crescente
+            self.order[column] = np.argsort(codes, kind='stable').astype(np.int64)
+            counts = np.bincount(codes[codes >= 0], minlength=len(categorical.categories))
+            # Linhas sem valor (código -1) ficam no início de 'order' e não pertencem a nenhum código
+            self.offsets[column] = np.concatenate(([0], np.cumsum(counts))) + np.count_nonzero(codes < 0)
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def empty(self):
+        return self.df.empty
+
+    @property
+    def columns(self):
+        return self.df.columns
+
+    def all_rows(self):
+        """Retorna todas as linhas do armazenamento."""
+        return np.arange(len(self.df), dtype=np.int64)
+
+    def rows(self, column, values):
+        """
+        Retorna as linhas (ordenadas, sem repetição) cujo valor em 'column' está em 'values'.
+        Valores desconhecidos são ignorados; colunas não indexadas resultam em nenhuma linha.
+        """
+        if isinstance(values, str):
+            values = [values]
+        vocabulary = self.vocabulary.get(column, {})
+        codes = [vocabulary[v] for v in values if v in vocabulary]
+        if not codes:
+            return np.empty(0, dtype=np.int64)
+
+        order, offsets = self.order[column], self.offsets[column]
+        postings = [order[offsets[c]:offsets[c + 1]] for c in codes]
+        if len(postings) == 1:
+            return postings[0]
+        return np.unique(np.concatenate(postings)) # União ordenada das listas de linhas
+
+    def take(self, rows):
+        """Materializa as linhas selecionadas como um novo DataFrame."""
+        return self.df.take(rows)
@@ -0,0 +1,86 @@
+import numpy as np
+
+from src.metrics import timed
+
+# Motor de score vetorizado.
+# Os pesos de cada tipo de recomendação ficam em um registro de perfis, indexado por
+# (tipo de recomendação, preferência por orgânicos); o score de todos os candidatos é
+# a combinação ponderada das colunas da matriz de features, calculada de uma só vez.
+# calculate_score (recommender_engine) é a forma escalar do mesmo cálculo e lê os pesos deste registro.
+# Consultas personalizadas (com id de usuário) misturam ao score a afinidade prevista pelo modelo
+# de filtragem colaborativa (src.personalization), com o peso AFFINITY_WEIGHT.
+
+# Colunas da matriz de features, na ordem dos pesos: [avaliação, proximidade, orgânico]
+FEATURE_COLUMNS = ['avaliacao_norm', 'proximidade', 'organico']
+
+# Peso da afinidade prevista do usuário no score das consultas personalizadas (0 = sem personalização)
+AFFINITY_WEIGHT = 0.3
+
+# Registro de perfis: (recommendation_type, organic_preference ou None) -> pesos
+# None vale para qualquer preferência sem perfil próprio.
+WEIGHT_PROFILES = {}
+
+
+# Função para registrar (ou substituir) um perfil de pesos
+def register_weight_profile(recommendation_type, rating, proximity, organic=0.0, organic_preference=None):
+    """
+    Registra os pesos de um tipo de recomendação.
+    - organic_preference: 0 ou 1 para um perfil específico; None para o perfil padrão do tipo.
+    Novos tipos de recomendação só precisam registrar seus pesos, sem alterar o cálculo do score.
+    """
+    WEIGHT_PROFILES[(recommendation_type, organic_preference)] = np.array([rating, proximity, organic], dtype=float)
+
+
+# Função para obter os pesos de um tipo de recomendação e preferência por orgânicos
+def get_weights(recommendation_type, organic_preference):
+    """Retorna o perfil específico da preferência, o perfil padrão do tipo ou pesos nulos (score 0)."""
+    weights = WEIGHT_PROFILES.get((recommendation_type, organic_preference))
+    if weights is None:
+        weights = WEIGHT_PROFILES.get((recommendation_type, None))
+    if weights is None:
+        weights = np.zeros(len(FEATURE_COLUMNS))
+    return weights
+
+
+# Função para calcular o score de todos os candidatos de uma vez
+def score_features(features, recommendation_type, organic_preference):
+    """
+    Calcula o score de cada linha da matriz de features (n x 3, colunas em FEATURE_COLUMNS).
+    A soma ponderada é acumulada coluna a coluna, na mesma ordem de calculate_score,
+    de modo que os scores (e os empates) são idênticos aos da referência escalar.
+    """
+    features = np.asarray(features, dtype=float)
+    weights = get_weights(recommendation_type, organic_preference)
+    scores = np.zeros(len(features))
+    for column, weight in enumerate(weights):
+        if weight != 0: # Pesos nulos não participam da soma (ex.: orgânico no tipo 1)
+            scores = scores + weight * features[:, column]
+    return scores
+
+
+# Função para calcular o score a partir das colunas de um DataFrame de candidatos
+@timed('score')
+def score_candidates(candidates, recommendation_type, organic_preference):
+    """Retorna o score dos candidatos usando as colunas de FEATURE_COLUMNS."""
+    return score_features(candidates[FEATURE_COLUMNS].to_numpy(dtype=float), recommendation_type, organic_preference)
+
+
+# Função para misturar a afinidade prevista do usuário (0 a 1) aos scores dos candidatos
+def blend_affinity(scores, affinity, weight=AFFINITY_WEIGHT):
+    """Retorna (1 - peso) * score + peso * afinidade; sem afinidade (usuário desconhecido), os scores não mudam."""
+    if affinity is None:
+        return scores
+    return (1 - weight) * np.asarray(scores, dtype=float) + weight * np.asarray(affinity, dtype=float)
+
+
+# Perfis padrão, equivalentes às regras originais de calculate_score (um if por tipo)
+# Tipo 0 ("Melhores Produtos") e tipo 2 ("Produtos de Produtor"):
+# bônus para itens orgânicos quando o usuário os prefere, penalidade alta quando não os quer.
+for _recommendation_type in (0, 2):
+    register_weight_profile(_recommendation_type, rating=0.3, proximity=0.5, organic=0.2, organic_preference=1)
+    register_weight_profile(_recommendation_type, rating=0.5, proximity=0.5, organic=-1.0)
+# Tipo 1 ("Melhores Produtores"): apenas avaliação e proximidade
+register_weight_profile(1, rating=0.7, proximity=0.3)
+# Tipo 3 ("Cesta"): qualidade de cada oferta; a distância entra no custo das paradas (src.basket)
+register_weight_profile(3, rating=0.8, proximity=0.0, organic=0.2, organic_preference=1)
+register_weight_profile(3, rating=1.0, proximity=0.0, organic=-1.0)
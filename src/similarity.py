@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Similaridade item-item pré-calculada ("mais como este").
+# A base é a matriz produtor x produto de avaliações médias (a mesma de 'matrix_reviews.csv'),
+# montada a partir da tabela agregada de ofertas do motor, de modo que reviews ingeridas também entram.
+# - Produtores parecidos: linhas da matriz (produtores que avaliam bem/mal os mesmos produtos).
+# - Produtos avaliados em conjunto: colunas da matriz (produtos bem avaliados pelos mesmos produtores).
+# Os vetores são centrados pela média de cada item (apenas nas posições avaliadas) e normalizados (L2),
+# de modo que o produto interno é o cosseno ajustado. Para cada item são guardados só os k vizinhos
+# mais similares, já ordenados, em formato CSR: a consulta é uma fatia de array, sem recalcular nada.
+# Em catálogos grandes, os vizinhos são calculados de forma aproximada (LSH por hiperplanos aleatórios),
+# comparando cada item só com os que caem no mesmo balde em alguma das tabelas de hash.
+
+# Vizinhos guardados por item
+DEFAULT_NEIGHBORS = 20
+
+# A partir desta quantidade de itens, os vizinhos são calculados de forma aproximada
+APPROXIMATE_MIN_ITEMS = 20000
+
+# Parâmetros do LSH: bits por assinatura (hiperplanos), quantidade de tabelas e semente.
+# Poucos bits por assinatura (baldes grandes) com muitas tabelas: em um catálogo sintético de 10 mil itens,
+# recall@10 de 0,92 em relação ao cálculo exato (12 bits x 8 tabelas ficava abaixo de 0,15);
+# com 30 mil itens, recall@10 de 0,93 e a construção leva cerca de metade do tempo da exata
+# (valores medidos por benchmarks/bench_similarity.py)
+LSH_PLANES = 6
+LSH_TABLES = 16
+LSH_SEED = 53
+
+
+# Função para montar a matriz produtor x produto de avaliações médias a partir da tabela agregada
+def rating_matrix(aggregates):
+    """
+    Retorna (produtores, produtos, matriz esparsa CSR com a média das avaliações de cada par).
+    Pares sem avaliações ficam ausentes da matriz (em 'matrix_reviews.csv' eles aparecem como 0).
+    """
+    producers = aggregates['nome_produtor'].astype('category')
+    products = aggregates['produto'].astype('category')
+    producer_codes = producers.cat.codes.to_numpy()
+    product_codes = products.cat.codes.to_numpy()
+    shape = (len(producers.cat.categories), len(products.cat.categories))
+
+    # Somas e contagens por par (coo_matrix soma as entradas repetidas na conversão para CSR)
+    sums = sparse.coo_matrix((aggregates['soma_avaliacao'].to_numpy(dtype=float), (producer_codes, product_codes)), shape=shape).tocsr()
+    counts = sparse.coo_matrix((aggregates['contagem'].to_numpy(dtype=float), (producer_codes, product_codes)), shape=shape).tocsr()
+    means = sums.copy()
+    means.data = sums.data / counts.data # Mesmo padrão de esparsidade: as duas vêm dos mesmos pares
+    return list(producers.cat.categories), list(products.cat.categories), means
+
+
+# Função para centrar cada linha pela sua média e normalizá-la (L2)
+def normalized_rows(matrix):
+    """Subtrai de cada linha a média das suas entradas avaliadas e divide pela norma L2 (linhas nulas ficam nulas)."""
+    matrix = sparse.csr_matrix(matrix, dtype=float, copy=True)
+    counts = np.diff(matrix.indptr)
+    row_sums = np.asarray(matrix.sum(axis=1)).ravel()
+    means = np.divide(row_sums, counts, out=np.zeros_like(row_sums), where=counts > 0)
+    matrix.data -= np.repeat(means, counts)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    matrix.data /= np.repeat(np.where(norms > 0, norms, 1.0), counts)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+# Linhas processadas por bloco no cálculo exato (o bloco de similaridades é denso: linhas x itens)
+EXACT_BLOCK_ROWS = 256
+
+# Tamanho máximo de um balde do LSH (baldes maiores são divididos)
+MAX_BUCKET_SIZE = 1024
+
+# Tamanho máximo (bytes) da cópia densa dos vetores; acima disso os produtos internos usam a matriz esparsa.
+# A matriz de avaliações é quase toda preenchida, e o produto denso (BLAS) é bem mais rápido que o esparso
+DENSE_MAX_BYTES = 512 << 20
+
+
+# Função para obter os vetores na forma mais rápida para os produtos internos (densa, se couber na memória)
+def as_vectors(normalized):
+    n_items, n_features = normalized.shape
+    if n_items * n_features * 8 <= DENSE_MAX_BYTES:
+        return normalized.toarray()
+    return normalized
+
+
+# Função para calcular o produto interno entre dois conjuntos de vetores (densos ou esparsos), em matriz densa
+def inner_products(left, right):
+    scores = left @ right.T
+    return scores.toarray() if sparse.issparse(scores) else np.asarray(scores)
+
+
+# Função para escolher, em cada linha de uma matriz densa de similaridades, as k maiores (positivas)
+def top_k_rows(scores, columns, k):
+    """
+    'scores' e 'columns' têm uma linha por item e os candidatos nas colunas (colunas = -1 são vazias).
+    Retorna (colunas, scores) com as k maiores similaridades positivas de cada linha, em ordem decrescente
+    (empates: menor índice primeiro); posições sem vizinho ficam com coluna -1.
+    """
+    scores = np.where((columns >= 0) & (scores > 0), scores, -np.inf)
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        columns = np.take_along_axis(columns, keep, axis=1)
+    order = np.lexsort((columns, -scores), axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    columns = np.where(np.isfinite(scores), np.take_along_axis(columns, order, axis=1), -1)
+    return columns, scores
+
+
+# Função para calcular os k vizinhos exatos de cada linha
+def exact_neighbors(normalized, k):
+    """
+    Compara cada linha com todas as outras, um bloco de linhas por vez (a memória usada é a de um bloco).
+    Retorna duas matrizes itens x k: índices dos vizinhos (-1 = vazio) e similaridades.
+    """
+    n_items = normalized.shape[0]
+    vectors = as_vectors(normalized)
+    neighbor_columns = np.full((n_items, k), -1, dtype=np.int64)
+    neighbor_scores = np.full((n_items, k), -np.inf)
+    for start in range(0, n_items, EXACT_BLOCK_ROWS):
+        rows = np.arange(start, min(start + EXACT_BLOCK_ROWS, n_items))
+        scores = inner_products(vectors[rows], vectors)
+        scores[np.arange(len(rows)), rows] = -np.inf # O próprio item não é vizinho
+        columns = np.broadcast_to(np.arange(n_items), scores.shape)
+        found_columns, found_scores = top_k_rows(scores, columns, k)
+        width = found_columns.shape[1]
+        neighbor_columns[rows, :width], neighbor_scores[rows, :width] = found_columns, found_scores
+    return neighbor_columns, neighbor_scores
+
+
+# Função para calcular os k vizinhos aproximados de cada linha (LSH por hiperplanos aleatórios)
+def approximate_neighbors(normalized, k, planes=LSH_PLANES, tables=LSH_TABLES, seed=LSH_SEED):
+    """
+    Cada tabela projeta os vetores em 'planes' hiperplanos aleatórios e usa os sinais como assinatura;
+    vetores com cosseno alto tendem a ter a mesma assinatura. Cada item é comparado apenas com os itens
+    do mesmo balde, e os melhores candidatos de todas as tabelas são combinados.
+    Retorna as mesmas matrizes de exact_neighbors.
+    """
+    rng = np.random.default_rng(seed)
+    n_items = normalized.shape[0]
+    vectors = as_vectors(normalized)
+    weights = 1 << np.arange(planes, dtype=np.int64)
+    neighbor_columns = np.full((n_items, k), -1, dtype=np.int64)
+    neighbor_scores = np.full((n_items, k), -np.inf)
+    for _ in range(tables):
+        projections = np.asarray(vectors @ rng.standard_normal((normalized.shape[1], planes)))
+        signatures = (projections > 0) @ weights
+        order = np.argsort(signatures, kind='stable')
+        boundaries = np.flatnonzero(np.diff(signatures[order])) + 1
+        for bucket in np.split(order, boundaries):
+            for part in range(0, len(bucket), MAX_BUCKET_SIZE):
+                items = bucket[part:part + MAX_BUCKET_SIZE]
+                if len(items) < 2:
+                    continue
+                bucket_vectors = vectors[items]
+                scores = inner_products(bucket_vectors, bucket_vectors)
+                np.fill_diagonal(scores, -np.inf)
+                columns = np.broadcast_to(items, scores.shape)
+                # Junta os candidatos do balde aos já encontrados; repetidos (de outras tabelas) contam uma vez
+                columns = np.concatenate([neighbor_columns[items], columns], axis=1)
+                scores = np.concatenate([neighbor_scores[items], scores], axis=1)
+                by_column = np.argsort(columns, axis=1, kind='stable')
+                sorted_columns = np.take_along_axis(columns, by_column, axis=1)
+                repeated = np.zeros(sorted_columns.shape, dtype=bool)
+                repeated[:, 1:] = sorted_columns[:, 1:] == sorted_columns[:, :-1]
+                scores = np.where(repeated, -np.inf, np.take_along_axis(scores, by_column, axis=1))
+                neighbor_columns[items], neighbor_scores[items] = top_k_rows(scores, sorted_columns, k)
+    return neighbor_columns, neighbor_scores
+
+
+class SimilarityIndex:
+    """
+    Vizinhos mais similares de cada item, pré-calculados e guardados em CSR
+    (para o item i: labels[indices[indptr[i]:indptr[i + 1]]], em ordem decrescente de similaridade).
+    'mean_ratings' guarda a avaliação média de cada item, para que a consulta não precise agrupar a tabela.
+    """
+
+    def __init__(self, labels, vectors, k=DEFAULT_NEIGHBORS, approximate=None, mean_ratings=None):
+        self.labels = list(labels)
+        self.mean_ratings = np.full(len(self.labels), np.nan) if mean_ratings is None else np.asarray(mean_ratings, dtype=float)
+        self.position = {label: i for i, label in enumerate(self.labels)}
+        self.approximate = len(self.labels) >= APPROXIMATE_MIN_ITEMS if approximate is None else approximate
+        normalized = normalized_rows(vectors)
+        find_neighbors = approximate_neighbors if self.approximate else exact_neighbors
+        columns, scores = find_neighbors(normalized, k)
+
+        # Matrizes itens x k (com posições vazias) -> CSR só com os vizinhos encontrados
+        found = columns >= 0
+        self.indptr = np.concatenate(([0], np.cumsum(found.sum(axis=1)))).astype(np.int64)
+        self.indices = columns[found]
+        self.scores = scores[found]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def neighbors(self, label, top_n=5):
+        """Retorna (rótulos, similaridades) dos 'top_n' itens mais similares a 'label' (listas vazias se desconhecido)."""
+        i = self.position.get(label)
+        if i is None:
+            return [], np.empty(0)
+        start = self.indptr[i]
+        end = min(self.indptr[i + 1], start + top_n)
+        return [self.labels[j] for j in self.indices[start:end]], self.scores[start:end]
+
+    def ratings_of(self, labels):
+        """Retorna a avaliação média de cada rótulo (NaN se desconhecido)."""
+        positions = [self.position.get(label, -1) for label in labels]
+        return np.array([self.mean_ratings[i] if i >= 0 else np.nan for i in positions])
+
+
+# Função para calcular a média de avaliação de cada valor de uma coluna da tabela agregada
+def mean_rating_by(aggregates, column):
+    grouped = aggregates.groupby(column, observed=True)[['soma_avaliacao', 'contagem']].sum()
+    return grouped['soma_avaliacao'] / grouped['contagem']
+
+
+# Função para construir os índices de similaridade de produtores e de produtos
+def build_similarity(aggregates, k=DEFAULT_NEIGHBORS, approximate=None):
+    """Retorna {'producers': SimilarityIndex, 'products': SimilarityIndex} a partir da tabela agregada de ofertas."""
+    if aggregates.empty:
+        empty = sparse.csr_matrix((0, 0))
+        return {'producers': SimilarityIndex([], empty, k), 'products': SimilarityIndex([], empty, k)}
+    producers, products, means = rating_matrix(aggregates)
+    return {
+        'producers': SimilarityIndex(producers, means, k, approximate,
+                                     mean_rating_by(aggregates, 'nome_produtor').reindex(producers)),
+        'products': SimilarityIndex(products, means.T.tocsr(), k, approximate,
+                                    mean_rating_by(aggregates, 'produto').reindex(products)),
+    }
@@ -0,0 +1,75 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from src.distance import EARTH_RADIUS_KM, distances_km
+
+# Índice espacial sobre as coordenadas das ofertas/produtores.
+# As coordenadas distintas são indexadas em uma BallTree (métrica haversine), construída uma vez na carga,
+# e cada coordenada guarda a lista ordenada de linhas que a utilizam.
+# Assim, consultas do tipo "produtores a até R km" descartam os pontos distantes antes do cálculo de score.
+
+# Folga aplicada ao raio da BallTree (esfera) antes do filtro exato no elipsoide
+RADIUS_MARGIN = 1.01
+
+# Coluna da tabela de ofertas com o id da coordenada distinta de cada linha (dicionário de coordenadas)
+COORD_ID_COLUMN = 'coord_id'
+
+
+class SpatialIndex:
+    """
+    Índice de coordenadas: coordenadas distintas, o id de coordenada de cada linha
+    e as linhas de cada coordenada no formato CSR (order[offsets[c]:offsets[c + 1]]).
+    Linhas sem coordenadas recebem id -1 e nunca são retornadas pelas consultas.
+    """
+
+    def __init__(self, latitudes, longitudes):
+        coordinates = np.column_stack([
+            np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float)
+        ]).reshape(-1, 2)
+        valid = ~np.isnan(coordinates).any(axis=1)
+
+        unique, first, inverse = np.unique(coordinates[valid], axis=0, return_index=True, return_inverse=True)
+        # Ids na ordem da primeira ocorrência: acrescentar linhas no final (ingestão) não muda os ids existentes
+        by_appearance = np.argsort(first, kind='stable')
+        rank = np.empty(len(unique), dtype=np.int64)
+        rank[by_appearance] = np.arange(len(unique))
+        self.coordinates = unique[by_appearance].reshape(-1, 2)
+        inverse = rank[inverse.ravel()]
+        self.coord_ids = np.full(len(coordinates), -1, dtype=np.int64)
+        self.coord_ids[valid] = inverse
+
+        # argsort estável mantém as linhas de cada coordenada em ordem crescente
+        self.order = np.argsort(self.coord_ids, kind='stable')
+        counts = np.bincount(inverse, minlength=len(self.coordinates))
+        self.offsets = np.concatenate(([0], np.cumsum(counts))) + np.count_nonzero(~valid)
+
+        self.tree = BallTree(np.radians(self.coordinates), metric='haversine') if len(self.coordinates) else None
+
+    @classmethod
+    def from_frame(cls, df):
+        """Constrói o índice a partir das colunas 'latitude' e 'longitude' de um DataFrame."""
+        if df.empty or 'latitude' not in df.columns or 'longitude' not in df.columns:
+            return cls([], [])
+        return cls(df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float))
+
+    def __len__(self):
+        """Número de coordenadas distintas."""
+        return len(self.coordinates)
+
+    def coordinates_within(self, latitude, longitude, max_distance_km):
+        """Retorna os ids (ordenados) das coordenadas a até 'max_distance_km' do ponto informado."""
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64)
+
+        # A BallTree trabalha na esfera; a folga evita perder pontos na borda antes do filtro exato
+        radius = max_distance_km * RADIUS_MARGIN / EARTH_RADIUS_KM
+        ids = self.tree.query_radius(np.radians([[latitude, longitude]]), r=radius)[0]
+        exact = distances_km(latitude, longitude, self.coordinates[ids, 0], self.coordinates[ids, 1])
+        return np.sort(ids[exact <= max_distance_km])
+
+    def rows_within(self, latitude, longitude, max_distance_km):
+        """Retorna as linhas (ordenadas) cujas coordenadas estão a até 'max_distance_km' do ponto informado."""
+        ids = self.coordinates_within(latitude, longitude, max_distance_km)
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in ids]))
@@ -0,0 +1,307 @@
+"""
+Tabelas materializadas de top-k por Região Administrativa.
+
+As escolhas do frontend são finitas: as RAs de 'locations.json', os produtores de 'producers_ra.json'
+e os produtos de 'products_list.json'. Uma etapa offline calcula, para cada RA (usando seu centroide
+como posição do usuário), cada combinação de filtros do formulário e cada preferência por orgânicos,
+o ranking top-k dos três tipos de recomendação e o grava em parquet (colunas categóricas).
+Em produção, uma consulta que se resolve para uma RA é respondida por uma busca em dicionário
+(chave -> fatia da tabela); consultas com coordenadas exatas ou filtros fora do domínio usam o motor.
+
+Uso (a partir da raiz do repositório):
+    python -m src.topk_tables build
+    python -m src.topk_tables build --top-k 20 --output-dir ./data/tables
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import src.recommender_engine as recommender
+from src.data_context import context
+
+# Diretório padrão das tabelas e quantidade de resultados materializados por chave
+DEFAULT_TABLES_DIR = './data/tables'
+TABLE_TOP_K = 10
+
+# Um arquivo por tipo de recomendação (as colunas do resultado variam entre os tipos)
+TABLE_FILES = {
+    'products': 'topk_products.parquet',
+    'producers': 'topk_producers.parquet',
+    'producer-products': 'topk_producer_products.parquet',
+}
+
+# Colunas de chave gravadas junto aos resultados
+KEY_COLUMNS = ['filtros', 'ra', 'organico_pref']
+
+# Tolerância (graus) para considerar que uma coordenada é o centroide de uma RA
+RA_COORDINATE_TOLERANCE = 1e-6
+
+# Preferências por orgânicos materializadas
+ORGANIC_PREFERENCES = (0, 1)
+
+# Quantidade de resultados quando a consulta não informa 'top_n' (mesmo padrão das funções recommend_*)
+DEFAULT_TOP_N = 5
+
+
+# Função para normalizar os filtros de uma consulta no formato das chaves das tabelas
+def table_filters_key(rec_type, filters):
+    """
+    Retorna a chave (texto) dos filtros normalizados, ou None se a combinação não é materializada
+    (ex.: mais de um produto, produtos indesejados, raio máximo, usuário identificado).
+    Valores vazios equivalem à ausência do filtro, como no motor.
+    """
+    if filters.get('user_id'):
+        return None # Rankings personalizados dependem do usuário e não são materializados
+    filters = {name: value for name, value in filters.items() if name not in recommender.RANKING_OPTIONS}
+    if rec_type == 'products':
+        desired = filters.get('desired_products') or []
+        if isinstance(desired, str):
+            desired = [desired]
+        if len(desired) > 1:
+            return None
+        normalized = {
+            'desired_products': list(desired),
+            'producer': filters.get('producer') or None,
+            'location': filters.get('location') or None,
+        }
+    elif rec_type == 'producers':
+        if filters.get('max_distance_km') is not None:
+            return None
+        product = filters.get('product_of_interest') or ''
+        normalized = {'product_of_interest': product if product.strip() else ''}
+    elif rec_type == 'producer-products':
+        if filters.get('unwanted_products') or not filters.get('producer_name'):
+            return None
+        normalized = {
+            'producer_name': filters['producer_name'],
+            'local_filter': filters.get('local_filter') or None,
+        }
+    else:
+        return None
+    return json.dumps(sorted(normalized.items()), ensure_ascii=False)
+
+
+# Função para enumerar as combinações de filtros oferecidas pelo formulário
+def enumerate_filters(products, producers_ra, ras):
+    """
+    Gera (tipo, filtros) para:
+    - 'products': nenhum ou um produto, com produtor (ou nenhum) e RA do produtor (ou nenhuma/qualquer RA sem produtor);
+    - 'producers': cada produto de interesse (ou todos);
+    - 'producer-products': cada produtor, em cada uma de suas RAs (ou em todas).
+    """
+    producer_locations = [(None, [None] + list(ras))]
+    producer_locations += [(producer, [None] + sorted(locations)) for producer, locations in producers_ra.items()]
+    for producer, locations in producer_locations:
+        for location in locations:
+            for desired in [[]] + [[product] for product in products]:
+                yield 'products', {'desired_products': desired, 'producer': producer, 'location': location}
+
+    for product in [''] + list(products):
+        yield 'producers', {'product_of_interest': product}
+
+    for producer, locations in producers_ra.items():
+        for local in [None] + sorted(locations):
+            yield 'producer-products', {'producer_name': producer, 'local_filter': local, 'unwanted_products': []}
+
+
+# Função para identificar o estado dos dados a partir do qual as tabelas foram calculadas
+def dataset_fingerprint(df_aggregates):
+    """Hash da tabela agregada de ofertas; tabelas com outro hash estão desatualizadas e são ignoradas."""
+    if df_aggregates.empty:
+        return '0'
+    hashed = pd.util.hash_pandas_object(df_aggregates.drop(columns=['coord_id'], errors='ignore'), index=False)
+    return format(int(hashed.to_numpy().sum(dtype=np.uint64)), 'x')
+
+
+# Função para calcular e gravar as tabelas de top-k
+def build_tables(output_dir=DEFAULT_TABLES_DIR, top_k=TABLE_TOP_K):
+    """
+    Calcula os rankings de todas as chaves (filtros x RA x preferência orgânica) com o motor em lote
+    e grava um parquet por tipo de recomendação. Retorna {tipo: número de chaves}.
+    """
+    if not recommender.ensure_data():
+        raise RuntimeError('Dataset de reviews não carregado; não é possível construir as tabelas.')
+
+    locations = context.locations
+    keys, queries = [], []
+    for rec_type, filters in enumerate_filters(context.products_list, context.producers_ra, sorted(locations)):
+        filters_key = table_filters_key(rec_type, filters)
+        for ra in sorted(locations):
+            latitude, longitude = locations[ra]
+            for organic in ORGANIC_PREFERENCES:
+                keys.append((rec_type, filters_key, ra, organic))
+                queries.append({
+                    'type': rec_type, 'filters': dict(filters, top_n=top_k),
+                    'latitude': latitude, 'longitude': longitude, 'organic': organic,
+                })
+
+    results = recommender.recommend_batch(queries)
+
+    os.makedirs(output_dir, exist_ok=True)
+    fingerprint = dataset_fingerprint(recommender.df_aggregates)
+    counts = {}
+    for rec_type, file_name in TABLE_FILES.items():
+        frames = []
+        for (key_type, filters_key, ra, organic), result in zip(keys, results):
+            # Chaves sem resultado ficam só em 'empty_keys': um DataFrame vazio (0x0) no concat
+            # converteria as colunas inteiras (ex.: 'organico') em float
+            if key_type != rec_type or result.empty or 'mensagem' in result.columns:
+                continue
+            frame = result.reset_index(drop=True)
+            frame.insert(0, 'filtros', filters_key)
+            frame.insert(1, 'ra', ra)
+            frame.insert(2, 'organico_pref', organic)
+            frames.append(frame)
+        counts[rec_type] = sum(1 for key in keys if key[0] == rec_type)
+
+        table = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=KEY_COLUMNS)
+        # Colunas numéricas mantêm o tipo do resultado do motor (ex.: 'organico' inteiro)
+        if frames:
+            engine_dtypes = {column: dtype for column, dtype in frames[0].dtypes.items() if isinstance(dtype, np.dtype)}
+            table = table.astype({column: dtype for column, dtype in engine_dtypes.items() if table[column].dtype != dtype})
+        # Colunas textuais repetidas viram categóricas (parquet com dicionário); a preferência cabe em int8
+        for column in table.columns:
+            if isinstance(table[column].dtype, pd.CategoricalDtype):
+                table[column] = table[column].cat.remove_unused_categories()
+            elif table[column].dtype == object or isinstance(table[column].dtype, pd.StringDtype):
+                table[column] = table[column].astype('category')
+        table['organico_pref'] = table['organico_pref'].astype(np.int8)
+
+        # Chaves sem nenhum resultado também são gravadas (lista vazia), para não cair no motor
+        present = set(zip(table['filtros'].astype(str), table['ra'].astype(str), table['organico_pref'].astype(int)))
+        empty_keys = [
+            [f, ra, organic] for t, f, ra, organic in keys if t == rec_type and (f, ra, organic) not in present
+        ]
+        metadata = {'fingerprint': fingerprint, 'top_k': top_k, 'empty_keys': empty_keys}
+        table.to_parquet(os.path.join(output_dir, file_name), index=False)
+        with open(os.path.join(output_dir, file_name + '.json'), 'w') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+    return counts
+
+
+class TopKTables:
+    """
+    Tabelas de top-k carregadas do disco: para cada tipo, o DataFrame de resultados (ordenado por chave e posição)
+    e o dicionário chave -> (início, fim) da fatia correspondente.
+    """
+
+    def __init__(self, tables_dir=DEFAULT_TABLES_DIR):
+        self.tables_dir = tables_dir
+        self.frames = {}
+        self.slices = {}
+        self.top_k = {}
+        self.fingerprints = {}
+        for rec_type, file_name in TABLE_FILES.items():
+            path = os.path.join(tables_dir, file_name)
+            if not os.path.exists(path) or not os.path.exists(path + '.json'):
+                continue
+            with open(path + '.json', 'r') as f:
+                metadata = json.load(f)
+            table = pd.read_parquet(path)
+            frame = table.drop(columns=KEY_COLUMNS)
+            # Categóricas voltam ao tipo original do resultado do motor
+            for column in frame.columns:
+                if isinstance(frame[column].dtype, pd.CategoricalDtype):
+                    frame[column] = frame[column].astype(object)
+
+            slices = {}
+            if len(table):
+                keys = list(zip(table['filtros'].astype(str), table['ra'].astype(str), table['organico_pref'].astype(int)))
+                # As linhas de cada chave são contíguas: basta registrar onde cada sequência começa e termina
+                starts = [0] + [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]]
+                for start, stop in zip(starts, starts[1:] + [len(keys)]):
+                    slices[keys[start]] = (start, stop)
+            for filters_key, ra, organic in metadata.get('empty_keys', []):
+                slices[(filters_key, ra, organic)] = (0, 0)
+
+            self.frames[rec_type] = frame
+            self.slices[rec_type] = slices
+            self.top_k[rec_type] = metadata['top_k']
+            self.fingerprints[rec_type] = metadata['fingerprint']
+
+    def __len__(self):
+        return sum(len(slices) for slices in self.slices.values())
+
+    def is_current(self, fingerprint):
+        """Indica se todas as tabelas carregadas foram calculadas a partir dos dados com este hash."""
+        return bool(self.fingerprints) and all(value == fingerprint for value in self.fingerprints.values())
+
+    def lookup(self, rec_type, filters, ra, organic_preference, top_n=None):
+        """
+        Retorna as linhas materializadas da consulta (DataFrame, no formato do resultado do motor), ou None
+        se a chave não estiver nas tabelas ou se 'top_n' exceder o k materializado.
+        """
+        top_n = DEFAULT_TOP_N if top_n is None else top_n
+        if rec_type not in self.slices or top_n > self.top_k[rec_type] or organic_preference not in ORGANIC_PREFERENCES:
+            return None
+        filters_key = table_filters_key(rec_type, filters)
+        if filters_key is None:
+            return None
+        bounds = self.slices[rec_type].get((filters_key, ra, organic_preference))
+        if bounds is None:
+            return None
+        start, stop = bounds
+        if start == stop:
+            # Mesmo formato do motor sem resultados: DataFrame vazio, sem colunas
+            return pd.DataFrame()
+        return self.frames[rec_type].iloc[start:min(stop, start + top_n)]
+
+
+# Função para carregar as tabelas do disco, descartando-as se não corresponderem aos dados do motor
+def load_current_tables(tables_dir=DEFAULT_TABLES_DIR):
+    """Retorna as tabelas de 'tables_dir', ou None se não existirem ou tiverem sido calculadas com outros dados."""
+    tables = TopKTables(tables_dir)
+    if not len(tables):
+        return None
+    if not recommender.ensure_data() or not tables.is_current(dataset_fingerprint(recommender.df_aggregates)):
+        print(f"Tabelas de top-k em '{tables_dir}' desatualizadas; as recomendações usarão o motor.")
+        return None
+    return tables
+
+
+# Função para obter as tabelas atuais (carregadas uma única vez e descartadas em context.reload())
+def current_tables(tables_dir=DEFAULT_TABLES_DIR):
+    return context.get_artifact('topk_tables', lambda: load_current_tables(tables_dir))
+
+
+# Reviews ingeridas mudam a tabela agregada: as tabelas são revalidadas (pelo hash) na próxima consulta
+recommender.reload_listeners.append(lambda: context.discard_artifact('topk_tables'))
+
+
+# Função para identificar a RA de uma posição (centroide) ou de um nome informado
+def resolve_ra(latitude, longitude, ra=None, locations=None):
+    """
+    Retorna (ra, latitude, longitude) do centroide quando 'ra' é uma RA conhecida ou quando a posição
+    coincide com um centroide; caso contrário, retorna None (coordenadas exatas usam o motor).
+    """
+    locations = context.locations if locations is None else locations
+    if ra in locations:
+        centroid_latitude, centroid_longitude = locations[ra]
+        return ra, centroid_latitude, centroid_longitude
+    for name, (centroid_latitude, centroid_longitude) in locations.items():
+        if abs(latitude - centroid_latitude) <= RA_COORDINATE_TOLERANCE and \
+           abs(longitude - centroid_longitude) <= RA_COORDINATE_TOLERANCE:
+            return name, centroid_latitude, centroid_longitude
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--output-dir', default=DEFAULT_TABLES_DIR)
+    parser.add_argument('--top-k', type=int, default=TABLE_TOP_K)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = build_tables(args.output_dir, args.top_k)
+    for rec_type, count in counts.items():
+        print(f"{rec_type}: {count} chaves")
+    print(f"Tabelas gravadas em '{args.output_dir}' em {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import pytest
+
+import app as webapp
+from src import recommender_engine as recommender
+
+
+@pytest.fixture(scope='session')
+def engine():
+    """Motor com o dataset de './data' carregado (uma vez por sessão de testes)."""
+    recommender.MEMORY_REPORT_ON_LOAD = False
+    assert recommender.ensure_data()
+    return recommender
+
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    """Cliente de teste do app, sem as tabelas materializadas e com o cache de resultados vazio."""
+    monkeypatch.setattr(webapp, 'TOPK_TABLES_ENABLED', False)
+    webapp.recommendation_cache.clear()
+    return webapp.app.test_client()
@@ -0,0 +1,83 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from src import basket
+from src.basket import MISSING_PENALTY, optimize_basket, solution_cost
+
+
+# Função para gerar um problema aleatório: custos das ofertas (inf = a parada não oferece) e das paradas
+def random_problem(seed, n_stops, n_products, coverage=0.4):
+    rng = np.random.default_rng(seed)
+    offer_costs = np.where(rng.random((n_stops, n_products)) < coverage, rng.random((n_stops, n_products)), np.inf)
+    stop_costs = basket.STOP_COST + basket.DISTANCE_WEIGHT * rng.random(n_stops) * 30
+    return offer_costs, stop_costs
+
+
+# Função com o custo ótimo por força bruta (todos os conjuntos de até 'max_stops' paradas)
+def brute_force_cost(offer_costs, stop_costs, max_stops=None, missing_penalty=MISSING_PENALTY):
+    n_stops = len(stop_costs)
+    max_stops = n_stops if max_stops is None else max_stops
+    return min(
+        solution_cost(list(chosen), offer_costs, stop_costs, missing_penalty)[0]
+        for size in range(max_stops + 1) for chosen in combinations(range(n_stops), size)
+    )
+
+
+@pytest.mark.parametrize('seed', range(12))
+def test_matches_brute_force(seed):
+    offer_costs, stop_costs = random_problem(seed, n_stops=8 + seed % 4, n_products=5 + seed % 3)
+    solution = optimize_basket(offer_costs, stop_costs, time_budget=10.0)
+    assert solution['optimal']
+    assert solution['cost'] == pytest.approx(brute_force_cost(offer_costs, stop_costs), abs=1e-9)
+    # O custo informado é o das paradas escolhidas
+    assert solution['cost'] == pytest.approx(solution_cost(solution['stops'], offer_costs, stop_costs, MISSING_PENALTY)[0])
+
+
+@pytest.mark.parametrize('max_stops', [1, 2])
+@pytest.mark.parametrize('seed', range(6))
+def test_respects_max_stops(seed, max_stops):
+    offer_costs, stop_costs = random_problem(100 + seed, n_stops=10, n_products=6)
+    solution = optimize_basket(offer_costs, stop_costs, max_stops=max_stops, time_budget=10.0)
+    assert len(solution['stops']) <= max_stops
+    assert solution['cost'] == pytest.approx(brute_force_cost(offer_costs, stop_costs, max_stops), abs=1e-9)
+
+
+def test_assignment_uses_the_cheapest_chosen_offer():
+    offer_costs, stop_costs = random_problem(7, n_stops=9, n_products=6)
+    solution = optimize_basket(offer_costs, stop_costs, time_budget=10.0)
+    for product, stop in enumerate(solution['assignment']):
+        best = offer_costs[solution['stops'], product].min()
+        if stop < 0:
+            assert not best < MISSING_PENALTY
+        else:
+            assert stop in solution['stops'] and offer_costs[stop, product] == best
+
+
+def test_exhausted_budget_returns_a_bounded_solution():
+    offer_costs, stop_costs = random_problem(11, n_stops=12, n_products=7)
+    optimum = brute_force_cost(offer_costs, stop_costs)
+    solution = optimize_basket(offer_costs, stop_costs, time_budget=0.0)
+    assert solution['lower_bound'] <= optimum + 1e-9 <= solution['cost'] + 1e-9
+    assert solution['cost'] == pytest.approx(solution_cost(solution['stops'], offer_costs, stop_costs, MISSING_PENALTY)[0])
+
+
+def test_products_nobody_offers_stay_uncovered():
+    offer_costs = np.array([[0.2, np.inf], [np.inf, np.inf]])
+    solution = optimize_basket(offer_costs, np.array([0.5, 0.5]))
+    assert solution['stops'] == [0]
+    assert solution['assignment'].tolist() == [0, -1]
+    assert solution['cost'] == pytest.approx(0.5 + 0.2 + MISSING_PENALTY)
+
+
+def test_basket_route_covers_the_list(client):
+    response = client.post('/recommend', json={
+        'type': 'basket', 'products': ['Uva', 'Alface', 'Mandioca'], 'max_stops': 2,
+        'organic': 0, 'latitude': -15.79, 'longitude': -47.88,
+    })
+    assert response.status_code == 200
+    rows = response.get_json()
+    assert rows and {row['produto'] for row in rows} <= {'Uva', 'Alface', 'Mandioca'}
+    assert len({row['produto'] for row in rows}) == len(rows) # Uma linha por produto coberto
+    assert sorted({row['parada'] for row in rows}) in ([1], [1, 2])
@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import app as webapp
+from src.cache import RecommendationCache
+from src.distance import distances_km
+
+# Duas posições na mesma célula da grade padrão (0.01°) do cache de resultados
+POSITION = (-15.7942, -47.8822)
+SAME_CELL_POSITION = (-15.7921, -47.8839)
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    cache = RecommendationCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1 # 'a' passa a ser a mais recente
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = RecommendationCache(ttl_seconds=0.02)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.03)
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 0)
+
+
+def test_quantize_snaps_to_the_grid():
+    cache = RecommendationCache(grid_size_deg=0.01)
+    assert cache.quantize(*POSITION) == cache.quantize(*SAME_CELL_POSITION) == (-15.79, -47.88)
+    assert cache.quantize(-15.7851, -47.88) == (-15.79, -47.88)
+    assert cache.quantize(-15.7849, -47.88) == (-15.78, -47.88)
+    assert RecommendationCache(grid_size_deg=0).quantize(*POSITION) == POSITION
+
+
+def test_put_with_stale_generation_is_dropped():
+    cache = RecommendationCache()
+    generation = cache.generation
+    cache.clear() # Ex.: reviews ingeridas durante o cálculo
+    assert cache.put('a', 'antigo', generation) is False
+    assert cache.get('a') is None
+    assert cache.put('a', 'novo', cache.generation) is True
+    assert cache.get('a') == 'novo'
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_cache_key_quantizes_only_the_key():
+    query = {'type': 'products', 'filters': {'desired_products': ['Uva']}, 'organic': 0, 'ra': None,
+             'latitude': POSITION[0], 'longitude': POSITION[1]}
+    other = dict(query, latitude=SAME_CELL_POSITION[0], longitude=SAME_CELL_POSITION[1])
+    assert webapp.recommendation_cache_key(query) == webapp.recommendation_cache_key(other)
+    assert (query['latitude'], query['longitude']) == POSITION
+
+
+# Função para pedir uma recomendação de produtores a partir de uma posição
+def recommend_producers(client, position):
+    response = client.post('/recommend', json={'type': 'producers', 'single_product': 'Uva',
+                                               'latitude': position[0], 'longitude': position[1], 'top_n': 20})
+    assert response.status_code == 200
+    return pd.DataFrame(response.get_json())
+
+
+def test_miss_is_computed_from_the_real_position(client, engine):
+    result = recommend_producers(client, POSITION)
+    expected = engine.recommend('producers', {'product_of_interest': 'Uva', 'max_distance_km': None, 'top_n': 20},
+                                *POSITION, 0)
+    assert len(result) == len(expected) > 1
+    assert result['nome_produtor'].tolist() == expected['nome_produtor'].astype(str).tolist()
+    assert result['distancia_km'].tolist() == expected['distancia_km'].tolist()
+
+
+def test_hit_in_the_same_cell_reports_distances_from_the_requester(client):
+    first = recommend_producers(client, POSITION)
+    hits = webapp.recommendation_cache.stats()['hits']
+    second = recommend_producers(client, SAME_CELL_POSITION)
+    assert webapp.recommendation_cache.stats()['hits'] == hits + 1
+    # Mesmo ranking da célula, distâncias a partir da posição de quem pediu
+    assert second[['nome_produtor', 'latitude', 'longitude']].equals(first[['nome_produtor', 'latitude', 'longitude']])
+    expected = np.round(distances_km(*SAME_CELL_POSITION, second['latitude'].to_numpy(), second['longitude'].to_numpy()), 2)
+    assert second['distancia_km'].tolist() == expected.tolist()
+    assert second['distancia_km'].tolist() != first['distancia_km'].tolist()
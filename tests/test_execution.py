@@ -0,0 +1,145 @@
+import threading
+import time
+
+import pytest
+
+import app as webapp
+from src import execution
+from src.execution import ComputePool
+
+
+# Função para aguardar uma condição (com limite de tempo, para o teste falhar em vez de travar)
+def wait_until(condition, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'condição não atingida no tempo limite'
+        time.sleep(0.005)
+
+
+# Função bloqueante: registra a chamada e só retorna quando 'gate' for liberado
+def gated(calls, gate, value):
+    calls.append(value)
+    assert gate.wait(10)
+    return value
+
+
+def test_identical_keys_share_one_computation():
+    pool = ComputePool(workers=2, max_queue=4)
+    calls, gate = [], threading.Event()
+    futures = [pool.submit('chave', gated, calls, gate, 'resultado') for _ in range(20)]
+    wait_until(lambda: calls)
+    gate.set()
+    assert {id(future) for future in futures} == {id(futures[0])}
+    assert [future.result(10) for future in futures] == ['resultado'] * 20
+    assert calls == ['resultado']
+    stats = pool.stats()
+    assert (stats['submitted'], stats['coalesced'], stats['completed']) == (1, 19, 1)
+
+
+def test_finished_keys_are_computed_again():
+    pool = ComputePool(workers=1, max_queue=4)
+    calls, gate = [], threading.Event()
+    gate.set()
+    assert pool.submit('chave', gated, calls, gate, 1).result(10) == 1
+    wait_until(lambda: not pool.stats()['inflight_keys'])
+    assert pool.submit('chave', gated, calls, gate, 2).result(10) == 2
+    assert calls == [1, 2]
+
+
+def test_distinct_and_unkeyed_requests_are_not_coalesced():
+    pool = ComputePool(workers=2, max_queue=8)
+    calls, gate = [], threading.Event()
+    gate.set()
+    futures = [pool.submit(key, gated, calls, gate, value)
+               for key, value in (('a', 1), ('b', 2), (None, 3), (None, 4))]
+    assert [future.result(10) for future in futures] == [1, 2, 3, 4]
+    assert sorted(calls) == [1, 2, 3, 4]
+
+
+def test_errors_reach_every_coalesced_request():
+    pool = ComputePool(workers=1, max_queue=4)
+    gate = threading.Event()
+
+    def failing():
+        assert gate.wait(10)
+        raise ValueError('falhou')
+
+    futures = [pool.submit('chave', failing) for _ in range(3)]
+    gate.set()
+    for future in futures:
+        with pytest.raises(ValueError, match='falhou'):
+            future.result(10)
+    assert pool.stats()['failed'] == 1
+
+
+def test_full_queue_rejects_new_computations():
+    pool = ComputePool(workers=1, max_queue=1)
+    calls, gate = [], threading.Event()
+    running = pool.submit('em andamento', gated, calls, gate, 1)
+    wait_until(lambda: calls) # A única thread de trabalho está ocupada
+    queued = pool.submit('na fila', gated, calls, gate, 2)
+    assert pool.submit('recusado', gated, calls, gate, 3) is None
+    # Pedidos idênticos a um cálculo na fila ainda são aceitos: não ocupam posições
+    assert pool.submit('na fila', gated, calls, gate, 2) is queued
+    gate.set()
+    assert (running.result(10), queued.result(10)) == (1, 2)
+    assert pool.stats()['rejected'] == 1
+
+
+def test_retry_after_is_bounded():
+    pool = ComputePool(workers=2, max_queue=4)
+    assert pool.retry_after() == execution.RETRY_AFTER_MIN_SECONDS # Sem histórico de duração
+    pool.average_seconds = 3.0
+    assert pool.retry_after() == 3 # (0 na fila + 2 em andamento) x 3 s / 2 threads
+    pool.average_seconds = 1000.0
+    assert pool.retry_after() == execution.RETRY_AFTER_MAX_SECONDS
+
+
+def test_recommend_answers_429_with_retry_after_when_the_queue_is_full(client, monkeypatch):
+    pool = ComputePool(workers=1, max_queue=1)
+    monkeypatch.setattr(webapp, 'compute_pool', pool)
+    pool.average_seconds = 4.0
+    calls, gate = [], threading.Event()
+    try:
+        pool.submit('ocupado', gated, calls, gate, 1)
+        wait_until(lambda: calls)
+        pool.submit('na fila', gated, calls, gate, 2)
+        response = client.post('/recommend', json={'type': 'producers', 'single_product': 'Uva'})
+        assert response.status_code == 429
+        assert 'error' in response.get_json()
+        retry_after = int(response.headers['Retry-After'])
+        assert execution.RETRY_AFTER_MIN_SECONDS <= retry_after <= execution.RETRY_AFTER_MAX_SECONDS
+    finally:
+        gate.set()
+
+
+def test_concurrent_identical_requests_compute_once(client, monkeypatch):
+    pool = ComputePool(workers=2, max_queue=4)
+    monkeypatch.setattr(webapp, 'compute_pool', pool)
+    calls, gate = [], threading.Event()
+    recommend = webapp.recommender.recommend
+
+    def gated_recommend(*args):
+        calls.append(args)
+        assert gate.wait(10)
+        return recommend(*args)
+
+    monkeypatch.setattr(webapp.recommender, 'recommend', gated_recommend)
+    payload = {'type': 'producers', 'single_product': 'Uva', 'latitude': -15.79, 'longitude': -47.88}
+    responses = []
+
+    def request():
+        responses.append(webapp.app.test_client().post('/recommend', json=payload))
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    try:
+        for thread in threads:
+            thread.start()
+        wait_until(lambda: pool.stats()['coalesced'] == 5)
+    finally:
+        gate.set()
+        for thread in threads:
+            thread.join(30)
+    assert len(calls) == 1
+    assert [response.status_code for response in responses] == [200] * 6
+    assert all(response.get_json() == responses[0].get_json() for response in responses)
@@ -0,0 +1,141 @@
+import ipaddress
+import time
+
+import pytest
+
+from src.cache import RecommendationCache
+from src.geolocation import (
+    FALLBACK_LATITUDE, FALLBACK_LONGITUDE, CircuitBreaker, Geolocator, IpRangeTable, OfflineResolver, StubResolver,
+)
+
+# Centroides usados pela tabela de faixas do teste
+LOCATIONS = {'Gama': [-16.0, -48.06], 'Guará': [-15.82, -47.97]}
+
+
+# Função para esperar uma condição das threads de segundo plano
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condição não atingida no prazo')
+        time.sleep(0.005)
+
+
+# Função para criar um cache de prefixos sem arredondamento
+def prefix_cache(ttl_seconds=3600):
+    return RecommendationCache(max_entries=1024, ttl_seconds=ttl_seconds, grid_size_deg=0)
+
+
+@pytest.fixture
+def ip_ranges(tmp_path):
+    # Duas faixas menores que um /24 dentro do mesmo prefixo e uma faixa IPv6
+    path = tmp_path / 'ip_ranges.csv'
+    path.write_text('rede,ra\n200.1.2.0/25,Gama\n200.1.2.128/25,Guará\n2804:10::/32,Guará\n')
+    return IpRangeTable.from_csv(str(path))
+
+
+def test_from_csv_reads_ranges(ip_ranges):
+    assert len(ip_ranges) == 3
+    assert ip_ranges.lookup(ipaddress.ip_address('200.1.2.10')) == 'Gama'
+    assert ip_ranges.lookup(ipaddress.ip_address('200.1.2.200')) == 'Guará'
+    assert ip_ranges.lookup(ipaddress.ip_address('2804:10::1')) == 'Guará'
+    assert ip_ranges.lookup(ipaddress.ip_address('200.1.3.1')) is None
+
+
+def test_from_csv_missing_file_is_empty(tmp_path):
+    assert len(IpRangeTable.from_csv(str(tmp_path / 'ausente.csv'))) == 0
+
+
+def test_offline_resolution(ip_ranges):
+    geolocator = Geolocator([OfflineResolver(lambda: ip_ranges, lambda: LOCATIONS)], cache=prefix_cache())
+    response = geolocator.locate('200.1.2.10')
+    assert response == {'latitude': -16.0, 'longitude': -48.06, 'ra': 'Gama', 'source': 'offline'}
+
+
+def test_sub_prefix_ranges_share_the_first_answer(ip_ranges):
+    # Comportamento documentado: faixas menores que o prefixo do cache (/24) compartilham a resposta
+    # do primeiro IP consultado no prefixo
+    geolocator = Geolocator([OfflineResolver(lambda: ip_ranges, lambda: LOCATIONS)], cache=prefix_cache())
+    assert geolocator.locate('200.1.2.10')['ra'] == 'Gama'
+    assert geolocator.locate('200.1.2.200')['ra'] == 'Gama'
+    geolocator.cache.clear()
+    assert geolocator.locate('200.1.2.200')['ra'] == 'Guará'
+
+
+def test_first_forwarded_address_is_used(ip_ranges):
+    geolocator = Geolocator([OfflineResolver(lambda: ip_ranges, lambda: LOCATIONS)], cache=prefix_cache())
+    assert geolocator.locate('200.1.2.200, 10.0.0.1')['ra'] == 'Guará'
+
+
+@pytest.mark.parametrize('forwarded_for', ['127.0.0.1', '10.1.2.3', '192.168.0.5', 'não-é-ip', '', None])
+def test_fallback_for_local_and_invalid_addresses(forwarded_for):
+    response = Geolocator([StubResolver()], cache=prefix_cache()).locate(forwarded_for)
+    assert (response['latitude'], response['longitude'], response['source']) == (FALLBACK_LATITUDE, FALLBACK_LONGITUDE, 'fallback')
+
+
+def test_fallback_when_not_found():
+    stub = StubResolver({'200.1.2.0/24': (-16.0, -48.06, 'Gama')})
+    response = Geolocator([stub], cache=prefix_cache()).locate('201.0.0.1')
+    assert response['source'] == 'fallback' and response['ra'] is None
+
+
+def test_prefix_cache_and_ttl():
+    stub = StubResolver({'200.1.2.0/24': (-16.0, -48.06, 'Gama')})
+    geolocator = Geolocator([stub], cache=prefix_cache(ttl_seconds=0.05))
+    assert geolocator.locate('200.1.2.10')['source'] == 'stub'
+    assert geolocator.locate('200.1.2.99')['ra'] == 'Gama'
+    assert stub.calls == 1 # Mesmo /24: resposta do cache
+    time.sleep(0.06)
+    geolocator.locate('200.1.2.10')
+    assert stub.calls == 2 # Entrada expirada: nova consulta
+
+
+def test_remote_result_answers_next_requests():
+    remote = StubResolver({'201.0.0.0/16': (-15.82, -47.97, 'Guará')}, delay=0.01)
+    geolocator = Geolocator([StubResolver()], remote=remote, cache=prefix_cache())
+    assert geolocator.locate('201.0.0.1')['source'] == 'fallback' # Não bloqueia pela consulta remota
+    wait_for(lambda: geolocator.stats()['remote_results']['success'] == 1)
+    assert geolocator.locate('201.0.0.2')['source'] == 'stub'
+
+
+def test_remote_timeout_keeps_fallback():
+    remote = StubResolver({'201.0.0.0/16': (-15.82, -47.97, 'Guará')}, delay=0.1)
+    geolocator = Geolocator([StubResolver()], remote=remote, cache=prefix_cache(), remote_timeout=0.02)
+    start = time.perf_counter()
+    assert geolocator.locate('201.0.0.1')['source'] == 'fallback'
+    assert time.perf_counter() - start < 0.05
+    wait_for(lambda: geolocator.stats()['remote_results']['timeout'] == 1)
+    assert geolocator.locate('201.0.0.1')['source'] == 'fallback' # A resposta atrasada é descartada
+
+
+def test_breaker_states():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == 'half-open'
+    assert breaker.allow()     # Uma única consulta de teste
+    assert not breaker.allow()
+    breaker.record_failure()   # Falha no teste: abre de novo
+    assert breaker.state == 'open'
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()   # Sucesso no teste: fecha
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_failing_remote_opens_breaker():
+    remote = StubResolver(fail=True)
+    geolocator = Geolocator([StubResolver()], remote=remote, cache=prefix_cache(),
+                            breaker=CircuitBreaker(failure_threshold=2, reset_seconds=60))
+    geolocator.locate('201.0.0.1')
+    wait_for(lambda: geolocator.stats()['remote_results']['failure'] == 1)
+    geolocator.locate('201.1.0.1')
+    wait_for(lambda: geolocator.stats()['remote_results']['failure'] == 2)
+    assert geolocator.stats()['breaker'] == 'open'
+    assert geolocator.locate('201.2.0.1')['source'] == 'fallback'
+    assert geolocator.stats()['remote_results']['rejected'] == 1
+    assert remote.calls == 2
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_context import context
+from src.personalization import UserFactorModel, load_user_model, normalized_rating
+from src.recommender_engine import calculate_score
+
+
+# Função para gerar reviews sintéticas (id_usuario, produto, nome_produtor, avaliacao)
+def synthetic_reviews(seed=0, rows=3000, users=200, products=12, producers=8):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id_usuario': rng.integers(0, users, rows).astype(str),
+        'produto': np.array([f'Produto {i}' for i in range(products)])[rng.integers(0, products, rows)],
+        'nome_produtor': np.array([f'Produtor {i}' for i in range(producers)])[rng.integers(0, producers, rows)],
+        'avaliacao': rng.integers(1, 6, rows),
+    })
+
+
+# Função com a afinidade calculada item a item (busca da posição de cada par em um dicionário)
+def reference_affinity(model, user_id, products, producers):
+    user = model.user_index(user_id)
+    predicted = model.predict(user)[0]
+    item_position = {item: i for i, item in enumerate(zip(model.item_products, model.item_producers))}
+    fallback = model.global_mean + model.user_bias[user]
+    values = [predicted[item_position[item]] if item in item_position else fallback
+              for item in zip(map(str, products), map(str, producers))]
+    return normalized_rating(values)
+
+
+@pytest.fixture(scope='module')
+def model():
+    return UserFactorModel.train(synthetic_reviews(), factors=4, iterations=3)
+
+
+# Itens consultados: todos os do treino, pares fora do treino e produto/produtor desconhecidos
+def query_items(model):
+    products = list(model.item_products) + ['Produto 0', 'Inexistente', 'Produto 1']
+    producers = list(model.item_producers) + ['Inexistente', 'Produtor 0', 'Produtor 99']
+    order = np.random.default_rng(1).permutation(len(products))
+    return np.array(products)[order], np.array(producers)[order]
+
+
+def test_affinity_matches_per_item_lookup(model):
+    products, producers = query_items(model)
+    for user_id in model.users[:20]:
+        expected = reference_affinity(model, user_id, products, producers)
+        assert model.affinity(user_id, products, producers).tolist() == expected.tolist()
+
+
+def test_categorical_columns_give_the_same_affinity(model):
+    products, producers = query_items(model)
+    user_id = model.users[0]
+    # Categorias em outra ordem e com valores sem uso, como nas colunas do motor
+    categorical_products = pd.Series(pd.Categorical(products, categories=sorted(set(products)) + ['Sem uso']))
+    categorical_producers = pd.Series(pd.Categorical(producers, categories=sorted(set(producers), reverse=True)))
+    expected = model.affinity(user_id, products, producers)
+    assert model.affinity(user_id, categorical_products, categorical_producers).tolist() == expected.tolist()
+    assert (model.producer_affinity(user_id, categorical_producers).tolist()
+            == model.producer_affinity(user_id, producers).tolist())
+
+
+def test_missing_categorical_values_use_the_fallback(model):
+    user_id = model.users[0]
+    products = pd.Series(pd.Categorical([model.item_products[0], None]))
+    producers = pd.Series(pd.Categorical([model.item_producers[0], model.item_producers[0]]))
+    affinity = model.affinity(user_id, products, producers)
+    fallback = normalized_rating(model.global_mean + model.user_bias[model.user_index(user_id)])
+    assert affinity[1] == fallback
+    assert affinity[0] == model.affinity(user_id, model.item_products[:1], model.item_producers[:1])[0]
+
+
+def test_unknown_user_has_no_affinity(model):
+    assert model.affinity('usuario-inexistente', ['Produto 0'], ['Produtor 0']) is None
+    assert model.producer_affinity(None, ['Produtor 0']) is None
+
+
+def test_saved_model_gives_the_same_predictions(model, tmp_path):
+    path = tmp_path / 'user_factors.npz'
+    with open(path, 'wb') as f:
+        model.save(f)
+    loaded = load_user_model(str(path))
+    products, producers = query_items(model)
+    user_id = model.users[3]
+    assert loaded.affinity(user_id, products, producers).tolist() == model.affinity(user_id, products, producers).tolist()
+    assert load_user_model(str(tmp_path / 'inexistente.npz')) is None
+
+
+def test_personalized_scores_match_calculate_score(engine):
+    model = UserFactorModel.train(
+        context.reviews[['id_usuario', 'produto', 'nome_produtor', 'avaliacao']], factors=4, iterations=2
+    )
+    user_id = model.users[0]
+    context.discard_artifact('user_factors')
+    context.get_artifact('user_factors', lambda: model)
+    try:
+        # Com um local (sem produtor nem local, a seleção original não retorna candidatos)
+        candidates = engine.prepare_best_products(['Uva', 'Alface', 'Mandioca'], None, context.reviews['local'].iloc[0])
+        candidates = engine.normalize_distance(candidates, -15.79, -47.88)
+        features = candidates[['avaliacao_norm', 'proximidade', 'organico']].to_numpy(dtype=float)
+        scores = engine.personalize_scores(candidates, engine.score_candidates(candidates, 0, 1), user_id)
+        affinity = reference_affinity(model, user_id, candidates['produto'], candidates['nome_produtor'])
+        expected = [calculate_score(0, 1, list(row), affinity=value) for row, value in zip(features, affinity)]
+        assert len(expected) and scores.tolist() == expected
+    finally:
+        context.discard_artifact('user_factors')
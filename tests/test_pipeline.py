@@ -0,0 +1,74 @@
+import importlib
+import sys
+
+import pytest
+
+from src.pipeline.runner import Build, Stage, run_stages, stage_order
+from src.pipeline.stages import STAGES
+
+
+@pytest.fixture
+def dependency(tmp_path, monkeypatch):
+    """Módulo temporário usado por uma etapa; o teste reescreve o seu código."""
+    path = tmp_path / 'pipeline_dependency.py'
+    path.write_text('FACTOR = 2\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module('pipeline_dependency')
+    yield module
+    sys.modules.pop('pipeline_dependency', None)
+
+
+# Função para criar a etapa de teste: 'saida.txt' é 'entrada.txt' multiplicado por FACTOR do módulo dependente
+def doubling_stage(module, calls):
+    def run(build):
+        calls.append(1)
+        value = int(open(build.path('entrada.txt')).read())
+        with open(build.path('saida.txt'), 'w') as f:
+            f.write(str(value * module.FACTOR))
+    return Stage('dobro', run, inputs=['entrada.txt'], outputs=['saida.txt'], modules=[module])
+
+
+def test_stage_reruns_when_a_declared_module_changes(tmp_path, dependency):
+    (tmp_path / 'entrada.txt').write_text('21')
+    calls = []
+    stage = doubling_stage(dependency, calls)
+    assert run_stages(Build(str(tmp_path)), [stage], log=lambda message: None) == {'dobro': 'executada'}
+    assert run_stages(Build(str(tmp_path)), [stage], log=lambda message: None) == {'dobro': 'atualizada'}
+
+    # Mudança só no código do módulo de que a etapa depende (entradas e parâmetros iguais)
+    (tmp_path / 'pipeline_dependency.py').write_text('FACTOR = 30\n') # Tamanho diferente: o .pyc antigo não é reaproveitado
+    importlib.reload(dependency)
+    assert run_stages(Build(str(tmp_path)), [stage], log=lambda message: None) == {'dobro': 'executada'}
+    assert (tmp_path / 'saida.txt').read_text() == '630' and len(calls) == 2
+
+
+def test_stage_reruns_when_an_input_or_output_changes(tmp_path, dependency):
+    (tmp_path / 'entrada.txt').write_text('1')
+    calls = []
+    stage = doubling_stage(dependency, calls)
+    run_stages(Build(str(tmp_path)), [stage], log=lambda message: None)
+    (tmp_path / 'entrada.txt').write_text('5')
+    assert run_stages(Build(str(tmp_path)), [stage], log=lambda message: None) == {'dobro': 'executada'}
+    (tmp_path / 'saida.txt').write_text('editado à mão')
+    assert run_stages(Build(str(tmp_path)), [stage], log=lambda message: None) == {'dobro': 'executada'}
+    assert (tmp_path / 'saida.txt').read_text() == '10'
+
+
+def test_missing_input_is_an_error(tmp_path, dependency):
+    with pytest.raises(FileNotFoundError):
+        run_stages(Build(str(tmp_path)), [doubling_stage(dependency, [])], log=lambda message: None)
+
+
+def test_stage_modules_are_part_of_the_key():
+    by_name = {stage.name: stage for stage in STAGES}
+    assert 'src.personalization' in {module.__name__ for module in by_name['user_factors'].modules}
+    assert 'src.review_store' in {module.__name__ for module in by_name['resources'].modules}
+    assert 'src.pipeline.geocoding' in {module.__name__ for module in by_name['locations'].modules}
+    assert all(stage.modules[0].__name__ == 'src.pipeline.stages' for stage in STAGES)
+
+
+def test_stage_order_follows_inputs():
+    order = [stage.name for stage in stage_order(STAGES, selected=['resources'])]
+    assert order.index('full_reviews') < order.index('resources')
+    assert order.index('producers_formatted') < order.index('resources')
+    assert 'user_factors' not in order
@@ -0,0 +1,114 @@
+import gzip
+import json
+import math
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import response_encoding
+from src.response_encoding import encode_columnar, encode_records, encode_rows, gzip_body, gzip_chunks, ndjson_chunks
+
+
+# Função com a referência: o que to_dict(orient='records') produz, com ausentes e não finitos como None
+def reference_records(frame):
+    def builtin(value):
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is None or value is pd.NA or (isinstance(value, float) and not math.isfinite(value)):
+            return None
+        return value
+    return [{str(name): builtin(value) for name, value in row.items()} for row in frame.to_dict(orient='records')]
+
+
+# Função para montar um resultado com todos os tipos de coluna que o encoder trata
+def mixed_frame(rows=40, seed=0):
+    rng = np.random.default_rng(seed)
+    floats = rng.random(rows) * 100
+    floats[::7] = np.nan
+    floats[3] = np.inf
+    texts = np.array(['Uva', 'Maçã "fuji"', 'a,b', '50%', 'linha\nnova', None], dtype=object)[rng.integers(0, 6, rows)]
+    return pd.DataFrame({
+        'produto': pd.Categorical(texts, categories=['Uva', 'Maçã "fuji"', 'a,b', '50%', 'linha\nnova', 'Sem uso']),
+        'nome_produtor': texts,
+        'score': floats,
+        'parada': rng.integers(-3, 1000, rows),
+        'organico': rng.random(rows) < 0.5,
+        'media%s': pd.array(np.where(rng.random(rows) < 0.2, None, rng.integers(0, 5, rows)), dtype='Int64'),
+        'int8': rng.integers(0, 5, rows).astype(np.int8),
+        'float32': (rng.random(rows) * 10).astype(np.float32),
+    })
+
+
+def test_records_match_to_dict():
+    frame = mixed_frame()
+    assert json.loads(encode_records(frame)) == reference_records(frame)
+
+
+def test_engine_results_match_to_dict(engine):
+    frames = [
+        engine.recommend('producers', {'product_of_interest': 'Uva'}, -15.79, -47.88, 0),
+        engine.recommend('basket', {'desired_products': ['Uva', 'Alface']}, -15.79, -47.88, 1),
+    ]
+    for frame in frames:
+        assert not frame.empty
+        assert json.loads(encode_records(frame)) == reference_records(frame)
+
+
+def test_columnar_matches_the_records():
+    frame = mixed_frame(seed=1)
+    columnar = json.loads(encode_columnar(frame))
+    assert columnar['length'] == len(frame)
+    assert list(columnar['columns']) == list(frame.columns)
+    rows = [dict(zip(columnar['columns'], values)) for values in zip(*columnar['columns'].values())]
+    assert rows == reference_records(frame)
+
+
+def test_non_finite_values_become_null():
+    frame = pd.DataFrame({'x': [1.5, np.nan, np.inf, -np.inf]})
+    assert encode_records(frame) == '[{"x":1.5},{"x":null},{"x":null},{"x":null}]'
+    assert encode_columnar(frame) == '{"length":4,"columns":{"x":[1.5,null,null,null]}}'
+
+
+def test_empty_results():
+    assert encode_records(None) == '[]'
+    assert encode_records(pd.DataFrame()) == '[]'
+    assert json.loads(encode_columnar(None)) == {'length': 0, 'columns': {}}
+    assert json.loads(encode_columnar(pd.DataFrame({'x': pd.Series([], dtype=float)}))) == {'length': 0, 'columns': {'x': []}}
+
+
+@pytest.mark.parametrize('chunk_lines', [1, 7, 256])
+def test_ndjson_chunks_hold_one_record_per_line(chunk_lines):
+    frame = mixed_frame(rows=50, seed=2)
+    chunks = list(ndjson_chunks(encode_rows(frame), chunk_lines=chunk_lines))
+    assert len(chunks) == -(-len(frame) // chunk_lines)
+    assert all(chunk.endswith(b'\n') for chunk in chunks)
+    lines = b''.join(chunks).decode().splitlines()
+    assert [json.loads(line) for line in lines] == reference_records(frame)
+
+
+def test_gzip_roundtrip():
+    body = encode_records(mixed_frame(rows=200, seed=3)).encode()
+    assert gzip.decompress(gzip_body(body)) == body
+
+    chunks = list(ndjson_chunks(encode_rows(mixed_frame(rows=200, seed=4)), chunk_lines=16))
+    compressed = list(gzip_chunks(chunks))
+    assert gzip.decompress(b''.join(compressed)) == b''.join(chunks)
+    # Cada bloco já recebido pode ser descomprimido antes do fim do fluxo
+    partial = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(compressed[0])
+    assert partial == chunks[0]
+
+
+def test_recommend_route_formats(client):
+    payload = {'type': 'producers', 'single_product': 'Uva', 'latitude': -15.79, 'longitude': -47.88, 'top_n': 50}
+    records = client.post('/recommend', json=payload).get_json()
+    columnar = client.post('/recommend', json={**payload, 'format': 'columnar'}).get_json()
+    assert columnar['length'] == len(records)
+    assert [dict(zip(columnar['columns'], values)) for values in zip(*columnar['columns'].values())] == records
+
+    response = client.post('/recommend', json=payload,
+                           headers={'Accept': response_encoding.NDJSON_MIMETYPE, 'Accept-Encoding': 'gzip'})
+    assert response.mimetype == response_encoding.NDJSON_MIMETYPE
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert [json.loads(line) for line in gzip.decompress(response.get_data()).splitlines()] == records
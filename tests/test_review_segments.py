@@ -0,0 +1,147 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+from src.aggregates import build_aggregate_table, merge_aggregate_tables
+from src.ingestion import prepare_batch
+from src.review_segments import (
+    CODE_COLUMNS, base_through, claim_name, claim_sequence, claimed_sequences, compact, is_abandoned_claim,
+    list_segments, merge_reviews, read_segment, write_segment,
+)
+from src.review_store import prepare_reviews
+
+# Parquet de reviews do repositório: as primeiras linhas formam o base e o restante, os lotes ingeridos
+REVIEWS_PATH = './data/datasets/df_full_reviews.parquet'
+BASE_ROWS = 6000
+BATCH_ROWS = 500
+
+# Raiz do repositório (o processo filho importa 'src' a partir dela)
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def reviews():
+    return pd.read_parquet(REVIEWS_PATH)
+
+
+@pytest.fixture
+def storage(tmp_path, reviews):
+    """(caminho do parquet base, diretório de segmentos, lotes ainda não gravados)."""
+    base_path = str(tmp_path / 'df_full_reviews.parquet')
+    reviews.iloc[:BASE_ROWS].to_parquet(base_path, index=False)
+    # Lotes no formato da ingestão: sem as colunas de códigos
+    rest = reviews.iloc[BASE_ROWS:].drop(columns=list(CODE_COLUMNS.values()))
+    batches = [rest.iloc[start:start + BATCH_ROWS] for start in range(0, len(rest), BATCH_ROWS)]
+    return base_path, str(tmp_path / 'segments'), batches
+
+
+# Função para comparar tabelas agregadas pelos valores (categorias e tipos compactos à parte)
+def comparable(aggregates):
+    return aggregates.astype(object).reset_index(drop=True)
+
+
+# Função para simular um processo que reserva um número de segmento e para antes de gravá-lo
+def crash_after_claim(segments_dir):
+    code = f'import os; from src.review_segments import claim_sequence; claim_sequence({segments_dir!r}); os._exit(1)'
+    subprocess.run([sys.executable, '-c', code], cwd=REPOSITORY_DIR, check=False)
+
+
+def test_segments_are_numbered_in_order(storage):
+    base_path, segments_dir, batches = storage
+    sequences = [write_segment(segments_dir, batch, after=base_through(base_path)) for batch in batches[:3]]
+    assert sequences == [1, 2, 3]
+    assert [sequence for sequence, _ in list_segments(segments_dir)] == [1, 2, 3]
+    assert list_segments(segments_dir, after=2)[0][0] == 3
+    assert claimed_sequences(segments_dir) == [] # Nenhuma reserva fica para trás
+    assert read_segment(list_segments(segments_dir)[0][1]).equals(batches[0].reset_index(drop=True))
+
+
+def test_compaction_equals_a_full_rebuild(storage, reviews):
+    base_path, segments_dir, batches = storage
+    for batch in batches:
+        write_segment(segments_dir, batch, after=base_through(base_path))
+    assert compact(base_path, segments_dir) == len(batches)
+    assert base_through(base_path) == len(batches)
+    assert list_segments(segments_dir) == []
+
+    compacted = pd.read_parquet(base_path)
+    rebuilt = merge_reviews([reviews.iloc[:BASE_ROWS]] + batches)
+    pd.testing.assert_frame_equal(compacted, rebuilt)
+    # Os valores são os do dataset completo, e os códigos do base são mantidos
+    values = [column for column in reviews.columns if column not in CODE_COLUMNS.values()]
+    pd.testing.assert_frame_equal(compacted[values], reviews[values])
+    assert compacted['produto_id'].iloc[:BASE_ROWS].equals(reviews['produto_id'].iloc[:BASE_ROWS])
+    assert compacted.groupby('produto')['produto_id'].nunique().eq(1).all()
+
+
+def test_running_aggregates_equal_a_full_rebuild(storage, reviews):
+    _, _, batches = storage
+    aggregates = build_aggregate_table(prepare_reviews(reviews.iloc[:BASE_ROWS]))
+    for batch in batches:
+        aggregates = merge_aggregate_tables(aggregates, build_aggregate_table(prepare_reviews(batch)))
+    pd.testing.assert_frame_equal(comparable(aggregates), comparable(build_aggregate_table(prepare_reviews(reviews))))
+
+
+def test_compaction_stops_at_an_active_claim(storage):
+    base_path, segments_dir, batches = storage
+    write_segment(segments_dir, batches[0])
+    claim_sequence(segments_dir) # Este processo ainda está gravando o segmento 2
+    write_segment(segments_dir, batches[1])
+    assert compact(base_path, segments_dir) == 1
+    assert base_through(base_path) == 1
+    assert [sequence for sequence, _ in list_segments(segments_dir, after=1)] == [3]
+    assert claimed_sequences(segments_dir) == [2]
+
+
+def test_claim_of_a_crashed_writer_does_not_block_compaction(storage):
+    base_path, segments_dir, batches = storage
+    write_segment(segments_dir, batches[0])
+    crash_after_claim(segments_dir)
+    assert claimed_sequences(segments_dir) == [2]
+    write_segment(segments_dir, batches[1])
+    assert compact(base_path, segments_dir) == 2
+    assert base_through(base_path) == 3
+    assert claimed_sequences(segments_dir) == [] and list_segments(segments_dir) == []
+
+
+def test_old_claims_are_abandoned(tmp_path):
+    claim_path = tmp_path / claim_name(1)
+    claim_path.write_text('outro-host 1') # Processo de outro host: só a idade decide
+    assert not is_abandoned_claim(str(claim_path))
+    old = time.time() - 3600
+    os.utime(claim_path, (old, old))
+    assert is_abandoned_claim(str(claim_path), max_age_seconds=600)
+    own = tmp_path / claim_name(2)
+    own.write_text(f'{socket.gethostname()} {os.getpid()}')
+    assert not is_abandoned_claim(str(own))
+    assert not is_abandoned_claim(str(tmp_path / claim_name(3))) # Segmento já gravado: reserva removida
+
+
+def test_failed_write_releases_the_claim(tmp_path):
+    segments_dir = str(tmp_path / 'segments')
+    with pytest.raises(Exception):
+        write_segment(segments_dir, pd.DataFrame({'avaliacao': [1, 'a']})) # Coluna sem tipo parquet
+    assert claimed_sequences(segments_dir) == [] and list_segments(segments_dir) == []
+    assert os.listdir(segments_dir) == []
+
+
+def test_prepare_batch_rejects_invalid_reviews(reviews):
+    producers = pd.read_parquet('./data/datasets/producers.parquet')
+    offer = reviews.iloc[0]
+    valid = {'id_usuario': 'u1', 'produto': offer['produto'], 'organico': int(offer['organico']),
+             'nome_produtor': offer['nome_produtor'], 'local': offer['local'], 'avaliacao': 5}
+    records = [
+        valid,
+        dict(valid, avaliacao=6),               # Fora de 1 a 5
+        dict(valid, organico=2),                # Orgânico diferente de 0/1
+        dict(valid, nome_produtor='Ninguém'),   # Sem oferta no catálogo
+        {key: value for key, value in valid.items() if key != 'avaliacao'},  # Campo obrigatório ausente
+    ]
+    batch, rejected = prepare_batch(records, producers=producers)
+    assert (len(batch), rejected) == (1, 4)
+    assert {'latitude', 'longitude'} <= set(batch.columns)
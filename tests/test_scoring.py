@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from src.recommender_engine import calculate_score
+from src.scoring import WEIGHT_PROFILES, get_weights, register_weight_profile, score_features
+
+# Tipos de recomendação e preferências por orgânicos cobertos pelas regras originais de calculate_score
+RECOMMENDATION_TYPES = (0, 1, 2)
+ORGANIC_PREFERENCES = (0, 1)
+
+# Tipos com perfil registrado em src.scoring (inclui o tipo 3, "Cesta", sem regra original)
+REGISTERED_TYPES = RECOMMENDATION_TYPES + (3,)
+
+
+# Função com as regras de pesos de calculate_score antes do registro de perfis (um if por tipo)
+def original_score(recommendation_type, is_organic_preference, feature_values):
+    if recommendation_type in (0, 2):
+        if is_organic_preference == 1:
+            return 0.3 * feature_values[0] + 0.5 * feature_values[1] + 0.2 * feature_values[2]
+        return 0.5 * feature_values[0] + 0.5 * feature_values[1] + -1.0 * feature_values[2]
+    if recommendation_type == 1:
+        return 0.7 * feature_values[0] + 0.3 * feature_values[1]
+    return 0.0
+
+
+# Função para gerar uma matriz de features aleatória: [avaliação (0 a 1), proximidade (0 a 1), orgânico (0 ou 1)]
+def random_features(seed, rows=2000):
+    rng = np.random.default_rng(seed)
+    features = rng.random((rows, 3))
+    features[:, 2] = rng.integers(0, 2, rows)
+    # Valores repetidos e extremos, onde aparecem os empates
+    features[:10] = [[1.0, 1.0, 1], [0.0, 0.0, 0], [0.8, 0.2, 1], [0.8, 0.2, 1], [0.2, 0.8, 0],
+                     [0.6, 0.6, 1], [0.6, 0.6, 0], [1.0, 0.0, 1], [0.0, 1.0, 0], [0.5, 0.5, 1]]
+    return features
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('organic_preference', ORGANIC_PREFERENCES)
+@pytest.mark.parametrize('recommendation_type', REGISTERED_TYPES)
+def test_vectorized_scores_match_calculate_score(recommendation_type, organic_preference, seed):
+    features = random_features(seed)
+    scores = score_features(features, recommendation_type, organic_preference)
+    expected = [calculate_score(recommendation_type, organic_preference, list(row)) for row in features]
+    # Igualdade exata: a ordem dos empates no ranking depende dos scores bit a bit
+    assert all(score == reference for score, reference in zip(scores.tolist(), expected))
+
+
+@pytest.mark.parametrize('organic_preference', ORGANIC_PREFERENCES)
+@pytest.mark.parametrize('recommendation_type', RECOMMENDATION_TYPES)
+def test_default_profiles_keep_the_original_rules(recommendation_type, organic_preference):
+    features = random_features(seed=3)
+    scores = score_features(features, recommendation_type, organic_preference)
+    expected = [original_score(recommendation_type, organic_preference, list(row)) for row in features]
+    assert all(score == reference for score, reference in zip(scores.tolist(), expected))
+
+
+@pytest.mark.parametrize('organic_preference', ORGANIC_PREFERENCES)
+def test_basket_profile_ignores_proximity(organic_preference):
+    # Na cesta, a distância entra pelo custo das paradas (src.basket), não pela qualidade da oferta
+    features = random_features(seed=6, rows=200)
+    moved = features.copy()
+    moved[:, 1] = 1 - moved[:, 1]
+    assert score_features(features, 3, organic_preference).tolist() == score_features(moved, 3, organic_preference).tolist()
+    assert get_weights(3, 1).tolist() == [0.8, 0.0, 0.2]
+    assert get_weights(3, 0).tolist() == [1.0, 0.0, -1.0]
+
+
+def test_unknown_type_scores_zero():
+    features = random_features(seed=4, rows=10)
+    assert not score_features(features, 99, 1).any()
+    assert all(calculate_score(99, 1, list(row)) == 0.0 for row in features)
+
+
+def test_registered_profile_is_used_by_both_scorers(monkeypatch):
+    monkeypatch.setattr('src.scoring.WEIGHT_PROFILES', dict(WEIGHT_PROFILES))
+    register_weight_profile(7, rating=0.25, proximity=0.75)
+    register_weight_profile(7, rating=0.1, proximity=0.1, organic=0.8, organic_preference=1)
+    assert get_weights(7, 0).tolist() == [0.25, 0.75, 0.0] # Perfil padrão do tipo
+    assert get_weights(7, 1).tolist() == [0.1, 0.1, 0.8]
+    features = random_features(seed=5, rows=50)
+    for organic_preference in ORGANIC_PREFERENCES:
+        scores = score_features(features, 7, organic_preference)
+        assert scores.tolist() == [calculate_score(7, organic_preference, list(row)) for row in features]
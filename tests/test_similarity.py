@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src import similarity
+from src.data_context import context
+from src.similarity import SimilarityIndex, build_similarity, rating_matrix
+
+
+# Função para gerar uma matriz itens x colunas de avaliações (1 a 5) com fatores latentes e posições vazias
+def random_ratings(n_items, n_columns=40, density=0.7, seed=0):
+    rng = np.random.default_rng(seed)
+    ratings = np.clip(3 + rng.standard_normal((n_items, 4)) @ rng.standard_normal((4, n_columns)) / 2, 1, 5)
+    return sparse.csr_matrix(np.where(rng.random((n_items, n_columns)) < density, ratings, 0))
+
+
+# Função de referência: k vizinhos pelo cosseno ajustado, comparando todos os pares
+def brute_force_neighbors(matrix, k):
+    dense = matrix.toarray()
+    rated = dense != 0
+    means = dense.sum(axis=1) / np.maximum(rated.sum(axis=1), 1)
+    centred = np.where(rated, dense - means[:, None], 0)
+    norms = np.linalg.norm(centred, axis=1)
+    centred = centred / np.where(norms > 0, norms, 1)[:, None]
+    scores = centred @ centred.T
+    np.fill_diagonal(scores, -np.inf)
+    neighbors = []
+    for row in scores:
+        order = [j for j in np.argsort(-row, kind='stable') if row[j] > 0][:k]
+        neighbors.append((order, row[order]))
+    return neighbors
+
+
+def test_exact_neighbors_match_brute_force():
+    matrix = random_ratings(300)
+    labels = [f'item{i}' for i in range(300)]
+    index = SimilarityIndex(labels, matrix, k=10, approximate=False)
+    for i, (expected, expected_scores) in enumerate(brute_force_neighbors(matrix, 10)):
+        neighbors, scores = index.neighbors(labels[i], top_n=10)
+        assert neighbors == [labels[j] for j in expected]
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-9)
+
+
+def test_approximate_neighbors_recall():
+    matrix = random_ratings(2000, seed=1)
+    labels = list(range(2000))
+    exact = SimilarityIndex(labels, matrix, k=10, approximate=False)
+    approximate = SimilarityIndex(labels, matrix, k=10, approximate=True)
+    found = sum(len(set(exact.neighbors(label, 10)[0]) & set(approximate.neighbors(label, 10)[0])) for label in labels)
+    total = sum(len(exact.neighbors(label, 10)[0]) for label in labels)
+    assert found / total > 0.8
+    # As similaridades encontradas são as exatas, em ordem decrescente
+    neighbors, scores = approximate.neighbors(0, 10)
+    assert list(scores) == sorted(scores, reverse=True)
+    exact_scores = dict(zip(*exact.neighbors(0, len(labels))))
+    assert all(abs(exact_scores.get(label, score) - score) < 1e-9 for label, score in zip(neighbors, scores))
+
+
+def test_neighbors_lookup():
+    index = SimilarityIndex(['a', 'b', 'c'], sparse.csr_matrix([[5, 1, 3], [4, 1, 3], [1, 5, 2]]), k=2,
+                            mean_ratings=[3.0, 2.7, 2.6])
+    neighbors, scores = index.neighbors('a', top_n=1)
+    assert neighbors == ['b'] and len(scores) == 1
+    assert 'a' not in index.neighbors('a')[0]
+    neighbors, scores = index.neighbors('desconhecido')
+    assert neighbors == [] and len(scores) == 0
+    assert np.isnan(index.ratings_of(['c', 'x'])).tolist() == [False, True]
+
+
+def test_rating_matrix_means_per_pair():
+    aggregates = pd.DataFrame({
+        'nome_produtor': ['P1', 'P1', 'P2', 'P1'], 'produto': ['Uva', 'Coco', 'Uva', 'Uva'],
+        'soma_avaliacao': [8, 3, 5, 4], 'contagem': [2, 1, 1, 2],
+    })
+    producers, products, means = rating_matrix(aggregates)
+    assert (producers, products) == (['P1', 'P2'], ['Coco', 'Uva'])
+    assert means.toarray().tolist() == [[3.0, 3.0], [0.0, 5.0]] # (8 + 4) / (2 + 2) para P1 x Uva
+
+
+def test_build_similarity_on_engine_aggregates(engine):
+    indexes = build_similarity(engine.df_aggregates)
+    producers = engine.df_aggregates['nome_produtor'].astype(str).unique()
+    assert len(indexes['producers']) == len(producers)
+    assert len(indexes['products']) == engine.df_aggregates['produto'].nunique()
+    empty = build_similarity(engine.df_aggregates.iloc[0:0])
+    assert len(empty['producers']) == len(empty['products']) == 0
+
+
+def test_similar_producers_route(client):
+    producer = sorted(context.producers_ra)[0]
+    response = client.post('/recommend', json={'type': 'similar-producers', 'producer': producer, 'top_n': 3})
+    assert response.status_code == 200
+    result = pd.DataFrame(response.get_json())
+    assert 0 < len(result) <= 3 and producer not in result['nome_produtor'].tolist()
+    assert result['similaridade'].tolist() == sorted(result['similaridade'], reverse=True)
+
+
+def test_review_batch_rebuilds_the_index_in_the_background(engine, monkeypatch):
+    stale = engine.current_similarity()
+    built = []
+    original_build = similarity.build_similarity
+
+    def slow_build(aggregates, *args, **kwargs):
+        time.sleep(0.2)
+        built.append(aggregates)
+        return original_build(aggregates, *args, **kwargs)
+
+    monkeypatch.setattr(engine, 'build_similarity', slow_build)
+    try:
+        assert engine.apply_review_batch(engine.df_full_reviews.iloc[:5])
+        # A consulta seguinte não espera a reconstrução: o índice anterior continua respondendo
+        start = time.perf_counter()
+        assert engine.current_similarity() is stale
+        assert time.perf_counter() - start < 0.1
+        deadline = time.monotonic() + 10
+        while engine.similarity_rebuilding and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not engine.similarity_rebuilding
+        assert engine.current_similarity() is not stale
+        assert built[-1] is engine.df_aggregates
+    finally:
+        monkeypatch.undo()
+        context.reload() # Restaura o estado do motor a partir do disco
@@ -0,0 +1,148 @@
+import itertools
+import threading
+
+import pandas as pd
+import pytest
+
+from src import response_encoding, topk_tables
+from src.data_context import context
+
+# Combinações de filtros de cada tipo materializadas no teste (a enumeração completa leva minutos)
+FILTERS_PER_TYPE = 4
+
+# Produto sem ofertas: todas as suas chaves ficam sem resultado
+MISSING_PRODUCT = 'Produto inexistente'
+
+# Enumeração completa (o fixture das tabelas a substitui pela amostra)
+ALL_FILTERS = topk_tables.enumerate_filters
+
+
+# Função para enumerar uma amostra das combinações do formulário, com uma chave sem resultados
+def sample_filters(products, producers_ra, ras):
+    by_type = {}
+    for rec_type, filters in ALL_FILTERS(products, producers_ra, ras):
+        by_type.setdefault(rec_type, []).append(filters)
+    sample = [(rec_type, filters) for rec_type, options in by_type.items() for filters in options[:FILTERS_PER_TYPE]]
+    return sample + [('producers', {'product_of_interest': MISSING_PRODUCT})]
+
+
+@pytest.fixture(scope='module')
+def tables_dir(engine, tmp_path_factory):
+    output_dir = str(tmp_path_factory.mktemp('tables'))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(topk_tables, 'enumerate_filters', sample_filters)
+        topk_tables.build_tables(output_dir, top_k=10)
+    return output_dir
+
+
+@pytest.fixture
+def tables(tables_dir):
+    return topk_tables.load_current_tables(tables_dir)
+
+
+# Função para listar as chaves materializadas: (tipo, filtros, ra, orgânico)
+def materialized_keys():
+    locations = context.locations
+    filters = sample_filters(context.products_list, context.producers_ra, sorted(locations))
+    return [(rec_type, query_filters, ra, organic)
+            for (rec_type, query_filters), ra, organic in itertools.product(filters, sorted(locations), (0, 1))]
+
+
+def test_lookups_match_the_engine(engine, tables):
+    assert tables is not None
+    locations = context.locations
+    compared = 0
+    for rec_type, filters, ra, organic in materialized_keys():
+        for top_n in (5, 10):
+            result = tables.lookup(rec_type, filters, ra, organic, top_n)
+            expected = engine.recommend(rec_type, dict(filters, top_n=top_n), *locations[ra], organic)
+            # Mesma resposta de '/recommend' nos dois formatos
+            for response_format in response_encoding.RESPONSE_FORMATS:
+                assert response_encoding.encode_frame(result, response_format) == \
+                    response_encoding.encode_frame(expected, response_format), (rec_type, filters, ra, organic)
+            compared += 1
+    assert compared == len(materialized_keys()) * 2
+
+
+def test_keys_without_results_are_empty_frames(tables):
+    ra = sorted(context.locations)[0]
+    result = tables.lookup('producers', {'product_of_interest': MISSING_PRODUCT}, ra, 0)
+    assert isinstance(result, pd.DataFrame) and result.shape == (0, 0)
+
+
+def test_engine_dtypes_are_kept(engine, tables):
+    ra = sorted(context.locations)[0]
+    result = tables.lookup('producers', {'product_of_interest': ''}, ra, 1)
+    expected = engine.recommend('producers', {'product_of_interest': ''}, *context.locations[ra], 1)
+    numeric = {column: dtype for column, dtype in expected.dtypes.items() if dtype.kind in 'biuf'}
+    assert {column: result[column].dtype for column in numeric} == numeric
+
+
+@pytest.mark.parametrize('rec_type, filters, organic, top_n', [
+    ('producers', {'product_of_interest': ''}, 0, 11),                          # Acima do k materializado
+    ('producers', {'product_of_interest': '', 'user_id': '7'}, 0, None),        # Ranking personalizado
+    ('producers', {'product_of_interest': '', 'max_distance_km': 5.0}, 0, None),  # Raio máximo
+    ('producers', {'product_of_interest': 'Uva'}, 2, None),                      # Preferência desconhecida
+    ('basket', {'desired_products': ['Uva']}, 0, None),                          # Tipo não materializado
+])
+def test_queries_outside_the_tables_use_the_engine(tables, rec_type, filters, organic, top_n):
+    assert tables.lookup(rec_type, filters, sorted(context.locations)[0], organic, top_n) is None
+
+
+def test_tables_from_other_data_are_ignored(tables_dir, monkeypatch, tmp_path):
+    monkeypatch.setattr(topk_tables, 'dataset_fingerprint', lambda df_aggregates: 'outro')
+    assert topk_tables.load_current_tables(tables_dir) is None
+    assert topk_tables.load_current_tables(str(tmp_path)) is None # Sem tabelas
+
+
+def test_resolve_ra_by_name_and_centroid():
+    name = sorted(context.locations)[0]
+    latitude, longitude = context.locations[name]
+    assert topk_tables.resolve_ra(0.0, 0.0, name) == (name, latitude, longitude)
+    assert topk_tables.resolve_ra(latitude, longitude) == (name, latitude, longitude)
+    assert topk_tables.resolve_ra(latitude + 0.001, longitude) is None
+
+
+def test_current_tables_concurrent_with_review_batch(engine, tables_dir, monkeypatch):
+    # Cenário do deadlock: o carregamento das tabelas chega ao motor (ensure_data -> load_lock) enquanto um lote
+    # segura load_lock e descarta artefatos do contexto
+    batch_holds_lock = threading.Event()
+    loader_started = threading.Event()
+
+    def hold_load_lock():
+        engine.last_segment_poll = float('-inf') # ensure_data do carregamento precisa de load_lock
+        batch_holds_lock.set()
+        loader_started.wait(timeout=5)
+
+    class TrackedTables(topk_tables.TopKTables):
+        def __init__(self, *args, **kwargs):
+            loader_started.set()
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(engine, 'reload_listeners', [hold_load_lock] + engine.reload_listeners)
+    monkeypatch.setattr(topk_tables, 'TopKTables', TrackedTables)
+    context.discard_artifact('topk_tables')
+    results = {}
+
+    def apply_batch():
+        results['applied'] = engine.apply_review_batch(engine.df_full_reviews.iloc[:5])
+
+    def lookup_tables():
+        batch_holds_lock.wait(timeout=5)
+        results['tables'] = topk_tables.current_tables(tables_dir)
+
+    threads = [threading.Thread(target=apply_batch, daemon=True), threading.Thread(target=lookup_tables, daemon=True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    # Travadas, as threads seguram os locks do contexto e do motor: o estado não pode ser restaurado
+    assert not any(thread.is_alive() for thread in threads), 'current_tables e apply_review_batch travaram'
+    try:
+        assert results['applied'] is True
+        # O lote mudou a tabela agregada: as tabelas calculadas antes dele não são mais válidas
+        assert topk_tables.current_tables(tables_dir) is None
+    finally:
+        monkeypatch.undo()
+        context.discard_artifact('topk_tables')
+        context.reload() # Restaura o estado do motor a partir do disco